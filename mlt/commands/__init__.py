@@ -18,15 +18,40 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+from importlib import import_module
+
 from mlt.commands.base import Command  # noqa
-from mlt.commands.build import BuildCommand  # noqa
-from mlt.commands.config import TemplateConfigCommand  # noqa
-from mlt.commands.deploy import DeployCommand  # noqa
-from mlt.commands.init import InitCommand  # noqa
-from mlt.commands.status import StatusCommand  # noqa
-from mlt.commands.sync import SyncCommand  # noqa
-from mlt.commands.templates import TemplatesCommand  # noqa
-from mlt.commands.update_template import UpdateTemplateCommand  # noqa
-from mlt.commands.undeploy import UndeployCommand  # noqa
-from mlt.commands.logs import LogsCommand  # noqa
-from mlt.commands.events import EventsCommand  # noqa
+
+# Command classes are only imported once they are needed, that way a short
+# command like `mlt status` doesn't pay for importing the dependencies
+# (watchdog, progressbar, jsonschema, ...) of every other command.
+COMMAND_MODULES = {
+    'BuildCommand': 'mlt.commands.build',
+    'TemplateConfigCommand': 'mlt.commands.config',
+    'DeployCommand': 'mlt.commands.deploy',
+    'InitCommand': 'mlt.commands.init',
+    'StatusCommand': 'mlt.commands.status',
+    'SyncCommand': 'mlt.commands.sync',
+    'TemplatesCommand': 'mlt.commands.templates',
+    'UpdateTemplateCommand': 'mlt.commands.update_template',
+    'UndeployCommand': 'mlt.commands.undeploy',
+    'LogsCommand': 'mlt.commands.logs',
+    'EventsCommand': 'mlt.commands.events',
+}
+
+
+def load_command(class_name):
+    """imports the module of the command class `class_name` and returns
+       the class itself
+    """
+    return getattr(import_module(COMMAND_MODULES[class_name]), class_name)
+
+
+def __getattr__(name):
+    """keeps `from mlt.commands import BuildCommand` working (python 3.7+)
+       without importing every command up front
+    """
+    if name in COMMAND_MODULES:
+        return load_command(name)
+    raise AttributeError("module {} has no attribute {}".format(
+        __name__, name))
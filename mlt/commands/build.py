@@ -17,23 +17,41 @@
 #
 # SPDX-License-Identifier: EPL-2.0
 #
-import json
 import sys
 import time
 import uuid
+from multiprocessing.pool import ThreadPool
+from subprocess import STDOUT
+from tabulate import tabulate
 from termcolor import colored
 from watchdog.observers import Observer
 
+try:
+    from shlex import quote
+except ImportError:  # python 2
+    from pipes import quote
+
 from mlt.commands import Command
 from mlt.event_handler import EventHandler
-from mlt.utils import (config_helpers, files, progress_bar,
-                       process_helpers, schema)
+from mlt.utils import (config_helpers, context_helpers, docker_helpers,
+                       files, progress_bar, process_helpers, schema, state,
+                       tracing)
+
+# megabytes of build context above which `mlt build` warns, unless the
+# project's `context_size_warning` config sets another limit
+CONTEXT_SIZE_WARNING = 100
 
 
 class BuildCommand(Command):
+    # `os.setsid` to start builds in a process group of their own, so that
+    # `cancel` stops `make` and everything it started
+    preexec_fn = None
+
     def __init__(self, args):
         super(BuildCommand, self).__init__(args)
         self.config = config_helpers.load_config()
+        self.build_processes = []
+        self.cancelled = False
 
     def action(self):
         """creates docker images
@@ -41,55 +59,379 @@ class BuildCommand(Command):
         """
         self._watch_and_build() if self.args['--watch'] else self._build()
 
+    @tracing.traced('build')
     def _build(self):
-        last_build_duration = files.fetch_action_arg(
-            'build', 'last_build_duration')
+        self.cancelled = False
+        self.build_processes = []
+        build_duration = progress_bar.estimate_duration(
+            files.fetch_action_arg_history(
+                'build', 'last_build_duration', progress_bar.HISTORY_SIZE))
 
         schema.validate()
+        context_size = self._check_context()
+
+        variants = config_helpers.get_build_variants(self.config)
+        if variants:
+            self._build_variants(variants, build_duration, context_size)
+            return
 
         started_build_time = time.time()
 
-        container_name = "{}:{}".format(self.config['name'], uuid.uuid4())
+        build_args = self._build_args()
+        build_data = {'context_size': context_size}
+        container_name, context_hash = self._container_name(build_args)
+        cache_tag = self._cache_tag()
+        if cache_tag:
+            build_data['cache_tag'] = cache_tag
+        if context_hash:
+            build_data['context_hash'] = context_hash
+            if docker_helpers.image_exists(container_name):
+                build_data['last_container'] = container_name
+                state.get_store().record_action('build', build_data)
+                print("{} is up to date, skipping build".format(
+                    container_name))
+                return
+        if cache_tag:
+            build_data['cache_from'] = self._pull_cache(
+                cache_tag, files.fetch_action_arg(
+                    'push', 'last_remote_container'))
+            if build_data['cache_from']:
+                build_args['CACHE_FROM'] = build_data['cache_from']
         print("Starting build {}".format(container_name))
 
-        template_parameters = config_helpers.\
-            get_template_parameters(self.config)
-        build_cmd = "CONTAINER_NAME={} GPUS={} make build".format(
-            container_name, template_parameters.get('gpus', 0))
+        build_cmd = self._build_cmd(container_name, build_args)
 
+        output = docker_helpers.BuildOutput()
         if self.args['--verbose']:
-            build_process = process_helpers.run_popen(build_cmd,
-                                                      shell=True,
-                                                      stdout=True,
-                                                      stderr=True)
+            build_process = process_helpers.run_popen(
+                build_cmd, shell=True, stdout=True, stderr=True,
+                preexec_fn=self.preexec_fn)
+            self.build_processes.append(build_process)
+            build_process.wait()
         else:
-            build_process = process_helpers.run_popen(build_cmd,
-                                                      shell=True)
-            with process_helpers.prevent_deadlock(build_process):
+            # one pipe for both, so BuildKit's progress on stderr is read
+            # with the rest of the output and can't fill up a pipe of its own
+            build_process = process_helpers.run_popen(
+                build_cmd, shell=True, stderr=STDOUT,
+                preexec_fn=self.preexec_fn)
+            self.build_processes.append(build_process)
+            with process_helpers.prevent_deadlock(
+                    build_process, output) as exited:
                 progress_bar.duration_progress(
                     'Building {}'.format(
-                        self.config["name"]), last_build_duration,
-                    lambda: build_process.poll() is not None)
+                        self.config["name"]), build_duration,
+                    lambda: build_process.poll() is not None, exited.wait)
+        if self.cancelled:
+            print("Build {} cancelled".format(container_name))
+            sys.exit(1)
         if build_process.poll() != 0:
-            # When we have an error, get the stdout and error output
-            # and display them both with the error output in red.
-            output, error_msg = build_process.communicate()
-            if output:
-                print(output.decode("utf-8"))
-            if error_msg:
-                print(colored(error_msg.decode("utf-8"), 'red'))
-                sys.exit(1)
+            # When we have an error, get the last of the output and the
+            # error output and display them both with the error output in red.
+            # Quiet builds have their errors in the output.
+            recent_output = output.text()
+            stdout, error_msg = build_process.communicate()
+            for out in (recent_output, stdout):
+                if out:
+                    print(out.decode("utf-8"))
+            print(colored((error_msg or "Build {} failed".format(
+                container_name).encode("utf-8")).decode("utf-8"), 'red'))
+            sys.exit(1)
 
         built_time = time.time()
 
-        # Write last container to file
-        with open('.build.json', 'w') as f:
-            f.write(json.dumps({
-                "last_container": container_name,
-                "last_build_duration": built_time - started_build_time
-            }))
+        # Record last container in the project state
+        build_data.update({
+            "last_container": container_name,
+            "last_build_duration": built_time - started_build_time
+        })
+        output.finished = built_time
+        self._record_steps(output, build_data)
+        report = self._layer_cache_report(output, build_data) \
+            if cache_tag else []
+        history = files.fetch_action_arg_history(
+            'build', 'steps', progress_bar.HISTORY_SIZE)
+        state.get_store().record_action('build', build_data)
 
         print("Built {}".format(container_name))
+        self._print_layer_cache_report(container_name, report)
+        if self.args.get('--profile'):
+            self._print_profile(container_name, build_data.get('steps'),
+                                history)
+
+    def _build_variants(self, variants, build_duration, context_size):
+        """builds every variant the template declares, `--parallel` of them
+           at a time, and records each one's image. The top level
+           `last_container` is the variant that's deployed.
+        """
+        started_build_time = time.time()
+        build_data = {'variants': {}, 'context_size': context_size}
+        builds = []
+        reports = []
+        for variant in sorted(variants):
+            build_args = self._build_args(variants[variant])
+            container_name, context_hash = self._container_name(
+                build_args, variant)
+            variant_data = build_data['variants'][variant] = {
+                'last_container': container_name}
+            cache_tag = self._cache_tag(variant)
+            if cache_tag:
+                variant_data['cache_tag'] = cache_tag
+            if context_hash:
+                variant_data['context_hash'] = context_hash
+                if docker_helpers.image_exists(container_name):
+                    print("{} is up to date, skipping build".format(
+                        container_name))
+                    continue
+            builds.append((variant, container_name, build_args, cache_tag))
+
+        if builds:
+            parallel = int(self.args.get('--parallel') or 2)
+            pool = ThreadPool(max(1, min(parallel, len(builds))))
+            try:
+                results = pool.map_async(self._build_variant, builds)
+                if self.args['--verbose']:
+                    results.wait()
+                else:
+                    progress_bar.duration_progress(
+                        'Building {} ({} variants)'.format(
+                            self.config["name"], len(builds)),
+                        build_duration, results.ready, results.wait)
+                results = results.get()
+            finally:
+                pool.terminate()
+
+            if self.cancelled:
+                print("Build {} cancelled".format(self.config["name"]))
+                sys.exit(1)
+            failed = False
+            for variant, output, error_msg, cache_from in results:
+                variant_data = build_data['variants'][variant]
+                if error_msg:
+                    if output.text():
+                        print(output.text().decode("utf-8"))
+                    print(colored(error_msg.decode("utf-8"), 'red'))
+                    failed = True
+                    continue
+                self._record_steps(output, variant_data)
+                if 'cache_tag' in variant_data:
+                    variant_data['cache_from'] = cache_from
+                    reports.append((variant_data['last_container'],
+                                    self._layer_cache_report(
+                                        output, variant_data)))
+            if failed:
+                sys.exit(1)
+            build_data['last_build_duration'] = \
+                time.time() - started_build_time
+
+        selected = build_data['variants'][
+            config_helpers.get_build_variant(self.config)]
+        build_data.update(selected)
+        history = files.fetch_action_arg_history(
+            'build', 'variants', progress_bar.HISTORY_SIZE)
+        state.get_store().record_action('build', build_data)
+
+        for variant, container_name, _, _ in builds:
+            print("Built {}".format(container_name))
+        for container_name, report in reports:
+            self._print_layer_cache_report(container_name, report)
+        if self.args.get('--profile'):
+            for variant, container_name, _, _ in builds:
+                self._print_profile(
+                    container_name,
+                    build_data['variants'][variant].get('steps'),
+                    [old.get(variant, {}).get('steps') for old in history])
+
+    @tracing.traced('context check')
+    def _check_context(self):
+        """keeps the .dockerignore mlt maintains up to date, and tells how
+           big the build context is when it's over the limit or `--verbose`
+           is given. Returns its size in bytes.
+        """
+        if context_helpers.update_dockerignore():
+            print("Updated {} to leave out what git and mlt ignore".format(
+                context_helpers.DOCKERIGNORE))
+        size, largest = context_helpers.context_size()
+        limit = self.config.get('context_size_warning', CONTEXT_SIZE_WARNING)
+        too_big = size > float(limit) * 1024 * 1024
+        if too_big or self.args['--verbose']:
+            message = "Build context is {}".format(
+                context_helpers.format_size(size))
+            if largest:
+                message += ", the largest parts are {}".format(", ".join(
+                    "{} ({})".format(path, context_helpers.format_size(part))
+                    for path, part in largest))
+            if too_big:
+                message += ". Add what the image doesn't need to {}".format(
+                    context_helpers.DOCKERIGNORE)
+            print(colored(message, 'yellow') if too_big else message)
+        return size
+
+    def _build_variant(self, build):
+        """runs `make build` for one variant. Returns the output of failed
+           builds instead of exiting, so that it can run on a pool thread.
+        """
+        variant, container_name, build_args, cache_tag = build
+        output = docker_helpers.BuildOutput()
+        if self.cancelled:
+            return variant, output, None, None
+        cache_from = None
+        if cache_tag:
+            cache_from = self._pull_cache(cache_tag)
+            if cache_from:
+                build_args = dict(build_args, CACHE_FROM=cache_from)
+        print("Starting build {}".format(container_name))
+        build_cmd = self._build_cmd(container_name, build_args)
+        if self.args['--verbose']:
+            build_process = process_helpers.run_popen(
+                build_cmd, shell=True, stdout=True, stderr=True,
+                preexec_fn=self.preexec_fn)
+            self.build_processes.append(build_process)
+            build_process.wait()
+        else:
+            # one pipe for both, so BuildKit's progress on stderr is read
+            # with the rest of the output and can't fill up a pipe of its own
+            build_process = process_helpers.run_popen(
+                build_cmd, shell=True, stderr=STDOUT,
+                preexec_fn=self.preexec_fn)
+            self.build_processes.append(build_process)
+            with process_helpers.prevent_deadlock(build_process, output):
+                pass
+        output.finished = time.time()
+        if build_process.poll() == 0 or self.cancelled:
+            return variant, output, None, cache_from
+        _, error_msg = build_process.communicate()
+        return variant, output, error_msg or "Build {} failed".format(
+            container_name).encode("utf-8"), cache_from
+
+    def _cache_tag(self, variant=None):
+        """with `--remote-cache`, the tag in the registry that the image of
+           the last push is kept under as layer cache for the next builds
+        """
+        if not self.args.get('--remote-cache'):
+            return None
+        if not self.config.get('registry'):
+            print("`--remote-cache` needs a registry, set one with "
+                  "`mlt template_config set registry <registry>`")
+            sys.exit(1)
+        return "{}/{}:cache{}".format(
+            self.config['registry'], self.config['name'],
+            '-' + variant if variant else '')
+
+    @staticmethod
+    def _pull_cache(cache_tag, last_pushed=None):
+        """pulls the cache tag, or else the image that was pushed last, to
+           build from its layers. Returns the one pulled, if any.
+        """
+        for image in filter(None, (cache_tag, last_pushed)):
+            if docker_helpers.pull(image):
+                print("Using the layers of {} as cache".format(image))
+                return image
+        print("There's no layer cache in the registry yet")
+        return None
+
+    @staticmethod
+    def _layer_cache_report(output, build_data):
+        """which steps of the build the layer cache had, from its output.
+           The number of layers and cached ones are added to `build_data`,
+           unless the output went to the terminal.
+        """
+        report = output.layer_cache_report()
+        if report:
+            build_data['layers'] = len(report)
+            build_data['cached_layers'] = len(
+                [cached for _, cached in report if cached])
+        return report
+
+    @staticmethod
+    def _print_layer_cache_report(container_name, report):
+        if not report:
+            return
+        print("Layer cache of {}: {} of {} steps cached".format(
+            container_name, len([cached for _, cached in report if cached]),
+            len(report)))
+        for instruction, cached in report:
+            print("  {:6}  {}".format('cached' if cached else 'built',
+                                      instruction[:72]))
+
+    @staticmethod
+    def _record_steps(output, build_data):
+        """adds how long each step of the build took to `build_data`"""
+        steps = output.step_durations()
+        if steps:
+            build_data['steps'] = [[instruction, round(seconds, 3)]
+                                   for instruction, seconds in steps]
+
+    @staticmethod
+    def _step_keys(steps):
+        """(instruction, occurrence) of `steps`, so the same instruction
+           twice in a Dockerfile are told apart
+        """
+        seen = {}
+        for instruction, _ in steps:
+            seen[instruction] = seen.get(instruction, 0) + 1
+            yield instruction, seen[instruction]
+
+    def _print_profile(self, container_name, steps, history):
+        """compares how long each step of the build took to the median of
+           the earlier builds in `history`, newest first
+        """
+        if not steps:
+            print("No step timings for {}, they're only measured without "
+                  "--verbose".format(container_name))
+            return
+        earlier = [dict(zip(self._step_keys(old), (s for _, s in old)))
+                   for old in history if old]
+        rows = []
+        keys = self._step_keys(steps)
+        for key, (instruction, seconds) in zip(keys, steps):
+            median = progress_bar.estimate_duration(
+                [old.get(key) for old in earlier])
+            rows.append([
+                instruction[:60], '{:.1f}'.format(seconds),
+                '' if median is None else '{:.1f}'.format(median),
+                '' if median is None else '{:+.1f}'.format(seconds - median)])
+        print("Steps of {}, compared to the last {} builds:".format(
+            container_name, len(earlier)))
+        print(tabulate(rows, headers=['STEP', 'SECONDS', 'MEDIAN BEFORE',
+                                      'CHANGE'], disable_numparse=True))
+
+    def _build_args(self, variant_args=None):
+        """the variables `make build` is run with"""
+        template_parameters = config_helpers.\
+            get_template_parameters(self.config)
+        build_args = {'GPUS': template_parameters.get('gpus', 0)}
+        build_args.update(variant_args or {})
+        return build_args
+
+    def _container_name(self, build_args, variant=None):
+        """the image to build, and with `--content-tag` the hash of the
+           build context it's tagged by
+        """
+        context_hash = None
+        if self.args.get('--content-tag'):
+            context_hash = context_helpers.context_hash(build_args=build_args)
+            tag = context_helpers.content_tag(context_hash)
+        else:
+            tag = str(uuid.uuid4())
+        if variant:
+            tag = "{}-{}".format(tag, variant)
+        return "{}:{}".format(self.config['name'], tag), context_hash
+
+    @staticmethod
+    def _build_cmd(container_name, build_args):
+        """the shell command building `container_name`, with the build
+           args quoted as the values come from the config
+        """
+        return "{} {} make build".format(
+            quote("CONTAINER_NAME={}".format(container_name)), " ".join(
+                quote("{}={}".format(key, value))
+                for key, value in sorted(build_args.items())))
+
+    def cancel(self):
+        """stops the running builds, from another thread"""
+        self.cancelled = True
+        for build_process in list(self.build_processes):
+            process_helpers.terminate(build_process)
 
     def _watch_and_build(self):
         event_handler = EventHandler(self._build)
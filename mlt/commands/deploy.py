@@ -20,25 +20,52 @@
 import json
 import os
 import sys
+import threading
 import time
 import uuid
 import yaml
+from multiprocessing.pool import ThreadPool
 from string import Template
 from subprocess import CalledProcessError, check_output, STDOUT
 from termcolor import colored
+from watchdog.observers import Observer
 
 from mlt.commands import Command
-from mlt.utils import (build_helpers, config_helpers, files,
-                       kubernetes_helpers, progress_bar,
-                       process_helpers, log_helpers, schema,
-                       sync_helpers)
+from mlt.commands.build import BuildCommand
+from mlt.commands.undeploy import UndeployCommand
+from mlt.event_handler import EventHandler
+from mlt.utils import (build_helpers, cluster_backends, config_helpers,
+                       constants, docker_helpers, files, kubernetes_helpers,
+                       progress_bar, process_helpers, log_helpers,
+                       registry_clients, schema, state, sync_helpers, tracing)
+from mlt.utils.pipeline import Pipeline, format_timings
+
+
+# stand-ins for the values that change with every deploy, so templates can
+# be rendered once and reused
+IMAGE_PLACEHOLDER = '__mlt_image__'
+RUN_PLACEHOLDER = '__mlt_run_id__'
+PULL_POLICY_PLACEHOLDER = '__mlt_pull_policy__'
+
+# label interactive deploys put on the pods of a run, with the run id as
+# value, to find them without listing the whole namespace
+RUN_LABEL = 'app_run_id'
+
+# seconds the pods of a multi-pod interactive deploy are waited for before
+# they're listed, `mlt status` shows them after that
+POD_TABLE_TIMEOUT = 10
 
 
 class DeployCommand(Command):
+    # `os.setsid` to push in a process group of its own, see `BuildCommand`
+    preexec_fn = None
+
     def __init__(self, args):
         super(DeployCommand, self).__init__(args)
         self.config = config_helpers.load_config()
         build_helpers.verify_build(self.args)
+        self.push_process = None
+        self.cancelled = False
 
     def action(self):
         schema.validate()
@@ -48,104 +75,313 @@ class DeployCommand(Command):
                           "manually".format(sync_helpers.get_sync_spec()),
                           'yellow'))
 
-        skip_crd_check = self.args['--skip-crd-check']
-        if not skip_crd_check:
-            kubernetes_helpers.check_crds(exit_on_failure=True)
+        if self.args.get('--watch'):
+            self._check_crds()
+            self._watch_and_deploy()
+            return
+
+        if self.args.get('--sweep'):
+            self._check_sweep()
+            if self.args['--no-push']:
+                print("Skipping image push")
+                self._check_crds()
+                self._deploy_sweep(self._prepare_sweep())
+            else:
+                self._push_and_deploy(self._prepare_sweep, self._deploy_sweep)
+            return
 
         if self.args['--no-push']:
             print("Skipping image push")
+            self._check_crds()
+            self._deploy_new_container()
         else:
-            self._push()
+            self._push_and_deploy()
 
-        self._deploy_new_container()
+        if self.args.get('--wait'):
+            self._wait_for_pods()
 
         if self.args["--logs"]:
             self._tail_logs()
 
+    def _check_crds(self):
+        if not self.args['--skip-crd-check']:
+            kubernetes_helpers.check_crds(exit_on_failure=True)
+
+    def _push_and_deploy(self, prepare_deploy=None, deploy=None):
+        """pushes the image while the CRD check, the namespace check and the
+           rendering of the templates run in another thread, none of them
+           need the image. The templates are applied once both are done.
+           A failed preparation stops the push right away.
+           prepare_deploy, deploy: how the templates are rendered and applied,
+           `_prepare_deploy` and `_deploy_new_container` by default
+        """
+        prepare_deploy = prepare_deploy or self._prepare_deploy
+        deploy = deploy or self._deploy_new_container
+        started = time.time()
+        preparation = {}
+
+        def prepare():
+            prepare_started = time.time()
+            try:
+                self._check_crds()
+                preparation['prepared'] = prepare_deploy()
+            except SystemExit as e:
+                preparation['exit'] = e.code
+                self.cancel()
+            except Exception as e:
+                preparation['error'] = e
+                self.cancel()
+            preparation['seconds'] = time.time() - prepare_started
+
+        self.cancelled = False
+        preparer = threading.Thread(target=prepare)
+        preparer.daemon = True
+        preparer.start()
+        try:
+            self._push_image()
+        except SystemExit:
+            # a push cancelled by a failed preparation reports its failure
+            if not self.cancelled:
+                raise
+        pushed = time.time()
+        preparer.join()
+        if 'exit' in preparation:
+            sys.exit(preparation['exit'])
+        if 'error' in preparation:
+            raise preparation['error']
+
+        applying = time.time()
+        deploy(preparation['prepared'])
+        finished = time.time()
+        timings = [('push', pushed - started),
+                   ('prepare', preparation['seconds']),
+                   ('deploy', finished - applying)]
+        saved = sum(seconds for _, seconds in timings) - (finished - started)
+        print("Deploy timings: {}, {:.2f}s saved by preparing while "
+              "pushing".format(format_timings(
+                  timings, total=finished - started), max(0, saved)))
+
+    def _watch_and_deploy(self):
+        """builds, pushes and deploys the project every time it changes.
+           A build or push that's still running when the next change comes
+           in is cancelled, and the pipeline started over.
+        """
+        builder = BuildCommand(self.args)
+        builder.preexec_fn = self.preexec_fn = os.setsid
+        stages = [('build', builder._build, builder.cancel)]
+        if not self.args['--no-push']:
+            stages.append(('push', self._push, self.cancel))
+        stages.append(('deploy', self._redeploy, None))
+        if self.args['--undeploy-previous']:
+            stages.append(('undeploy', self._undeploy_previous, None))
+        pipeline = Pipeline(stages)
+
+        def run_pipeline():
+            status, timings = pipeline.run()
+            print("Pipeline {}: {}".format(status, format_timings(timings)))
+
+        def cancel_stale(changes):
+            stage = pipeline.cancel()
+            if stage is not None:
+                print("Cancelling {} after changes to {}".format(
+                    stage, ', '.join(changes)))
+
+        run_pipeline()
+        event_handler = EventHandler(run_pipeline, on_change=cancel_stale)
+        observer = Observer()
+        observer.schedule(event_handler, './', recursive=True)
+        observer.start()
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pipeline.cancel()
+            observer.stop()
+        observer.join()
+
+    def _redeploy(self):
+        self._previous_jobs = files.get_deployed_jobs(job_names_only=True)
+        self._deploy_new_container()
+
+    def _undeploy_previous(self):
+        """undeploys the job that was deployed before the last `_redeploy`
+        """
+        if self._previous_jobs:
+            UndeployCommand(dict(self.args, **{
+                '--job-name': self._previous_jobs[-1],
+                '--all': False})).action()
+
+    def cancel(self):
+        """stops a running push, from another thread"""
+        self.cancelled = True
+        process_helpers.terminate(self.push_process)
+
     def _push(self):
+        """pushes the image, after an earlier push was cancelled too"""
+        self.cancelled = False
+        self._push_image()
+
+    @tracing.traced('push')
+    def _push_image(self):
         self.container_name = files.fetch_action_arg(
             'build', 'last_container')
+        self.context_hash = files.fetch_action_arg('build', 'context_hash')
+        self.cache_tag = files.fetch_action_arg('build', 'cache_tag')
+        self._select_variant()
 
-        self.started_push_time = time.time()
-        self._push_docker()
+        self.remote_container_name = "{}/{}".format(
+            self.config['registry'], self.container_name)
+        self.image_id = docker_helpers.image_id(self.container_name)
+        digest = self._pushed_digest()
+        if digest:
+            state.get_store().record_action('push', {
+                "last_remote_container": self.remote_container_name,
+                "digest": digest, "image_id": self.image_id})
+            print("{} is already in the registry, skipping push".format(
+                self.remote_container_name))
+            self._update_cache_tag()
+            return
 
-        if not self.args['--verbose']:
-            self._poll_docker_proc()
+        self.started_push_time = time.time()
+        if not self.cancelled:
+            self._push_docker()
+            if not self.args['--verbose']:
+                self._poll_docker_proc()
+        if self.cancelled:
+            print("Push of {} cancelled".format(self.remote_container_name))
+            sys.exit(1)
 
-        with open('.push.json', 'w') as f:
-            f.write(json.dumps({
-                "last_remote_container": self.remote_container_name,
-                "last_push_duration": time.time() - self.started_push_time
-            }))
+        state.get_store().record_action('push', {
+            "last_remote_container": self.remote_container_name,
+            "last_push_duration": time.time() - self.started_push_time,
+            "digest": docker_helpers.repo_digest(self.remote_container_name),
+            "image_id": self.image_id
+        })
 
         print("Pushed {} to {}".format(
             self.config["name"], self.remote_container_name))
+        self._update_cache_tag()
+
+    def _select_variant(self):
+        """templates with several build variants push the image of the one
+           picked by the `build_variant` template parameter
+        """
+        variants = files.fetch_action_arg('build', 'variants')
+        if not variants:
+            return
+        variant = config_helpers.get_build_variant(self.config)
+        if variant not in variants:
+            print("Build variant {} hasn't been built yet, please run "
+                  "`mlt build` first".format(variant))
+            sys.exit(1)
+        self.container_name = variants[variant]['last_container']
+        self.context_hash = variants[variant].get('context_hash')
+        self.cache_tag = variants[variant].get('cache_tag')
+
+    @tracing.traced('registry check')
+    def _pushed_digest(self):
+        """digest of the image in the registry when it's the one built, None
+           when it needs pushing. Images tagged by the hash of their build
+           context only need to be in the registry, others the registry's
+           manifest has to have the local image id as its config. The digest
+           recorded by the last push of the same image is checked with a
+           single HEAD request.
+        """
+        client = registry_clients.get_client()
+        try:
+            if self.context_hash:
+                return client.manifest_digest(self.remote_container_name)
+            if not self.image_id:
+                return None
+            pushed = state.get_store().get_action('push')
+            if pushed.get('image_id') == self.image_id and pushed.get(
+                    'last_remote_container') == self.remote_container_name \
+                    and pushed.get('digest'):
+                digest = client.manifest_digest(self.remote_container_name)
+                return digest if digest == pushed['digest'] else None
+            if client.config_digest(
+                    self.remote_container_name) == self.image_id:
+                return client.manifest_digest(self.remote_container_name)
+        except registry_clients.RegistryError as e:
+            print(colored("Couldn't check {} in the registry: {}".format(
+                self.remote_container_name, e), 'yellow'))
+        return None
+
+    def _update_cache_tag(self):
+        """points the layer cache tag of images built with `--remote-cache`
+           at the image just pushed, its layers are in the registry already
+        """
+        if not self.cache_tag:
+            return
+        process_helpers.run(
+            ["docker", "tag", self.container_name, self.cache_tag])
+        if docker_helpers.push(self.cache_tag):
+            print("Updated layer cache {}".format(self.cache_tag))
+        else:
+            print(colored("Couldn't push layer cache {}".format(
+                self.cache_tag), 'yellow'))
 
     def _push_docker(self):
-        self.remote_container_name = "{}/{}".format(
-            self.config['registry'], self.container_name)
         self._tag()
 
         push_cmd = ["docker", "push", self.remote_container_name]
         if self.args['--verbose']:
             self.push_process = process_helpers.run_popen(
-                push_cmd, stdout=True, stderr=True)
+                push_cmd, stdout=True, stderr=True,
+                preexec_fn=self.preexec_fn)
+            self._stop_if_cancelled()
             self.push_process.wait()
             # add newline to separate push output from container deploy output
             print('')
         else:
-            self.push_process = process_helpers.run_popen(push_cmd)
+            self.push_process = process_helpers.run_popen(
+                push_cmd, preexec_fn=self.preexec_fn)
+            self._stop_if_cancelled()
+
+    def _stop_if_cancelled(self):
+        """terminates the push process just started when `cancel` was called
+           before there was one to terminate
+        """
+        if self.cancelled:
+            process_helpers.terminate(self.push_process)
 
     def _poll_docker_proc(self):
         """used only in the case of non-verbose deploy mode to dump loading
            bar and any error that happened
         """
-        last_push_duration = files.fetch_action_arg(
-            'push', 'last_push_duration')
-        with process_helpers.prevent_deadlock(self.push_process):
+        push_duration = progress_bar.estimate_duration(
+            files.fetch_action_arg_history(
+                'push', 'last_push_duration', progress_bar.HISTORY_SIZE))
+        with process_helpers.prevent_deadlock(self.push_process) as exited:
             progress_bar.duration_progress(
-                'Pushing {}'.format(self.config["name"]), last_push_duration,
-                lambda: self.push_process.poll() is not None)
+                'Pushing {}'.format(self.config["name"]), push_duration,
+                lambda: self.push_process.poll() is not None, exited.wait)
 
         # If the push fails, get stdout/stderr messages and display them
         # to the user, with the error message in red.
-        if self.push_process.poll() != 0:
+        if self.push_process.poll() != 0 and not self.cancelled:
             push_stdout, push_error = self.push_process.communicate()
             print(push_stdout.decode("utf-8"))
             print(colored(push_error.decode("utf-8"), 'red'))
             sys.exit(1)
 
+    @tracing.traced('tag')
     def _tag(self):
         process_helpers.run(
             ["docker", "tag", self.container_name, self.remote_container_name])
 
     @staticmethod
     def _update_app_run_id(app_run_id):
-        with open('.push.json', 'r+') as json_file:
-            data = json.load(json_file)
-            data['app_run_id'] = app_run_id
-            json_file.seek(0)
-            json.dump(data, json_file, indent=2)
-            json_file.truncate()
-
-    def _deploy_new_container(self):
-        """Substitutes image, app, run data into k8s-template selected.
-           Can also launch user into interactive shell with --interactive flag
+        state.get_store().update_action('push', {'app_run_id': app_run_id})
+
+    @tracing.traced('prepare')
+    def _prepare_deploy(self):
+        """the part of a deploy that doesn't need the image: makes sure the
+           namespace exists and renders the templates, with placeholders for
+           the image and run id
         """
-        app_name = self.config['name']
         self.namespace = self.config['namespace']
-        remote_container_name = files.fetch_action_arg(
-            'push', 'last_remote_container')
-        if remote_container_name is None:
-            raise ValueError("No image found to deploy with. Run a plain "
-                             "`mlt deploy` to fix this. Most common reason "
-                             "for this is a --no-push was used before "
-                             "any image was available to use.")
-
-        print("Deploying {}".format(remote_container_name))
         kubernetes_helpers.ensure_namespace_exists(self.namespace)
-
-        app_run_id = str(uuid.uuid4())
         """
         we'll keep track of the number of containers that would be deployed
         so we know if we should exec into 1 or not (only auto-exec if 1 made)
@@ -155,12 +391,30 @@ class DeployCommand(Command):
         """
         self._replicas_found = False
         self._total_containers = 0
+        return self._render_templates(self.config['name'])
+
+    def _deploy_new_container(self, prepared=None):
+        """Substitutes image, app, run data into k8s-template selected.
+           Can also launch user into interactive shell with --interactive flag
+           prepared: templates rendered by `_prepare_deploy` while pushing
+        """
+        app_name = self.config['name']
+        self.namespace = self.config['namespace']
+        remote_container_name = self._last_remote_container()
+        if prepared is None:
+            prepared = self._prepare_deploy()
+        remote_container_name = self._pin_image(remote_container_name)
+
+        print("Deploying {}".format(remote_container_name))
+        app_run_id = str(uuid.uuid4())
+        self.job_name = "-".join([app_name, app_run_id])
 
         # deploy our normal template sub logic, then if `deploy` in Makefile
         # add whatever custom stuff is desired
         self._default_deploy(app_name=app_name,
                              app_run_id=app_run_id,
-                             remote_container_name=remote_container_name)
+                             remote_container_name=remote_container_name,
+                             prepared=prepared)
         if files.is_custom("deploy:"):
             # execute the custom deploy code
             self._custom_deploy(app_name=app_name,
@@ -174,7 +428,7 @@ class DeployCommand(Command):
 
         if self.args["--interactive"] and not self._replicas_found \
                 and self._total_containers == 1:
-            self._exec_into_pod(self._get_most_recent_podname())
+            self._exec_into_pod(app_run_id)
         elif self.args["--interactive"]:
             print("More than one container created."
                   ".\nCall `kubectl exec -it {{pod_name_here}} "
@@ -183,34 +437,238 @@ class DeployCommand(Command):
                   "occasionally, or `watch -n1 mlt status` to watch until "
                   "pods are `Running`.\n".format(self.namespace))
 
-            for line in self._get_pods_by_start_time():
+            for line in self._get_pods_by_start_time(app_run_id):
                 print(line)
 
-    def _default_deploy(self, app_name, app_run_id, remote_container_name):
+    def _check_sweep(self):
+        """makes sure every parameter of `--sweep` is one the templates are
+           rendered with, before anything is pushed
+        """
+        template_parameters = config_helpers.get_template_parameters(
+            self.config)
+        for name, _ in self.args['--sweep']:
+            if name == constants.BUILD_VARIANT:
+                print("{} can't be swept, only the image of one build "
+                      "variant is pushed".format(name))
+                sys.exit(1)
+            if name not in template_parameters:
+                print("{} isn't a template parameter, expected one of: "
+                      "{}".format(name, ", ".join(
+                          sorted(template_parameters))))
+                sys.exit(1)
+
+    @tracing.traced('prepare')
+    def _prepare_sweep(self):
+        """`_prepare_deploy` for every combination of the `--sweep` values
+           returns the parameters swept and the rendered templates of each
+        """
+        self.namespace = self.config['namespace']
+        kubernetes_helpers.ensure_namespace_exists(self.namespace)
+        self._replicas_found = False
+        self._total_containers = 0
+        template_parameters = config_helpers.get_template_parameters(
+            self.config)
+        return [(sweep, self._render_templates(
+            self.config['name'], dict(template_parameters, **sweep)))
+            for sweep in config_helpers.sweep_combinations(
+                self.args['--sweep'])]
+
+    def _deploy_sweep(self, prepared):
+        """applies the jobs rendered by `_prepare_sweep`, `--parallel` of
+           them at a time, and records the parameters each job was deployed
+           with in the project state
+        """
+        app_name = self.config['name']
+        self.namespace = self.config['namespace']
+        remote_container_name = self._pin_image(self._last_remote_container())
+        template_parameters = config_helpers.get_template_parameters(
+            self.config)
+        print("Deploying {} job(s) of {}".format(
+            len(prepared), remote_container_name))
+
+        def deploy(job):
+            """deploys one job of the sweep, returns its run id and the
+               exit code of the deploy, it runs on a pool thread
+            """
+            sweep, rendered = job
+            app_run_id = str(uuid.uuid4())
+            job_name = "-".join([app_name, app_run_id])
+            parameters = dict(template_parameters, **sweep)
+            code = 0
+            try:
+                self._default_deploy(
+                    app_name=app_name, app_run_id=app_run_id,
+                    remote_container_name=remote_container_name,
+                    prepared=rendered)
+                if files.is_custom("deploy:"):
+                    self._custom_deploy(
+                        app_name=app_name, app_run_id=app_run_id,
+                        remote_container_name=remote_container_name,
+                        template_parameters=parameters)
+            except SystemExit as e:
+                code = e.code or 1
+            state.get_store().update_job(
+                job_name, sweep=sweep, template_parameters=parameters)
+            return app_run_id, code
+
+        pool = ThreadPool(max(1, min(
+            int(self.args.get('--parallel') or 2), len(prepared))))
+        try:
+            results = pool.map(deploy, prepared)
+        finally:
+            pool.terminate()
+
+        print("")
+        failed = False
+        for (sweep, _), (app_run_id, code) in zip(prepared, results):
+            print("{}-{} {}{}".format(app_name, app_run_id, ", ".join(
+                "{}={}".format(name, value) for name, value in sweep.items()),
+                " failed" if code else ""))
+            failed |= bool(code)
+        if failed:
+            sys.exit(1)
+        self._update_app_run_id(app_run_id)
+        print("\nInspect created objects by running:\n"
+              "$ kubectl get --namespace={} all\n"
+              "or \n$ mlt status\n".format(self.namespace))
+
+    @staticmethod
+    def _last_remote_container():
+        """the image the last push pushed, which is the one deployed"""
+        remote_container_name = files.fetch_action_arg(
+            'push', 'last_remote_container')
+        if remote_container_name is None:
+            raise ValueError("No image found to deploy with. Run a plain "
+                             "`mlt deploy` to fix this. Most common reason "
+                             "for this is a --no-push was used before "
+                             "any image was available to use.")
+        return remote_container_name
+
+    @staticmethod
+    def _pin_image(remote_container_name):
+        """the pushed image by the digest the registry gave it, when the push
+           recorded one. Nodes that pulled it before start pods from their
+           own copy, and a tag pushed again can't change what's deployed.
+        """
+        digest = files.fetch_action_arg('push', 'digest')
+        if not digest or not digest.startswith('sha256:'):
+            return remote_container_name
+        return docker_helpers.pinned(remote_container_name, digest)
+
+    @tracing.traced('render')
+    def _render_templates(self, app_name, template_parameters=None):
         """do template substitution across everything in `k8s-templates` dir
            replaces things with $ with the vars from template.substitute
            also patches deployment if interactive mode is set
+           returns the (filename, output) of every template
+           template_parameters: the config's template parameters by default
         """
+        store = state.get_store()
+        if template_parameters is None:
+            template_parameters = config_helpers.get_template_parameters(
+                self.config)
+        rendered = []
         for path, dirs, filenames in os.walk("k8s-templates"):
             for filename in filenames:
                 with open(os.path.join(path, filename)) as f:
-                    template = Template(f.read())
-                out = template.substitute(
-                    image=remote_container_name,
-                    app=app_name, run=app_run_id, namespace=self.namespace,
-                    **config_helpers.get_template_parameters(self.config))
-
-                # some templates are still in yaml form by the time they reach
-                # this point, so ignore a ValueError due to no json obj avail
-                try:
-                    out = self._ensure_correct_data_types(json.loads(out))
-                except ValueError:
-                    pass
-
-                if self.args["--interactive"]:
-                    # every pod will be made to `sleep infinity & wait`
-                    out = self._patch_template_spec(out)
-                self._apply_template(out, filename, app_name, app_run_id)
+                    template = f.read()
+
+                # only the image and run id change between deploys, so a
+                # template is prepared once with placeholders for them
+                key = state.cache_key(
+                    template, app_name, self.namespace, template_parameters,
+                    self.args["--interactive"])
+                prepared = store.get_cached('manifest', key)
+                if prepared is None:
+                    prepared = self._prepare_template(
+                        template, app_name, template_parameters)
+                    store.set_cached('manifest', key, prepared)
+
+                self._total_containers += prepared['containers']
+                self._replicas_found |= prepared['replicas_found']
+                rendered.append((filename, prepared['out']))
+        return rendered
+
+    def _default_deploy(self, app_name, app_run_id, remote_container_name,
+                        prepared):
+        """puts the image and run id into the rendered templates, then
+           applies all of them at once
+        """
+        # the content behind a digest never changes, nodes that have it
+        # don't need to ask the registry about it again
+        pull_policy = 'IfNotPresent' if '@sha256:' in remote_container_name \
+            else 'Always'
+        rendered = [(filename, out.replace(
+            IMAGE_PLACEHOLDER, remote_container_name).replace(
+            RUN_PLACEHOLDER, app_run_id).replace(
+            PULL_POLICY_PLACEHOLDER, pull_policy))
+            for filename, out in prepared]
+        if rendered:
+            self._apply_templates(rendered, app_name, app_run_id)
+
+    @staticmethod
+    def _pull_policy_placeholder(out):
+        """`out`, a template in json or yaml, with the `Always` pull policy
+           of the containers of the deployed image left as a placeholder,
+           whether they need to pull it every time is known once it's
+           pushed. Containers of other images keep their pull policy.
+        """
+        def replace(data):
+            changed = False
+            if isinstance(data, dict):
+                if data.get('image') == IMAGE_PLACEHOLDER and \
+                        data.get('imagePullPolicy') == 'Always':
+                    data['imagePullPolicy'] = PULL_POLICY_PLACEHOLDER
+                    changed = True
+                data = list(data.values())
+            if isinstance(data, list):
+                for value in data:
+                    changed |= replace(value)
+            return changed
+
+        if IMAGE_PLACEHOLDER not in out or 'Always' not in out:
+            return out
+        try:
+            documents, is_json = [json.loads(out)], True
+        except ValueError:
+            documents, is_json = list(yaml.safe_load_all(out)), False
+        if not replace(documents):
+            return out
+        if is_json:
+            return json.dumps(documents[0], indent=2)
+        return yaml.safe_dump_all(documents, default_flow_style=False)
+
+    def _prepare_template(self, template, app_name, template_parameters):
+        """substitutes everything but the image and run id into `template`
+           returns the output and the containers and replicas it was found
+           to have in interactive mode
+        """
+        total_containers = self._total_containers
+        replicas_found = self._replicas_found
+        self._total_containers, self._replicas_found = 0, False
+
+        out = Template(template).substitute(
+            image=IMAGE_PLACEHOLDER,
+            app=app_name, run=RUN_PLACEHOLDER, namespace=self.namespace,
+            **template_parameters)
+
+        # some templates are still in yaml form by the time they reach
+        # this point, so ignore a ValueError due to no json obj avail
+        try:
+            out = self._ensure_correct_data_types(json.loads(out))
+        except ValueError:
+            pass
+
+        if self.args["--interactive"]:
+            # every pod will be made to `sleep infinity & wait`
+            out = self._patch_template_spec(out)
+        out = self._pull_policy_placeholder(out)
+
+        prepared = {'out': out, 'containers': self._total_containers,
+                    'replicas_found': self._replicas_found}
+        self._total_containers = total_containers
+        self._replicas_found = replicas_found
+        return prepared
 
     def _ensure_correct_data_types(self, template_json):
         """Due to us editing the yaml now in init.py as well, we have some
@@ -226,10 +684,12 @@ class DeployCommand(Command):
                 v = self._ensure_correct_data_types(v)
         return json.dumps(template_json, indent=2)
 
-    def _custom_deploy(self, app_name, app_run_id, remote_container_name):
+    def _custom_deploy(self, app_name, app_run_id, remote_container_name,
+                       template_parameters=None):
         job_name = "-".join([app_name, app_run_id])
-        template_parameters = config_helpers.\
-            get_template_parameters(self.config)
+        if template_parameters is None:
+            template_parameters = config_helpers.\
+                get_template_parameters(self.config)
         template_parameters = \
             {k.upper(): v for k, v in template_parameters.items()}
         user_env = dict(os.environ,
@@ -246,23 +706,43 @@ class DeployCommand(Command):
         except CalledProcessError as e:
             print("Error while deploying app: {}".format(e.output))
 
-    def _apply_template(self, out, filename, app_name, app_run_id):
-        """take k8s-template data and create deployment in k8s dir
-           job_sub_dir will be used in case of a mlt deploy -l to pass in the
-           most current job being deployed to tail just in case there are > 1
-           jobs that exist since mlt logs requires --job-name if > 1 job
+    def _apply_templates(self, rendered, app_name, app_run_id):
+        """take rendered k8s-template data and create deployment in k8s dir
+           rendered: (filename, data) of every template
+           returns the job's sub directory, the jobs of a sweep are applied
+           from several threads so it isn't kept on the command
         """
-        self.job_sub_dir = self._track_deployed_job(app_name, app_run_id)
-        with open(os.path.join(self.job_sub_dir, filename), 'w') as f:
-            f.write(out)
+        job_sub_dir = self._track_deployed_job(app_name, app_run_id)
+        for filename, out in rendered:
+            with open(os.path.join(job_sub_dir, filename), 'w') as f:
+                f.write(out)
 
-        process_helpers.run(
-            ["kubectl", "--namespace", self.namespace,
-             "apply", "-R", "-f", self.job_sub_dir])
+        # one apply for all of the job's objects
+        started = time.time()
+        try:
+            with tracing.span('apply'):
+                results = cluster_backends.get_backend().apply(
+                    files.load_manifests(job_sub_dir), self.namespace)
+        except cluster_backends.ClusterError as e:
+            # a namespace or CRD remembered to exist may be gone
+            kubernetes_helpers.invalidate_cluster_cache()
+            print(colored(str(e), 'red'))
+            sys.exit(1)
+
+        for result in results:
+            print("{kind}/{name} {result}".format(**result))
+        print("Applied {} object(s) in {:.2f}s".format(
+            len(results), time.time() - started))
+        return job_sub_dir
 
     def _track_deployed_job(self, app_name, app_run_id):
-        """create a subdirectory in k8s with the deployed job name."""
+        """create a subdirectory in k8s with the deployed job name and
+           record the job in the project state
+        """
         job_name = "-".join([app_name, app_run_id])
+        kinds, _ = files.get_job_kinds()
+        state.get_store().add_job(job_name, app_run_id=app_run_id,
+                                  kinds=kinds)
         return self.create_job_subdir(job_name)
 
     def create_job_subdir(self, job_name):
@@ -272,33 +752,34 @@ class DeployCommand(Command):
             os.makedirs(job_sub_dir)
         return job_sub_dir
 
-    def _get_most_recent_podname(self):
-        """don't know of a better way to do this; grab the pod
-           created by the job we just deployed
-           this gets the most recent pod by name, so we can exec
-           into it once everything is done deploying
+    @staticmethod
+    def _run_selector(app_run_id):
+        """label selector of the pods of an interactive deploy's run"""
+        return '{}={}'.format(RUN_LABEL, app_run_id)
+
+    def _get_pods_by_start_time(self, app_run_id):
+        """table of the pods of the run `app_run_id`, by start time, once
+           as many as the job brings up are running, or shortly after
         """
-        pods = self._get_pods_by_start_time()
-        if pods:
-            # we want last pod listed, podname is always first
-            return pods[-1].split()[0]
-        else:
-            raise ValueError(
-                "No pods found in namespace: {}".format(
-                    self.namespace))
-
-    def _get_pods_by_start_time(self):
-        """helper func to return pods in current namespace by start time"""
-        return process_helpers.run_popen(
-            "kubectl get pods --namespace {} ".format(
-                self.namespace) +
-            "--sort-by=.status.startTime", shell=True
-        ).stdout.read().decode('utf-8').strip().splitlines()
+        selector = self._run_selector(app_run_id)
+        pods = list(kubernetes_helpers.wait_for_pods(
+            self.namespace, label_selector=selector,
+            expected=kubernetes_helpers.expected_pods(files.load_manifests(
+                os.path.join('k8s', self.job_name))),
+            timeout=min(self.args['--timeout'], POD_TABLE_TIMEOUT),
+            phases=('Running',)).values())
+        if not pods:
+            # timed out, show the pods that aren't running
+            pods = cluster_backends.get_backend().list(
+                'pods', self.namespace, label_selector=selector)
+        pods.sort(key=lambda pod: pod.get('status', {}).get('startTime', ''))
+        return kubernetes_helpers.pods_table(pods)
 
     def _patch_template_spec(self, data):
         """Makes `command` of template yaml `sleep infinity`.
            We will also add a `debug=true` label onto this pod for easy
-           discovery later.
+           discovery later, and a label with the run id to find the pods of
+           this deploy by.
         """
         data = yaml.load(data)
         self.template_locations = []
@@ -324,7 +805,9 @@ class DeployCommand(Command):
                     'args': ["-c", "trap : TERM INT; sleep infinity & wait"]})
         if self.template_locations:
             for template in self.template_locations:
-                template['metadata'] = {'labels': {'debug': 'true'}}
+                labels = template.setdefault('metadata', {}).setdefault(
+                    'labels', {})
+                labels.update({'debug': 'true', RUN_LABEL: RUN_PLACEHOLDER})
         return json.dumps(data)
 
     def _find_metadata_and_container_spec(self, data):
@@ -353,38 +836,17 @@ class DeployCommand(Command):
             for elem in data:
                 self._find_metadata_and_container_spec(elem)
 
-    def _exec_into_pod(self, podname):
-        """wait til pod comes up and then exec into it"""
+    @tracing.traced('exec')
+    def _exec_into_pod(self, app_run_id):
+        """wait til the pod of the run comes up and then exec into it"""
         print("Connecting to pod...")
-        tries = 0
-        while True:
-            pod = process_helpers.run_popen(
-                "kubectl get pods --namespace {} {} -o json".format(
-                    self.namespace, podname),
-                shell=True).stdout.read().decode('utf-8')
-            if not pod:
-                continue
-
-            # check if pod is in running state
-            # gcr stores an auth token which could be returned as part
-            # of the pod json data
-            pod = json.loads(pod)
-            if pod.get('items') or pod.get('status'):
-                # if there's more than 1 thing returned, we have
-                # `pod['items']['status']` otherwise we will always have
-                # `pod['status'], so by the second if below we're safe
-                # first item is what we care about (or only item)
-                if pod.get('items'):
-                    pod = pod['items'][0]
-                if pod['status']['phase'] == 'Running':
-                    break
-
-            if tries == self.args['--retries']:
-                raise ValueError("Pod {} not Running".format(podname))
-            tries += 1
-            print("Retrying {}/{} \r".format(
-                tries, self.args['--retries'])),
-            time.sleep(1)
+        pods = kubernetes_helpers.wait_for_pods(
+            self.namespace, label_selector=self._run_selector(app_run_id),
+            expected=1, timeout=self.args['--timeout'], phases=('Running',))
+        if not pods:
+            raise ValueError("No pod of {} Running in namespace: {}".format(
+                self.job_name, self.namespace))
+        podname = sorted(pods)[0]
 
         # Get shell to the specified pod running in the user's namespace
         kubectl_exec = ["kubectl", "exec", "-it", podname,
@@ -395,9 +857,57 @@ class DeployCommand(Command):
         process_helpers.run_popen(kubectl_exec,
                                   stdout=None, stderr=None).wait()
 
+    def _wait_for_pods(self):
+        """waits for the pods of the job just deployed to be running, then
+           reports how long each step of bringing them up took with
+           `--report`
+        """
+        running = log_helpers.check_for_pods_readiness(
+            self.namespace, self.job_name, self.args['--timeout'])
+        if not running:
+            sys.exit(1)
+        print("{} pod(s) running".format(len(running)))
+        if self.args.get('--report'):
+            self._report_latency(running)
+
+    @tracing.traced('latency report')
+    def _report_latency(self, pods):
+        """prints the p50 and max time the pods took to get through each
+           step of coming up, per replica type and for all of them, and
+           records it with the pods' own timings in the project state
+        """
+        backend = cluster_backends.get_backend()
+        lifecycles = {}
+        try:
+            for name, pod in sorted(pods.items()):
+                lifecycles[name] = kubernetes_helpers.pod_lifecycle(
+                    pod, backend.list(
+                        'events', self.namespace,
+                        field_selector='involvedObject.name={}'.format(name)))
+        except cluster_backends.ClusterError as e:
+            print(colored("Couldn't get the events of the pods: {}".format(e),
+                          'yellow'))
+            return
+        summary = kubernetes_helpers.lifecycle_summary(lifecycles.values())
+
+        store = state.get_store()
+        previous = store.get_action('deploy_report')
+        print("")
+        for line in kubernetes_helpers.lifecycle_table(summary):
+            print(line)
+        if previous:
+            totals = previous['replicas']['all']
+            print("Previous deploy {}: p50 total {}, max total {}".format(
+                previous['job_name'],
+                kubernetes_helpers.format_seconds(totals['p50']['total']),
+                kubernetes_helpers.format_seconds(totals['max']['total'])))
+        store.record_action('deploy_report', {
+            'job_name': self.job_name, 'replicas': summary,
+            'pods': lifecycles})
+
     def _tail_logs(self):
         """need to tail the most recent job just in case there are more than
            one and a user runs `mlt deploy -l`
         """
-        self.args["--job-name"] = self.job_sub_dir.replace('k8s/', '')
+        self.args["--job-name"] = self.job_name
         log_helpers.call_logs(self.config, self.args)
@@ -18,10 +18,21 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import os
 import sys
+import threading
+import time
+from tabulate import tabulate
 
 from mlt.commands import Command
-from mlt.utils import config_helpers, files, process_helpers
+from mlt.utils import (cluster_backends, config_helpers, files,
+                       kubernetes_helpers)
+
+# to support python2 as well
+try:
+    from queue import Empty, Queue
+except ImportError:
+    from Queue import Empty, Queue
 
 
 class EventsCommand(Command):
@@ -32,42 +43,24 @@ class EventsCommand(Command):
     def action(self):
         """
         Display events for a job. If multiple jobs, specify with --job-name
-        This method will check for `.push.json`
-        and provides run-id to _get_event method to
-        fetch events.
+        This method will look up the deployed job and fetches the events of
+        its k8s objects and pods, or streams them with --follow.
         """
-        job = files.get_only_one_job(
+        job_name = files.get_only_one_job(
             job_desired=self.args["--job-name"],
-            error_msg="Please use --job-name flag to query for job events.")
-
-        self._get_events(job, self.config['namespace'])
+            error_msg="Please use --job-name flag to query for job events.",
+            truncate=False)
+        namespace = self.config['namespace']
 
-    def _get_events(self, filter_tag, namespace):
-        """
-         Fetches events
-        """
-        events_cmd = "kubectl get events --namespace {}".format(namespace)
         try:
-            events = process_helpers.run_popen(events_cmd, shell=True)
-            header_line = True
-            header = events.stdout.readline()
-            while True:
-                output = events.stdout.readline().decode('utf-8')
-                if output == '' and events.poll() is not None:
-                    error = events.stderr.readline()
-                    if error:
-                        raise Exception(error)
-                    break
-
-                if output is not '' and filter_tag and filter_tag in output:
-                    if header_line:
-                        print(header.decode('utf-8'))
-                        header_line = False
-                    sys.stdout.write(output)
+            if self.args.get("--follow"):
+                for row in self._follow_events(job_name, namespace):
+                    print(row)
                     sys.stdout.flush()
-
-            if header_line:
-                print("No events to display for this job")
+            else:
+                self._get_events(job_name, namespace)
+        except KeyboardInterrupt:
+            sys.exit()
         except Exception as ex:
             if 'command not found' in str(ex):
                 print("Please install `{}`. "
@@ -76,3 +69,154 @@ class EventsCommand(Command):
             else:
                 print("Exception: {}".format(ex))
             sys.exit(1)
+
+    def _get_events(self, job_name, namespace):
+        """
+         Fetches events
+        """
+        events = self._list_events(job_name, namespace)
+        if events:
+            print(self._events_table(events))
+        else:
+            print("No events to display for this job")
+
+    @staticmethod
+    def _involved_objects(job_name):
+        """names of the job's k8s objects, and the label selector of its
+           pods if they can be told apart by their labels
+        """
+        manifests = files.load_manifests(os.path.join('k8s', job_name))
+        names = []
+        for obj in manifests:
+            name = (obj.get('metadata') or {}).get('name')
+            if name and name not in names:
+                names.append(name)
+        return names, kubernetes_helpers.pod_selector(manifests, job_name)
+
+    @staticmethod
+    def _involved_object_selector(name):
+        return 'involvedObject.name={}'.format(name)
+
+    def _list_events(self, job_name, namespace):
+        """asks the cluster for the events of each of the job's objects and
+           pods, rather than going through every event in the namespace
+        """
+        backend = cluster_backends.get_backend()
+        names, label_selector = self._involved_objects(job_name)
+        if not label_selector:
+            # the pods can't be found by label, go by the events' names
+            prefix = files.get_truncated_job_name(job_name)
+            return [event for event in backend.list('events', namespace)
+                    if prefix in event['involvedObject'].get('name', '')]
+
+        names.extend(pod['metadata']['name'] for pod in backend.list(
+            'pods', namespace, label_selector=label_selector))
+        events = {}
+        for name in names:
+            for event in backend.list(
+                    'events', namespace,
+                    field_selector=self._involved_object_selector(name)):
+                events[event['metadata']['name']] = event
+        return sorted(events.values(),
+                      key=lambda event: event.get('lastTimestamp') or '')
+
+    def _follow_events(self, job_name, namespace):
+        """yields lines of the events table, first the events so far and
+           then each new event as the cluster reports it
+        """
+        seen = set()
+        events = self._list_events(job_name, namespace)
+        for event in events:
+            seen.add((event['metadata']['name'], event.get('count')))
+        if events:
+            for line in self._events_table(events).splitlines():
+                yield line
+        else:
+            yield "No events for this job yet, waiting for them..."
+
+        names, label_selector = self._involved_objects(job_name)
+        prefix = files.get_truncated_job_name(job_name)
+        changes = Queue()
+        stop = threading.Event()
+        if label_selector:
+            # a watch takes a single field selector, so each object and pod
+            # gets its own, and new pods get theirs as they show up
+            for name in names:
+                self._watch(changes, stop, 'events', namespace,
+                            field_selector=self._involved_object_selector(
+                                name))
+            self._watch(changes, stop, 'pods', namespace,
+                        label_selector=label_selector)
+        else:
+            self._watch(changes, stop, 'events', namespace)
+
+        watched = set(names)
+        try:
+            while True:
+                try:
+                    resource, event_type, obj = changes.get(timeout=1)
+                except Empty:
+                    continue
+                if resource is None:
+                    raise obj
+
+                name = obj['metadata']['name']
+                if resource == 'pods':
+                    if name not in watched:
+                        watched.add(name)
+                        self._watch(
+                            changes, stop, 'events', namespace,
+                            field_selector=self._involved_object_selector(
+                                name))
+                    continue
+
+                key = (name, obj.get('count'))
+                if event_type == 'DELETED' or key in seen or (
+                        not label_selector and prefix not in
+                        obj['involvedObject'].get('name', '')):
+                    continue
+                seen.add(key)
+                yield tabulate([self._event_row(obj)], tablefmt='plain')
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _watch(changes, stop, resource, namespace, **selectors):
+        """puts (resource, event type, object) of every change to
+           `resource` on the `changes` queue from a background thread, or
+           (None, None, exception) if watching fails
+        """
+        def watch():
+            backend = cluster_backends.get_backend()
+            try:
+                while not stop.is_set():
+                    for event_type, obj in backend.watch(
+                            resource, namespace, **selectors):
+                        if stop.is_set():
+                            return
+                        changes.put((resource, event_type, obj))
+                    # the server ended the watch, pick it up again
+                    time.sleep(1)
+            except Exception as e:
+                changes.put((None, None, e))
+
+        thread = threading.Thread(target=watch)
+        thread.daemon = True
+        thread.start()
+
+    @staticmethod
+    def _event_row(event):
+        involved = event['involvedObject']
+        return [
+            kubernetes_helpers.age(event.get('lastTimestamp')),
+            kubernetes_helpers.age(event.get('firstTimestamp')),
+            event.get('count', 1), involved.get('name'),
+            involved.get('kind'), event.get('type'), event.get('reason'),
+            event.get('source', {}).get('component'),
+            event.get('message', '').strip()]
+
+    @classmethod
+    def _events_table(cls, events):
+        return tabulate([cls._event_row(event) for event in events], headers=[
+            'LAST SEEN', 'FIRST SEEN', 'COUNT', 'NAME', 'KIND', 'TYPE',
+            'REASON', 'SOURCE', 'MESSAGE'], tablefmt='plain')
@@ -64,6 +64,8 @@ class InitCommand(Command):
                                           constants.TEMPLATE_CONFIG)
                 template_params = config_helpers.\
                     get_template_parameters_from_file(param_file)
+                build_variants = config_helpers.\
+                    get_build_variants_from_file(param_file)
                 template_git_sha = git_helpers.get_latest_sha(os.path.join(
                     temp_clone, constants.TEMPLATES_DIR, template_name))
                 if not skip_crd_check:
@@ -89,7 +91,8 @@ class InitCommand(Command):
                                       'red'))
                         sys.exit(1)
 
-                data = self._build_mlt_json(template_params, template_git_sha)
+                data = self._build_mlt_json(template_params, template_git_sha,
+                                            build_variants)
 
                 # If the app has option for debugging failures, grab the
                 # Kubernetes debug wrapper file and put it in the app directory
@@ -199,7 +202,8 @@ class InitCommand(Command):
 
         return True in return_val_list
 
-    def _build_mlt_json(self, template_parameters, template_git_sha):
+    def _build_mlt_json(self, template_parameters, template_git_sha,
+                        build_variants=None):
         """generates the data to write to mlt.json"""
         data = {'name': self.app_name,
                 'template_name': self.template_name,
@@ -242,6 +246,8 @@ class InitCommand(Command):
             template_data = data[constants.TEMPLATE_PARAMETERS] = {}
             for param in template_parameters:
                 template_data[param["name"]] = param["value"]
+        if build_variants:
+            data[constants.BUILD_VARIANTS] = build_variants
 
         return data
 
@@ -17,14 +17,22 @@
 #
 # SPDX-License-Identifier: EPL-2.0
 #
+
 import os
 import subprocess
 import sys
 from datetime import datetime
+from multiprocessing.pool import ThreadPool
 from pytz import timezone
+from tabulate import tabulate
 
 from mlt.commands import Command
-from mlt.utils import config_helpers, files, process_helpers, sync_helpers
+from mlt.utils import (cluster_backends, config_helpers, files,
+                       kubernetes_helpers, state, sync_helpers)
+
+# how many jobs' status is fetched at the same time, the same as the API
+# server backend's connection pool so no request waits on a connection
+WORKERS = cluster_backends.POOL_SIZE
 
 
 class StatusCommand(Command):
@@ -33,63 +41,92 @@ class StatusCommand(Command):
         self.config = config_helpers.load_config()
 
     def action(self):
-        if not os.path.isfile('.push.json'):
+        store = state.get_store()
+        if not store.get_action('push'):
             print("This app has not been deployed yet")
             sys.exit(1)
 
         namespace = self.config['namespace']
-        jobs = files.get_deployed_jobs()
-
         # display status for only `--count` amount of jobs
-        for job in jobs[:self.args["<count>"]]:
-            job_name = job.replace('k8s/', '')
-            print('Job: {} -- Creation Time: {}'.format(
-                # replacing tzinfo with UTC to print `+0000` so users know
-                # output is in utc
-                # TODO: better way to print this?
-                job_name, datetime.utcfromtimestamp(
-                    int(os.path.getmtime(job))).replace(
-                    tzinfo=timezone('UTC'))))
-            self._display_status(job_name, namespace)
-            # TODO: something more fancy to separate different statuses?
-            print('')
-
-    def _display_status(self, job, namespace):
-        """detects what kind of job was deployed and calls the correct
-           status display function
-        """
-        status_options = {
-            "job": self._generic_status,
-            "tfjob": self._crd_status,
-            "pytorchjob": self._crd_status,
-            # experiments have yaml templates but also a bash script to call
-            "experiment": self._custom_status
-        }
+        jobs = store.get_jobs()[:self.args["<count>"]]
+        job_type = self._job_type()
 
+        pool = ThreadPool(max(1, min(WORKERS, len(jobs))))
+        try:
+            # statuses are fetched concurrently, but printed in job order
+            # as soon as the ones before them are done
+            statuses = pool.imap(
+                lambda job: self._collect_status(
+                    job['name'], namespace, job_type), jobs)
+            for job, (lines, error) in zip(jobs, statuses):
+                print('Job: {} -- Creation Time: {}'.format(
+                    # replacing tzinfo with UTC to print `+0000` so users
+                    # know output is in utc
+                    # TODO: better way to print this?
+                    job['name'], datetime.utcfromtimestamp(
+                        int(job['created'])).replace(
+                        tzinfo=timezone('UTC'))))
+                for line in lines:
+                    print(line)
+                if error:
+                    print(error)
+                    sys.exit(1)
+                # TODO: something more fancy to separate different statuses?
+                print('')
+        finally:
+            pool.terminate()
+
+    @staticmethod
+    def _job_type():
+        """detects what kind of job was deployed, from the kinds in
+           `k8s-templates` which all jobs of the app share
+        """
         # if we have more than 1 k8 object created and types don't match
         # go with a custom job type since we won't know what kubectl call
         # to make to get status from everything
         job_types, all_same_job_type = files.get_job_kinds()
         if job_types and not all_same_job_type:
-            job_types = "custom"
+            return "custom"
         elif job_types:
-            job_types = job_types.pop()
+            return job_types.pop()
+        return job_types
 
+    def _collect_status(self, job, namespace, job_type):
+        """runs in a worker thread, returns the lines of the status of `job`
+           and the error to exit with, if any
+        """
+        lines = []
         try:
-            status_options.get(job_types, self._custom_status)(
-                job, namespace, job_types)
+            self._display_status(job, namespace, job_type, lines)
         except subprocess.CalledProcessError as e:
             if "No rule to make target `status'" in str(e.output):
                 # TODO: when we have a template updating capability, add a
                 # note recommending that he user update's their template to
                 # get the status command
-                print("This app does not support the `mlt status` command. "
-                      "No `status` target was found in the Makefile.")
-            else:
-                print("Error while getting app status: {}".format(e.output))
-            sys.exit(1)
+                return lines, ("This app does not support the `mlt status` "
+                               "command. No `status` target was found in "
+                               "the Makefile.")
+            return lines, "Error while getting app status: {}".format(
+                e.output)
+        except cluster_backends.ClusterError as e:
+            return lines, "Error while getting app status: {}".format(e)
+        return lines, None
 
-    def _custom_status(self, job, namespace, job_type):
+    def _display_status(self, job, namespace, job_type, lines):
+        """calls the correct status display function for the kind of job,
+           which adds to `lines`
+        """
+        status_options = {
+            "job": self._generic_status,
+            "tfjob": self._crd_status,
+            "pytorchjob": self._crd_status,
+            # experiments have yaml templates but also a bash script to call
+            "experiment": self._custom_status
+        }
+        status_options.get(job_type, self._custom_status)(
+            job, namespace, job_type, lines)
+
+    def _custom_status(self, job, namespace, job_type, lines):
         """runs `make status` on any special deployment
            Special deployment is defined as any one of the following:
                 1. Doesn't have deployment yaml
@@ -99,40 +136,50 @@ class StatusCommand(Command):
         output = subprocess.check_output(["make", "status"],
                                          env=user_env,
                                          stderr=subprocess.STDOUT)
-        print(output.decode("utf-8").strip())
+        lines.append(output.decode("utf-8").strip())
         if sync_helpers.get_sync_spec() is not None:
-            # format the string before passing it print so that the string
-            # is evaluated correctly
-            print("\nSYNC STATUS\n{}".format(
+            lines.append("\nSYNC STATUS\n{}".format(
                 'This app is being watched by sync'))
 
-    def _generic_status(self, job, namespace, job_type):
+    def _generic_status(self, job, namespace, job_type, lines):
         """displays simple pod information"""
-        status = process_helpers.run_popen(
-            ["kubectl", "get", "pods", "--namespace", namespace,
-             "-o", "wide", "-a", "-l", "job-name={}".format(job)],
-            stdout=True, stderr=True)
-        status.wait()
+        self._pods_status(namespace, "{}={}".format(
+            kubernetes_helpers.POD_LABELS[job_type], job), lines)
 
-    def _crd_status(self, job, namespace, job_type):
+    def _crd_status(self, job, namespace, job_type, lines):
         """Handles statuses for various crd deployments
            CRDs handled:
                 1. TFJob
                 2. PyTorchJob
         """
-        label = 'tf_job_name' if job_type == 'tfjob' else 'pytorch_job_name'
-
-        print("CRD: {}".format(job_type.upper()))
-        status = process_helpers.run_popen(
-            ["kubectl", "get", job_type, job, "--namespace", namespace])
-        out, err = status.communicate()
-        if status.wait() != 0:
-            print("The job may have been undeployed.")
+        lines.append("CRD: {}".format(job_type.upper()))
+        crd = cluster_backends.get_backend().get(job_type, job, namespace)
+        if crd is None:
+            lines.append("The job may have been undeployed.")
         else:
-            print(out.decode('utf-8'))
+            lines.append(tabulate(
+                [[crd['metadata']['name'], self._crd_state(crd),
+                  kubernetes_helpers.age(
+                      crd['metadata'].get('creationTimestamp'))]],
+                headers=['NAME', 'STATE', 'AGE'], tablefmt='plain'))
+
+        lines.append("Pods: ")
+        self._pods_status(namespace, "{}={}".format(
+            kubernetes_helpers.POD_LABELS[job_type], job), lines)
+
+    @staticmethod
+    def _crd_state(crd):
+        """latest true condition of the crd, like `Running` or `Succeeded`"""
+        status = crd.get('status') or {}
+        conditions = [c for c in status.get('conditions') or []
+                      if c.get('status') == 'True']
+        if conditions:
+            return conditions[-1]['type']
+        return status.get('phase') or status.get('state') or '<unknown>'
 
-        print("Pods: ")
-        status = process_helpers.run_popen(
-            ["kubectl", "get", "pods", "--namespace", namespace, "-o", "wide",
-             "-a", "-l", "{}={}".format(label, job)], stdout=True, stderr=True)
-        status.communicate()
+    @staticmethod
+    def _pods_status(namespace, label_selector, lines):
+        pods = cluster_backends.get_backend().list(
+            'pods', namespace, label_selector=label_selector)
+        lines.extend(kubernetes_helpers.pods_table(pods) or [
+            "No resources found."])
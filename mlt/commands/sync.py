@@ -18,13 +18,12 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-import json
 import os
 import subprocess
 import sys
 
 from mlt.commands import Command
-from mlt.utils import (config_helpers, sync_helpers)
+from mlt.utils import (config_helpers, state, sync_helpers)
 
 
 class SyncCommand(Command):
@@ -38,8 +37,7 @@ class SyncCommand(Command):
                   "option")
             sys.exit(1)
 
-        push_file = '.push.json'
-        if not os.path.isfile(push_file):
+        if not state.get_store().get_action('push'):
             print("This app has not been deployed yet")
             sys.exit(1)
 
@@ -52,9 +50,7 @@ class SyncCommand(Command):
             self._delete()
 
     def _create(self):
-        push_file = '.push.json'
-        with open(push_file, 'r') as f:
-            push_data = json.load(f)
+        push_data = state.get_store().get_action('push')
 
         if sync_helpers.get_sync_spec() is not None:
             print("Syncing spec has been already created for this app")
@@ -68,9 +64,7 @@ class SyncCommand(Command):
         try:
             subprocess.check_output(["make", "sync-create"], env=user_env,
                                     stderr=subprocess.STDOUT)
-            with open('.sync.json', 'w') as json_file:
-                sync_data = {'sync_spec': job_name}
-                json.dump(sync_data, json_file, indent=2)
+            state.get_store().record_action('sync', {'sync_spec': job_name})
             print("Syncing spec is created successfully")
         except subprocess.CalledProcessError as e:
             if "No rule to make target `sync-create'" in str(e.output):
@@ -120,13 +114,7 @@ class SyncCommand(Command):
         try:
             subprocess.check_output(["make", "sync-delete"], env=user_env,
                                     stderr=subprocess.STDOUT)
-            with open('.sync.json', 'r+') as json_file:
-                sync_data = json.load(json_file)
-                if 'sync_spec' in sync_data.keys():
-                    del(sync_data['sync_spec'])
-                json_file.seek(0)
-                json.dump(sync_data, json_file, indent=2)
-                json_file.truncate()
+            state.get_store().update_action('sync', {'sync_spec': None})
             print("Syncing spec is successfully deleted")
         except subprocess.CalledProcessError as e:
             if "No rule to make target `sync-delete'" in str(e.output):
@@ -26,7 +26,8 @@ import shutil
 from termcolor import colored
 
 from mlt.commands import Command
-from mlt.utils import config_helpers, process_helpers, files, sync_helpers
+from mlt.utils import (config_helpers, process_helpers, files, state,
+                       sync_helpers)
 
 
 class UndeployCommand(Command):
@@ -80,10 +81,14 @@ class UndeployCommand(Command):
         # `make undeploy` on each job
         recursive_delete = False if files.is_custom('undeploy:') else True
         if recursive_delete:
-            process_helpers.run(
-                ["kubectl", "--namespace", namespace, "delete", "-f",
-                 "k8s", "--recursive"],
-                raise_on_failure=True)
+            # only the given job's objects unless all of them go
+            job_dirs = ['k8s'] if all_jobs else \
+                [os.path.join('k8s', job) for job in jobs]
+            for job_dir in job_dirs:
+                process_helpers.run(
+                    ["kubectl", "--namespace", namespace, "delete", "-f",
+                     job_dir, "--recursive"],
+                    raise_on_failure=True)
             # TODO: have this not be in a loop
             for job in jobs:
                 self.remove_job_dir(os.path.join('k8s', job))
@@ -91,6 +96,7 @@ class UndeployCommand(Command):
             for job in jobs:
                 self._custom_undeploy(job)
                 self.remove_job_dir(os.path.join('k8s', job))
+        state.get_store().remove_jobs(jobs)
 
     def remove_job_dir(self, job_dir):
         """remove the job sub-directory from k8s."""
@@ -19,40 +19,96 @@
 #
 
 import os
+import threading
 import time
-from subprocess import call
-from threading import Timer
+from watchdog.events import EVENT_TYPE_MODIFIED
+
+from mlt.utils.ignore_helpers import GitIgnore
+
+# changed files listed when reporting a change set, the rest are counted
+REPORTED_CHANGES = 5
 
 
 class EventHandler(object):
-    def __init__(self, callback):
-        self.last_changed = time.time()
-        self.dirty = False
-        self.timer = None
+    """collects the file system events of a watched project into a change
+       set, and calls `callback` once no new change came in for `delay`
+       seconds. Files ignored by git are matched in-process, with the
+       ignore files reloaded as they change.
+       `on_change` is called with the changed paths of every event, right
+       away, e.g. to stop work the change makes stale.
+    """
+
+    def __init__(self, callback, delay=3, root='.', on_change=None):
         self.callback = callback
-        self.ignore_directories = ["./.git"]
-        self.ignore_files = ["./"]
+        self.on_change = on_change
+        self.delay = delay
+        self.root = root
+        # deploys write the manifests of every job under k8s/, which
+        # mustn't trigger the next deploy
+        self.ignore_directories = [".git", ".mlt", "k8s"]
+        self.gitignore = GitIgnore(root)
+        self.changes = set()
+        self.deadline = None
+        self.timer = None
+        self.lock = threading.Lock()
+
+    def _relative_path(self, path):
+        path = os.path.relpath(path, self.root).replace(os.sep, '/')
+        return None if path == '.' or path.startswith('../') else path
 
     def dispatch(self, event):
-        # TODO(niklas): Could be smarter with a os.path.basename(),
-        #               but doing a prefix check for now.
-        for directory in self.ignore_directories:
-            if event.src_path.startswith(directory):
-                return
-
-        for f in self.ignore_files:
-            if event.src_path == f:
-                return
-
-        is_ignored = call(["git", "check-ignore", event.src_path],
-                          stdout=open(os.devnull, 'wb')) == 0
-        if is_ignored:
+        # a directory is modified whenever a file in it is, which is an
+        # event of its own
+        if event.is_directory and event.event_type == EVENT_TYPE_MODIFIED:
+            return
+
+        changed = []
+        for path in (event.src_path, getattr(event, 'dest_path', None)):
+            path = path and self._relative_path(path)
+            if not path:
+                continue
+            reloaded = self.gitignore.reload(path)
+            if path.split('/')[0] in self.ignore_directories:
+                continue
+            if reloaded or not self.gitignore.ignored(
+                    path, event.is_directory):
+                changed.append(path)
+        if not changed:
             return
+        if self.on_change:
+            self.on_change(changed)
+
+        with self.lock:
+            self.changes.update(changed)
+            self.deadline = time.time() + self.delay
+            if self.timer is None:
+                self.timer = threading.Thread(target=self._wait_for_quiet)
+                self.timer.daemon = True
+                self.timer.start()
 
-        if self.timer:
-            self.timer.cancel()
+    def _wait_for_quiet(self):
+        """runs `callback` for the change sets, for as long as changes keep
+           coming in
+        """
+        while True:
+            with self.lock:
+                remaining = self.deadline - time.time()
+                if remaining <= 0:
+                    if not self.changes:
+                        self.timer = None
+                        return
+                    changes = sorted(self.changes)
+                    self.changes = set()
+            if remaining > 0:
+                time.sleep(remaining)
+                continue
 
-        print("Detected change in {}".format(event.src_path))
+            self.report(changes)
+            self.callback()
 
-        self.timer = Timer(3, lambda: self.callback())
-        self.timer.start()
+    @staticmethod
+    def report(changes):
+        more = len(changes) - REPORTED_CHANGES
+        print("Detected changes in {}{}".format(
+            ', '.join(changes[:REPORTED_CHANGES]),
+            ' and {} more file(s)'.format(more) if more > 0 else ''))
@@ -25,20 +25,27 @@ Usage:
   mlt --version
   mlt init [--template=<template> --template-repo=<repo>]
       [--registry=<registry> --namespace=<namespace>]
-      [--skip-crd-check] [--enable-sync] <name>
+      [--skip-crd-check] [--enable-sync] [--trace] <name>
   mlt template_config (list | set <name> <value> | remove <name>)
-  mlt build [--watch] [-v | --verbose]
+      [--trace]
+  mlt build [--watch] [--content-tag] [--remote-cache]
+      [--parallel=<builds>] [--profile] [--trace] [-v | --verbose]
   mlt deploy [--no-push] [-i | --interactive] [-l | --logs]
-      [--retries=<retries>] [--skip-crd-check]
-      [--since=<duration>] [-v | --verbose]
-  mlt sync (create | reload | delete)
-  mlt undeploy [--all] [--job-name=<name>]
-  mlt status [--job-name=<name>] [-n <count> | --count <count>]
-  mlt (template | templates) list [--template-repo=<repo>]
-  mlt update-template [--template-repo=<repo>]
-  mlt (log | logs) [--since=<duration>] [--retries=<retries>]
-      [--job-name=<name>]
-  mlt events [--job-name=<name>]
+      [--wait [--report]] [--timeout=<seconds> | --retries=<retries>]
+      [--skip-crd-check] [--since=<duration>] [--trace] [-v | --verbose]
+  mlt deploy --watch [--no-push] [--undeploy-previous] [--skip-crd-check]
+      [--trace] [-v | --verbose]
+  mlt deploy (--sweep=<param>)... [--no-push] [--parallel=<deploys>]
+      [--skip-crd-check] [--trace] [-v | --verbose]
+  mlt sync (create | reload | delete) [--trace]
+  mlt undeploy [--all] [--job-name=<name>] [--trace]
+  mlt status [--job-name=<name>] [-n <count> | --count <count>] [--trace]
+  mlt (template | templates) list [--template-repo=<repo>] [--trace]
+  mlt update-template [--template-repo=<repo>] [--trace]
+  mlt (log | logs) [--since=<duration>]
+      [--timeout=<seconds> | --retries=<retries>] [--job-name=<name>]
+      [--trace]
+  mlt events [--job-name=<name>] [-f | --follow] [--trace]
 
 Options:
   --template=<template>     Template name for app
@@ -73,8 +80,26 @@ Options:
                             To ignore files and folders from syncing, add them
                             to '.stignore' file.
                             [default: False].
-  --watch                   Watch project directory and build on file changes
+  --watch                   Watch project directory and build on file changes.
+                            With deploy, also push and deploy the new image.
+  --undeploy-previous       Undeploy the previous job once `deploy --watch`
+                            deployed the next one.
+  --content-tag             Tag the image with a hash of the build context,
+                            Dockerfile and build args. The build is skipped
+                            if the image already exists, and so is the push
+                            of `mlt deploy` if the registry already has it.
+  --remote-cache            Pull the layer cache tag of the app from the
+                            registry, or the last pushed image, and build from
+                            its layers. `mlt deploy` updates the cache tag.
+  --profile                 Compare how long each step of the build took to
+                            the earlier builds.
+  --parallel=<builds>       How many build variants of the template are built,
+                            or sweep jobs deployed, at the same time
+                            [default: 2].
   --verbose                 Prints build or deploy logs
+  --trace                   Write how long each step of the command took, as
+                            Chrome trace events, to .mlt/traces. Set
+                            MLT_TRACE to trace any command.
   --no-push                 Deploy your project to kubernetes using the same
                             image from your last run.
   --interactive             Rewrites all container commands to infinite sleep,
@@ -82,16 +107,28 @@ Options:
                             there's only one container deployed. Otherwise,
                             outputs helpful text to help you connect to
                             your running container.
-                            Adds a `debug=true` label for easy discovery later.
-  --retries=<retries>       Number of times to retry while waiting for pods to
-                            be running. Waits 1 second between retrying. Used
-                            with interactive deploy and logs.
+                            Adds a `debug=true` label for easy discovery later,
+                            and an `app_run_id` label the pods are found by.
+  --wait                    Wait for the pods of the deployed job to be
+                            running.
+  --report                  With --wait, print how long the pods took to be
+                            scheduled, pull the image, create and start their
+                            containers, per replica type.
+  --sweep=<param>           Deploy a job for every combination of the values
+                            of template parameters given as
+                            name=value1,value2,...  The image is pushed once.
+  --timeout=<seconds>       Seconds to wait for pods to be running. Used with
+                            interactive deploy, --wait and logs.
+                            Defaults to the value of --retries.
+  --retries=<retries>       Deprecated, use --timeout. Waiting used to retry
+                            once a second, so this is a timeout in seconds.
                             [default: 120]
   --since=<duration>        Returns logs newer than a relative
                             duration like 10s, 1m, or 2h [default: 1m].
   --logs                    Tail logs after deploying [default: False]
   --all                     Undeploy all of the deployed jobs.
   --job-name=<name>         Job name to undeploy.
+  -f --follow               Keep streaming new events of the job.
   --count=<count>           Number of job statuses to return in `mlt status`
                             [default: 5]
 """
@@ -102,36 +139,44 @@ import os
 from docopt import docopt
 
 import mlt
-from mlt.commands import (BuildCommand, TemplateConfigCommand, DeployCommand,
-                          EventsCommand, InitCommand, LogsCommand,
-                          StatusCommand, SyncCommand, TemplatesCommand,
-                          UndeployCommand, UpdateTemplateCommand)
-from mlt.utils import regex_checks
+from mlt.commands import load_command
+from mlt.utils import config_helpers, regex_checks, tracing
 
 
-# every available command and its corresponding action will go here
+# every available command and the name of its corresponding action class
+# will go here. The class (and its module) is only imported when docopt
+# picks that command, see `mlt.commands.COMMAND_MODULES`
 COMMAND_MAP = (
-    ('build', BuildCommand),
-    ('template_config', TemplateConfigCommand),
-    ('deploy', DeployCommand),
-    ('init', InitCommand),
-    ('status', StatusCommand),
-    ('sync', SyncCommand),
-    ('template', TemplatesCommand),
-    ('templates', TemplatesCommand),
-    ('update-template', UpdateTemplateCommand),
-    ('undeploy', UndeployCommand),
-    ('log', LogsCommand),
-    ('logs', LogsCommand),
-    ('events', EventsCommand)
+    ('build', 'BuildCommand'),
+    ('template_config', 'TemplateConfigCommand'),
+    ('deploy', 'DeployCommand'),
+    ('init', 'InitCommand'),
+    ('status', 'StatusCommand'),
+    ('sync', 'SyncCommand'),
+    ('template', 'TemplatesCommand'),
+    ('templates', 'TemplatesCommand'),
+    ('update-template', 'UpdateTemplateCommand'),
+    ('undeploy', 'UndeployCommand'),
+    ('log', 'LogsCommand'),
+    ('logs', 'LogsCommand'),
+    ('events', 'EventsCommand')
 )
 
 
 def run_command(args):
     """maps params from docopt into mlt commands"""
-    for command, CommandClass in COMMAND_MAP:
+    for command, class_name in COMMAND_MAP:
         if args[command]:
-            CommandClass(args).action()
+            trace = os.environ.get(tracing.TRACE_ENV)
+            if args.get('--trace') or trace:
+                tracing.start(tracing.trace_path(command, trace))
+            try:
+                with tracing.span(command):
+                    load_command(class_name)(args).action()
+            finally:
+                path = tracing.finish()
+                if path:
+                    print("Trace written to {}".format(path))
             return
 
 
@@ -171,8 +216,18 @@ def sanitize_input(args, regex=None):
     # docopt doesn't support type assignment:
     # https://github.com/docopt/docopt/issues/8
     args['--retries'] = int(args['--retries'])
+    args['--timeout'] = float(args.get('--timeout') or args['--retries'])
     if args['<count>']:
         args['<count>'] = int(args['<count>'])
+    if args.get('--parallel'):
+        args['--parallel'] = int(args['--parallel'])
+    if args.get('--sweep'):
+        args['--sweep'] = config_helpers.parse_sweeps(args['--sweep'])
+        # a sweep deploys several jobs, none of them is the one to follow
+        if any(args.get(flag) for flag in (
+                '--wait', '--report', '--logs', '--interactive')):
+            raise ValueError("--sweep can't be combined with --wait, "
+                             "--report, --logs or --interactive.")
 
     # verify that the specified namespace is valid
     if args['--namespace'] and not regex_checks.k8s_name_is_valid(
@@ -18,12 +18,11 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-import os
-
 from mlt.commands.build import BuildCommand
+from mlt.utils import files
 
 
 def verify_build(args):
-    """runs a full build if no build json file"""
-    if not os.path.isfile('.build.json'):
+    """runs a full build if no image was built yet"""
+    if files.fetch_action_arg('build', 'last_container') is None:
         BuildCommand(args).action()
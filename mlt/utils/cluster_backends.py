@@ -0,0 +1,696 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+Cluster backends. Everything mlt reads from or writes to kubernetes goes
+through a backend, which either talks to the API server directly over a pool
+of keep-alive connections (`ApiServerBackend`) or spawns `kubectl`
+(`KubectlBackend`).
+
+`MLT_CLUSTER_BACKEND` picks the backend: `api`, `kubectl` or `auto` (the
+default), which uses the API server unless the kubeconfig relies on auth
+plugins (`exec`, `auth-provider`) that only kubectl knows how to run.
+"""
+
+import base64
+import json
+import math
+import os
+import socket
+import ssl
+import tempfile
+import threading
+import time
+import yaml
+from subprocess import PIPE
+
+try:
+    import http.client as httplib
+    from urllib.parse import quote, urlencode, urlparse
+    from urllib.request import getproxies, proxy_bypass
+except ImportError:  # python 2
+    import httplib
+    from urllib import getproxies, proxy_bypass, quote, urlencode
+    from urlparse import urlparse
+
+from mlt.utils import process_helpers
+
+BACKEND_ENV = 'MLT_CLUSTER_BACKEND'
+BACKENDS = ('auto', 'api', 'kubectl')
+
+# idle connections to the API server that are kept open for reuse
+POOL_SIZE = 8
+REQUEST_TIMEOUT = 60
+
+SERVICE_ACCOUNT_DIR = '/var/run/secrets/kubernetes.io/serviceaccount'
+
+# owner of the fields `ApiServerBackend.apply` sets with server-side apply
+FIELD_MANAGER = 'mlt'
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+class ClusterError(Exception):
+    def __init__(self, message, status=None):
+        super(ClusterError, self).__init__(message)
+        self.status = status
+
+
+class NotFound(ClusterError):
+    pass
+
+
+class KubeConfigError(Exception):
+    """the kubeconfig can't be used to talk to the API server directly"""
+    pass
+
+
+def get_backend():
+    """returns the cluster backend, created once per process"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = _create_backend(os.environ.get(BACKEND_ENV, 'auto'))
+        return _backend
+
+
+def _create_backend(choice):
+    if choice not in BACKENDS:
+        raise ValueError("{} must be one of {}, not `{}`".format(
+            BACKEND_ENV, ', '.join(BACKENDS), choice))
+    if choice != 'kubectl':
+        try:
+            config = load_kube_config()
+            if _proxied(config.server):
+                # kubectl goes through the proxy, the connections of
+                # `ApiServerBackend` don't
+                raise KubeConfigError("requests to {} go through a "
+                                      "proxy".format(config.server))
+            return ApiServerBackend(config)
+        except KubeConfigError:
+            if choice == 'api':
+                raise
+    return KubectlBackend()
+
+
+def _proxied(server):
+    """whether the environment's `HTTPS_PROXY` or `HTTP_PROXY` applies to
+       `server`, i.e. it isn't in `NO_PROXY`
+    """
+    url = urlparse(server)
+    return bool(getproxies().get(url.scheme)) and \
+        not proxy_bypass(url.hostname)
+
+
+def load_kube_config(path=None):
+    """reads the current context of the kubeconfig, or the in-cluster
+       service account config when there is no kubeconfig
+    """
+    if path is None:
+        paths = [p for p in os.environ.get('KUBECONFIG', '').split(os.pathsep)
+                 if p] or [os.path.expanduser('~/.kube/config')]
+        path = next((p for p in paths if os.path.isfile(p)), None)
+    if path is None:
+        return _in_cluster_config()
+
+    with open(path) as f:
+        config = yaml.safe_load(f) or {}
+    context_name = config.get('current-context')
+    context = _named(config, 'contexts', context_name)
+    cluster = _named(config, 'clusters', context.get('cluster'))
+    user = _named(config, 'users', context.get('user'))
+    for plugin in ('exec', 'auth-provider'):
+        if plugin in user:
+            raise KubeConfigError(
+                "context `{}` uses `{}` authentication".format(
+                    context_name, plugin))
+    if not cluster.get('server'):
+        raise KubeConfigError(
+            "context `{}` has no cluster server".format(context_name))
+    if cluster.get('proxy-url'):
+        raise KubeConfigError(
+            "context `{}` uses a proxy".format(context_name))
+
+    config_dir = os.path.dirname(os.path.abspath(path))
+    token = user.get('token')
+    if not token and user.get('tokenFile'):
+        token = _read_file_or_data(config_dir, user, 'tokenFile')
+    return KubeConfig(
+        server=cluster['server'], context=context_name,
+        namespace=context.get('namespace'),
+        ca=_read_file_or_data(config_dir, cluster, 'certificate-authority'),
+        insecure=cluster.get('insecure-skip-tls-verify', False),
+        token=token,
+        client_cert=_read_file_or_data(config_dir, user, 'client-certificate'),
+        client_key=_read_file_or_data(config_dir, user, 'client-key'),
+        username=user.get('username'), password=user.get('password'))
+
+
+def _named(config, section, name):
+    """the entry called `name` in a kubeconfig list like `clusters`"""
+    for entry in config.get(section) or []:
+        if entry.get('name') == name:
+            # every entry nests its settings, e.g. `cluster:` in `clusters`
+            return entry.get(section[:-1]) or {}
+    if section == 'users':
+        return {}
+    raise KubeConfigError("no {} `{}` in kubeconfig".format(
+        section[:-1], name))
+
+
+def _read_file_or_data(config_dir, section, key):
+    """kubeconfig credentials are either inline as base64 `<key>-data` or
+       a path (relative to the kubeconfig) under `<key>`
+    """
+    if section.get(key + '-data'):
+        return base64.b64decode(section[key + '-data'])
+    if section.get(key):
+        with open(os.path.join(config_dir, section[key]), 'rb') as f:
+            return f.read().strip() if key == 'tokenFile' else f.read()
+    return None
+
+
+def _in_cluster_config():
+    host = os.environ.get('KUBERNETES_SERVICE_HOST')
+    token_file = os.path.join(SERVICE_ACCOUNT_DIR, 'token')
+    if not host or not os.path.isfile(token_file):
+        raise KubeConfigError("no kubeconfig found")
+    config = {'tokenFile': token_file, 'certificate-authority': os.path.join(
+        SERVICE_ACCOUNT_DIR, 'ca.crt')}
+    return KubeConfig(
+        server='https://{}:{}'.format(
+            host, os.environ.get('KUBERNETES_SERVICE_PORT', 443)),
+        context='in-cluster',
+        token=_read_file_or_data('', config, 'tokenFile'),
+        ca=_read_file_or_data('', config, 'certificate-authority'))
+
+
+class KubeConfig(object):
+    """how to reach and authenticate against an API server
+       certificates and keys are PEM bytes
+    """
+    def __init__(self, server, context=None, namespace=None, ca=None,
+                 insecure=False, token=None, client_cert=None,
+                 client_key=None, username=None, password=None):
+        self.server = server
+        self.context = context
+        self.namespace = namespace
+        self.ca = ca
+        self.insecure = insecure
+        self.token = token.decode('utf-8') if isinstance(
+            token, bytes) else token
+        self.client_cert = client_cert
+        self.client_key = client_key
+        self.username = username
+        self.password = password
+
+
+def list_to_objects(docs):
+    """flattens `kind: List` docs into the objects they hold"""
+    objects = []
+    for doc in docs:
+        if not isinstance(doc, dict):
+            continue
+        if doc.get('kind', '').endswith('List') and 'items' in doc:
+            objects.extend(list_to_objects(doc['items']))
+        else:
+            objects.append(doc)
+    return objects
+
+
+def _readline(response):
+    """the next line of a streamed response. Python 2's `HTTPResponse` has
+       no `readline`, its `read` still takes care of the chunked encoding.
+    """
+    if hasattr(response, 'readline'):
+        return response.readline()
+    line = b''
+    while not line.endswith(b'\n'):
+        byte = response.read(1)
+        if not byte:
+            break
+        line += byte
+    return line
+
+
+class ApiServerBackend(object):
+    """talks to the API server in-process, reusing connections between
+       requests and threads so each call doesn't pay for a new TLS handshake
+    """
+    name = 'api'
+
+    def __init__(self, config, pool_size=POOL_SIZE):
+        self.config = config
+        self.context = config.context
+        server = urlparse(config.server)
+        self._secure = server.scheme == 'https'
+        self._host = server.hostname
+        self._port = server.port or (443 if self._secure else 80)
+        self._prefix = server.path.rstrip('/')
+        self._ssl_context = self._create_ssl_context() \
+            if self._secure else None
+
+        self._headers = {'Accept': 'application/json'}
+        if config.token:
+            self._headers['Authorization'] = 'Bearer {}'.format(config.token)
+        elif config.username:
+            credentials = '{}:{}'.format(
+                config.username, config.password or '')
+            self._headers['Authorization'] = 'Basic {}'.format(
+                base64.b64encode(credentials.encode('utf-8')).decode('ascii'))
+
+        self._pool_size = pool_size
+        self._idle = []
+        self._pool_lock = threading.Lock()
+        # discovered resources per group version, e.g. `apps/v1`
+        self._api_resources = {}
+        self._resource_paths = {}
+        self._discovery_lock = threading.Lock()
+
+    def _create_ssl_context(self):
+        context = ssl.create_default_context(
+            cadata=self.config.ca.decode('ascii') if self.config.ca else None)
+        if self.config.insecure:
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        if self.config.client_cert:
+            # `load_cert_chain` only takes paths, so inline credentials have
+            # to go through temporary files
+            paths = []
+            try:
+                for pem in (self.config.client_cert, self.config.client_key):
+                    fd, path = tempfile.mkstemp()
+                    paths.append(path)
+                    with os.fdopen(fd, 'wb') as f:
+                        f.write(pem or b'')
+                context.load_cert_chain(paths[0], paths[1] if
+                                        self.config.client_key else None)
+            finally:
+                for path in paths:
+                    os.remove(path)
+        return context
+
+    def close(self):
+        with self._pool_lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    # connection pool
+
+    def _connect(self, timeout=REQUEST_TIMEOUT):
+        if self._secure:
+            return httplib.HTTPSConnection(
+                self._host, self._port, timeout=timeout,
+                context=self._ssl_context)
+        return httplib.HTTPConnection(self._host, self._port, timeout=timeout)
+
+    def _checkout(self):
+        """returns (connection, whether it was reused)"""
+        with self._pool_lock:
+            if self._idle:
+                return self._idle.pop(), True
+        return self._connect(), False
+
+    def _checkin(self, conn):
+        with self._pool_lock:
+            if len(self._idle) < self._pool_size:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _build_url(self, path, params=None):
+        url = self._prefix + path
+        params = sorted((k, v) for k, v in (params or {}).items()
+                        if v is not None)
+        if params:
+            url += '?' + urlencode(params)
+        return url
+
+    def request(self, method, path, params=None, body=None,
+                content_type='application/json'):
+        """makes a request and returns the decoded json response"""
+        return self._request(method, path, params, body, content_type)[1]
+
+    def _request(self, method, path, params=None, body=None,
+                 content_type='application/json'):
+        """makes a request, returns its status and decoded json response"""
+        url = self._build_url(path, params)
+        headers = dict(self._headers)
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = content_type
+
+        while True:
+            conn, reused = self._checkout()
+            try:
+                conn.request(method, url, body, headers)
+                response = conn.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                # the server may have closed an idle keep-alive connection,
+                # which only shows when we use it; retry on a new one
+                if reused:
+                    continue
+                raise ClusterError("{} {} failed: {}".format(
+                    method, url, e))
+            break
+
+        if response.getheader('connection', '').lower() == 'close':
+            conn.close()
+        else:
+            self._checkin(conn)
+        return response.status, self._decode(
+            method, url, response.status, data)
+
+    @staticmethod
+    def _decode(method, url, status, data):
+        try:
+            data = json.loads(data.decode('utf-8')) if data else {}
+        except ValueError:
+            data = {'message': data.decode('utf-8', 'replace')}
+        if status >= 400:
+            message = data.get('message') or "{} {} returned {}".format(
+                method, url, status)
+            raise (NotFound if status == 404 else ClusterError)(
+                message, status)
+        return data
+
+    # resource discovery
+
+    def _resources_of(self, group_version):
+        with self._discovery_lock:
+            if group_version not in self._api_resources:
+                prefix = '/api/' if group_version == 'v1' else '/apis/'
+                try:
+                    resources = self.request(
+                        'GET', prefix + group_version)['resources']
+                except NotFound:
+                    resources = []
+                # skip subresources like `pods/log`
+                self._api_resources[group_version] = [
+                    r for r in resources if '/' not in r['name']]
+            return self._api_resources[group_version]
+
+    def _group_versions(self):
+        """core `v1` first, then the preferred version of every api group"""
+        yield 'v1'
+        for group in self.request('GET', '/apis').get('groups', []):
+            yield group['preferredVersion']['groupVersion']
+
+    @staticmethod
+    def _path(group_version, resource):
+        """(api path, plural name, whether it's namespaced)"""
+        base = '/api/v1' if group_version == 'v1' else \
+            '/apis/' + group_version
+        return base, resource['name'], resource['namespaced']
+
+    def _resource_path(self, resource):
+        """finds where a resource lives; `resource` can be anything kubectl
+           accepts: plural, singular, short name or kind, e.g. `tfjob`
+        """
+        if resource not in self._resource_paths:
+            resource_name = resource.lower()
+            for group_version in self._group_versions():
+                for r in self._resources_of(group_version):
+                    names = [r['name'], r.get('singularName'),
+                             r['kind'].lower()] + r.get('shortNames', [])
+                    if resource_name in names:
+                        self._resource_paths[resource] = self._path(
+                            group_version, r)
+                        break
+                if resource in self._resource_paths:
+                    break
+            else:
+                raise ClusterError(
+                    "the server doesn't have a resource type `{}`".format(
+                        resource))
+        return self._resource_paths[resource]
+
+    def _kind_path(self, api_version, kind):
+        for r in self._resources_of(api_version):
+            if r['kind'] == kind:
+                return self._path(api_version, r)
+        raise ClusterError("no matches for kind `{}` in version `{}`".format(
+            kind, api_version))
+
+    @staticmethod
+    def _url(base, plural, namespaced, namespace, name=None):
+        url = base
+        if namespaced and namespace:
+            url += '/namespaces/' + quote(namespace)
+        url += '/' + plural
+        if name:
+            url += '/' + quote(name)
+        return url
+
+    # backend interface
+
+    def get(self, resource, name, namespace=None):
+        """returns the object or None if it doesn't exist"""
+        try:
+            return self.request('GET', self._url(
+                *self._resource_path(resource), namespace=namespace,
+                name=name))
+        except NotFound:
+            return None
+
+    def list(self, resource, namespace=None, label_selector=None,
+             field_selector=None):
+        return self.request(
+            'GET', self._url(*self._resource_path(resource),
+                             namespace=namespace),
+            params={'labelSelector': label_selector,
+                    'fieldSelector': field_selector}).get('items') or []
+
+    def watch(self, resource, namespace=None, label_selector=None,
+              field_selector=None, timeout=None):
+        """yields (event type, object) as objects change, starting with an
+           `ADDED` event for every object that already exists
+           timeout: seconds after which the watch ends
+        """
+        deadline = time.time() + timeout if timeout else None
+        url = self._build_url(
+            self._url(*self._resource_path(resource), namespace=namespace),
+            params={'watch': 'true', 'labelSelector': label_selector,
+                    'fieldSelector': field_selector,
+                    'timeoutSeconds': int(math.ceil(timeout))
+                    if timeout else None})
+        # a watch holds its connection open, so it doesn't come from the pool
+        conn = self._connect(timeout=timeout or None)
+        try:
+            try:
+                conn.request('GET', url, headers=self._headers)
+                # the connection lets go of its socket when the response
+                # closes the connection, the response keeps reading from it.
+                # Python 2 swaps the wrapped socket out on close, hold on to
+                # the one underneath
+                sock = getattr(conn.sock, '_sock', conn.sock)
+                response = conn.getresponse()
+            except (httplib.HTTPException, socket.error) as e:
+                raise ClusterError("watch {} failed: {}".format(url, e))
+            if response.status >= 400:
+                self._decode('GET', url, response.status, response.read())
+
+            while True:
+                if deadline:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return
+                    sock.settimeout(remaining)
+                try:
+                    line = _readline(response)
+                except (httplib.HTTPException, socket.error):
+                    # timed out, or the server ended the watch
+                    return
+                if not line:
+                    return
+                if not line.strip():
+                    continue
+                event = json.loads(line.decode('utf-8'))
+                if event['type'] == 'ERROR':
+                    raise ClusterError(event['object'].get('message'),
+                                       event['object'].get('code'))
+                yield event['type'], event['object']
+        finally:
+            conn.close()
+
+    def create(self, resource, obj, namespace=None):
+        return self.request('POST', self._url(
+            *self._resource_path(resource), namespace=namespace), body=obj)
+
+    def apply(self, objects, namespace):
+        """creates or updates the objects with server-side apply, like
+           `kubectl apply --server-side --force-conflicts`: fields left out
+           of an object are removed and lists like `containers` are merged by
+           their keys. API servers too old for it (before 1.16) have the
+           objects applied by kubectl. Returns what happened to each object.
+        """
+        results = []
+        unsupported = []
+        for obj in list_to_objects(objects):
+            base, plural, namespaced = self._kind_path(
+                obj['apiVersion'], obj['kind'])
+            obj_namespace = obj['metadata'].get('namespace') or namespace
+            name = obj['metadata']['name']
+            try:
+                status, _ = self._request(
+                    'PATCH', self._url(base, plural, namespaced,
+                                       obj_namespace, name=name),
+                    params={'fieldManager': FIELD_MANAGER, 'force': 'true'},
+                    body=obj, content_type='application/apply-patch+yaml')
+            except ClusterError as e:
+                if e.status != 415:
+                    raise
+                unsupported.append(obj)
+                continue
+            results.append({'kind': obj['kind'].lower(), 'name': name,
+                            'result': 'created' if status == 201
+                            else 'configured'})
+        if unsupported:
+            results.extend(KubectlBackend().apply(unsupported, namespace))
+        return results
+
+
+class KubectlBackend(object):
+    """fallback that spawns kubectl for every call"""
+    name = 'kubectl'
+
+    def __init__(self):
+        self._context = None
+
+    @property
+    def context(self):
+        if self._context is None:
+            try:
+                self._context = self._kubectl(
+                    ['config', 'current-context']).strip()
+            except ClusterError:
+                self._context = ''
+        return self._context
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def _kubectl(args, namespace=None, stdin=None):
+        command = ['kubectl'] + args
+        if namespace:
+            command += ['--namespace', namespace]
+        proc = process_helpers.run_popen(
+            command, stdin=PIPE if stdin is not None else None)
+        out, err = proc.communicate(
+            stdin.encode('utf-8') if stdin is not None else None)
+        if proc.returncode != 0:
+            err = err.decode('utf-8').strip()
+            raise (NotFound if 'NotFound' in err else ClusterError)(err)
+        return out.decode('utf-8')
+
+    def get(self, resource, name, namespace=None):
+        try:
+            return json.loads(self._kubectl(
+                ['get', resource, name, '-o', 'json'], namespace))
+        except NotFound:
+            return None
+
+    @staticmethod
+    def _get_args(resource, label_selector, field_selector):
+        args = ['get', resource, '-o', 'json']
+        if resource in ('pod', 'pods', 'po'):
+            # older kubectl hides completed pods without this
+            args.append('--show-all')
+        if label_selector:
+            args += ['-l', label_selector]
+        if field_selector:
+            args += ['--field-selector', field_selector]
+        return args
+
+    def list(self, resource, namespace=None, label_selector=None,
+             field_selector=None):
+        args = self._get_args(resource, label_selector, field_selector)
+        return json.loads(self._kubectl(args, namespace)).get('items') or []
+
+    def watch(self, resource, namespace=None, label_selector=None,
+              field_selector=None, timeout=None):
+        """yields (event type, object) as objects change, see
+           `ApiServerBackend.watch`
+        """
+        command = ['kubectl'] + self._get_args(
+            resource, label_selector, field_selector) + ['--watch']
+        if namespace:
+            command += ['--namespace', namespace]
+        proc = process_helpers.run_popen(command)
+        timer = threading.Timer(timeout, proc.kill) if timeout else None
+        if timer:
+            timer.start()
+        try:
+            # `kubectl get -w -o json` writes one json document after the
+            # other; newer versions wrap them as {"type": .., "object": ..}
+            decoder = json.JSONDecoder()
+            buffered = ''
+            seen = set()
+            for line in iter(proc.stdout.readline, b''):
+                buffered += line.decode('utf-8')
+                while buffered.strip():
+                    try:
+                        doc, end = decoder.raw_decode(buffered.lstrip())
+                    except ValueError:
+                        break  # the document isn't complete yet
+                    buffered = buffered.lstrip()[end:]
+                    if 'type' in doc and 'object' in doc:
+                        events = [(doc['type'], doc['object'])]
+                    else:
+                        events = [(None, obj) for obj in list_to_objects(
+                            [doc])]
+                    for event_type, obj in events:
+                        name = obj['metadata']['name']
+                        if event_type is None:
+                            event_type = 'MODIFIED' if name in seen \
+                                else 'ADDED'
+                        seen.add(name)
+                        yield event_type, obj
+        finally:
+            if timer:
+                timer.cancel()
+            if proc.poll() is None:
+                proc.kill()
+            proc.wait()
+
+    def create(self, resource, obj, namespace=None):
+        return json.loads(self._kubectl(
+            ['create', '-f', '-', '-o', 'json'], namespace,
+            stdin=json.dumps(obj)))
+
+    def apply(self, objects, namespace):
+        out = self._kubectl(
+            ['apply', '-f', '-'], namespace, stdin=json.dumps(
+                {'apiVersion': 'v1', 'kind': 'List',
+                 'items': list_to_objects(objects)}))
+        # each line looks like `tfjob.kubeflow.org/name created`
+        results = []
+        for line in out.splitlines():
+            obj, _, result = line.strip().partition(' ')
+            kind, _, name = obj.partition('/')
+            if name:
+                results.append({'kind': kind.split('.')[0], 'name': name,
+                                'result': result})
+        return results
@@ -18,12 +18,15 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import itertools
 import json
 import os
 import sys
-from mlt.utils import constants
+from collections import OrderedDict
+from mlt.utils import constants, tracing
 
 
+@tracing.traced('config load')
 def load_config():
     """stores mlt.json data in self.config"""
     if os.path.isfile(constants.MLT_CONFIG):
@@ -59,3 +62,72 @@ def get_template_parameters(config_dict):
     config.  Otherwise, returns empty dictionary.
     """
     return config_dict.get(constants.TEMPLATE_PARAMETERS, {})
+
+
+def parse_sweeps(sweeps):
+    """
+    Returns the (name, values) of every `name=value1,value2,...` template
+    parameter sweep, in the order given.  Raises ValueError if a sweep isn't
+    of that form or a parameter is swept more than once.
+    """
+    parsed = []
+    for sweep in sweeps:
+        name, _, values = sweep.partition('=')
+        name = name.strip()
+        values = [value.strip() for value in values.split(',')]
+        if not name or not all(values):
+            raise ValueError("Sweep {} not valid, it must be of the form "
+                             "name=value1,value2,...".format(sweep))
+        if name in [swept for swept, _ in parsed]:
+            raise ValueError("Template parameter {} is swept more than "
+                             "once".format(name))
+        parsed.append((name, values))
+    return parsed
+
+
+def sweep_combinations(sweeps):
+    """
+    Returns the template parameter overrides of every combination of the
+    values of `sweeps`, as returned by `parse_sweeps`, with the values of the
+    last parameter changing fastest.
+    """
+    names = [name for name, _ in sweeps]
+    return [OrderedDict(zip(names, values)) for values in
+            itertools.product(*[values for _, values in sweeps])]
+
+
+def get_build_variants_from_file(file_path):
+    """ Returns the build variants declared in the specified file """
+    variants = {}
+    if os.path.isfile(file_path):
+        with open(file_path) as f:
+            variants = get_build_variants(json.load(f))
+
+    return variants
+
+
+def get_build_variants(config_dict):
+    """
+    Returns dictionary of build variant names to the environment variables
+    `make build` is run with for them, if the config declares any.
+    Otherwise, returns empty dictionary.
+    """
+    return config_dict.get(constants.BUILD_VARIANTS, {})
+
+
+def get_build_variant(config_dict):
+    """
+    Returns the name of the build variant to deploy: the `build_variant`
+    template parameter, or else the first variant by name.  Returns None if
+    the config declares no variants.
+    """
+    variants = get_build_variants(config_dict)
+    if not variants:
+        return None
+    name = get_template_parameters(config_dict).get(
+        constants.BUILD_VARIANT) or sorted(variants)[0]
+    if name not in variants:
+        print("Unknown build variant {}, expected one of: {}".format(
+            name, ", ".join(sorted(variants))))
+        sys.exit(1)
+    return name
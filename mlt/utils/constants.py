@@ -33,3 +33,13 @@ TEMPLATE_PARAMETERS = "template_parameters"
 
 # Location of kuberentes debug wrapper file
 DEBUG_WRAPPER_FILE = "mlt/utils/kubernetes_debug_wrapper.py"
+
+# Directory and database file of the project state store
+STATE_DIR = ".mlt"
+STATE_DB = "state.db"
+
+# Name of config file section that has the template's build variants
+BUILD_VARIANTS = "build_variants"
+
+# Template parameter that selects the build variant to deploy
+BUILD_VARIANT = "build_variant"
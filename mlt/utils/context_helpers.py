@@ -0,0 +1,199 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+
+"""
+The build context of a project, the files `docker build .` gets sent, a
+hash of it to tag images by their content, and how big it is.
+"""
+
+import hashlib
+import json
+import os
+import stat
+
+from mlt.utils import state
+from mlt.utils.ignore_helpers import IgnoreRules, walk
+
+# never part of what an image is built from, even if docker is sent them:
+# git's and mlt's state, and the job specs `mlt deploy` renders
+STATE_PATTERNS = ('.git', '.mlt', '/k8s')
+
+DOCKERIGNORE = '.dockerignore'
+
+# the part of a .dockerignore that `update_dockerignore` maintains
+BLOCK_START = '# BEGIN mlt'
+BLOCK_END = '# END mlt'
+
+# how many of the largest files and directories `context_size` reports
+LARGEST_CONTRIBUTORS = 5
+
+
+def ignore_rules(directory='.'):
+    """rules deciding which files of `directory` are in its build context:
+       its .dockerignore, or its .gitignore if there is none, as files that
+       aren't committed are taken to not matter to the image
+    """
+    dockerignore = os.path.join(directory, DOCKERIGNORE)
+    if os.path.isfile(dockerignore):
+        rules = IgnoreRules.from_file(dockerignore, 'dockerignore')
+    else:
+        rules = IgnoreRules.from_file(os.path.join(directory, '.gitignore'))
+    for pattern in STATE_PATTERNS:
+        rules.add(pattern)
+    return rules
+
+
+def _file_digest(path):
+    if os.path.islink(path):
+        return hashlib.sha256(
+            os.readlink(path).encode('utf-8')).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def context_hash(directory='.', dockerfile='Dockerfile', build_args=None):
+    """sha256 of the build context of `directory`, its `dockerfile` and the
+       `build_args`. The digests of files are remembered in the state store
+       by size and modification time, so only changed files are read again.
+    """
+    store = state.get_store(directory)
+    known = store.get_cached('context', 'files') or {}
+    files = {}
+    digest = hashlib.sha256()
+    for path in walk(directory, ignore_rules(directory)) + [dockerfile]:
+        full_path = os.path.join(directory, path)
+        if path in files or not os.path.lexists(full_path):
+            continue
+        info = os.lstat(full_path)
+        signature = [info.st_size, info.st_mtime, info.st_mode]
+        if known.get(path, [])[:3] == signature:
+            file_digest = known[path][3]
+        else:
+            file_digest = _file_digest(full_path)
+        files[path] = signature + [file_digest]
+        digest.update(json.dumps(
+            [path, stat.S_IMODE(info.st_mode), file_digest]).encode('utf-8'))
+    digest.update(json.dumps(build_args or {}, sort_keys=True).encode(
+        'utf-8'))
+    store.set_cached('context', 'files', files)
+    return digest.hexdigest()
+
+
+def content_tag(digest):
+    """image tag for a `context_hash`"""
+    return 'sha-{}'.format(digest[:16])
+
+
+def dockerignore_patterns(lines, prefix=''):
+    """the .gitignore `lines` of the directory `prefix` as .dockerignore
+       patterns, which are all relative to the root of the build context
+    """
+    patterns = []
+    for line in lines:
+        pattern = line.rstrip()
+        if not pattern or pattern.startswith('#'):
+            continue
+        negated = pattern.startswith('!')
+        pattern = pattern.lstrip('!').rstrip('/')
+        if not pattern:
+            continue
+        if '/' not in pattern and not pattern.startswith('**'):
+            # matches at any depth below the .gitignore
+            pattern = '**/' + pattern
+        pattern = prefix + pattern.lstrip('/')
+        patterns.append('!' + pattern if negated else pattern)
+    return patterns
+
+
+def _gitignore_patterns(directory):
+    """.dockerignore patterns of every .gitignore in `directory` git reads,
+       those in ignored directories don't count
+    """
+    rules = IgnoreRules.from_file(os.path.join(directory, '.gitignore'))
+    for pattern in STATE_PATTERNS:
+        rules.add(pattern)
+    patterns = []
+    for path in walk(directory, rules):
+        if path.split('/')[-1] == '.gitignore':
+            with open(os.path.join(directory, path)) as f:
+                patterns.extend(dockerignore_patterns(
+                    f.read().splitlines(), path[:-len('.gitignore')]))
+    return patterns
+
+
+def update_dockerignore(directory='.'):
+    """writes a .dockerignore leaving what git and mlt ignore out of the
+       build context, or updates the part of it that mlt wrote before. A
+       .dockerignore without that part is the user's own and left alone.
+       Returns whether the file changed.
+    """
+    path = os.path.join(directory, DOCKERIGNORE)
+    lines = []
+    if os.path.isfile(path):
+        with open(path) as f:
+            lines = f.read().splitlines()
+        if BLOCK_START not in lines:
+            return False
+    start = lines.index(BLOCK_START) if lines else 0
+    end = lines.index(BLOCK_END) + 1 if BLOCK_END in lines[start:] \
+        else len(lines)
+    block = [BLOCK_START,
+             '# derived from .gitignore by `mlt build`, edit outside of '
+             'this block',
+             ] + [pattern.lstrip('/') for pattern in STATE_PATTERNS] + \
+        _gitignore_patterns(directory) + [BLOCK_END]
+    updated = lines[:start] + block + lines[end:]
+    if updated == lines:
+        return False
+    with open(path, 'w') as f:
+        f.write('\n'.join(updated) + '\n')
+    return True
+
+
+def context_size(directory='.'):
+    """size in bytes of what `docker build` sends of `directory`, which is
+       everything its .dockerignore doesn't leave out, and its largest
+       top level files and directories as (path, size), biggest first
+    """
+    rules = IgnoreRules.from_file(os.path.join(directory, DOCKERIGNORE),
+                                  'dockerignore')
+    total, sizes = 0, {}
+    for path in walk(directory, rules):
+        size = os.lstat(os.path.join(directory, path)).st_size
+        top, _, below = path.partition('/')
+        top += '/' if below else ''
+        sizes[top] = sizes.get(top, 0) + size
+        total += size
+    largest = sorted(sizes.items(), key=lambda item: (-item[1], item[0]))
+    return total, largest[:LARGEST_CONTRIBUTORS]
+
+
+def format_size(size):
+    """`size` bytes in the largest unit that keeps it above 1"""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024.0
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' \
+        else '{} B'.format(size)
@@ -0,0 +1,181 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+
+import collections
+import json
+import re
+import time
+
+from mlt.utils import process_helpers
+
+# how many of the last lines of a build's output `BuildOutput` keeps
+OUTPUT_LINES = 500
+
+# a step of the classic builder's output, and the line telling it was cached
+STEP = re.compile(r'^Step \d+/\d+ : (.*)$')
+STEP_CACHED = ' ---> Using cache'
+# a step of BuildKit's plain progress output, `#<id> [<stage> <n>/<m>] ...`,
+# `#<id> CACHED` and `#<id> DONE <seconds>s`
+BUILDKIT_STEP = re.compile(r'^#(\d+) \[(?:[^\]]* )?\d+/\d+\] (.*)$')
+BUILDKIT_CACHED = re.compile(r'^#(\d+) CACHED$')
+BUILDKIT_DONE = re.compile(r'^#(\d+) DONE (\d+(?:\.\d+)?)s$')
+
+
+def image_exists(image):
+    """whether docker has `image` locally"""
+    return process_helpers.run_popen(
+        ['docker', 'image', 'inspect', image],
+        stdout=False, stderr=False).wait() == 0
+
+
+def image_id(image):
+    """id of the local `image`, the digest of its config, None if there's no
+       such image
+    """
+    proc = process_helpers.run_popen(
+        ['docker', 'image', 'inspect', '--format', '{{.Id}}', image])
+    out, _ = proc.communicate()
+    if proc.returncode != 0:
+        return None
+    return out.decode('utf-8').strip() or None
+
+
+def repo_digest(image):
+    """digest of the manifest `image` was pushed with, as docker remembers
+       it after the push, None if it wasn't pushed
+    """
+    proc = process_helpers.run_popen(
+        ['docker', 'image', 'inspect', '--format', '{{json .RepoDigests}}',
+         image])
+    out, _ = proc.communicate()
+    if proc.returncode != 0:
+        return None
+    for name in json.loads(out.decode('utf-8')) or []:
+        name, _, digest = name.partition('@')
+        if name == repository(image):
+            return digest
+    return None
+
+
+def repository(image):
+    """`image` without its tag or digest"""
+    image = image.partition('@')[0]
+    name, colon, tag = image.rpartition(':')
+    return name if colon and '/' not in tag else image
+
+
+def pinned(image, digest):
+    """reference to the exact content `digest` of `image`, which nothing
+       pushed to its tag later changes
+    """
+    return '{}@{}'.format(repository(image), digest)
+
+
+def pull(image):
+    """pulls `image`, returns whether it could"""
+    return process_helpers.run_popen(
+        ['docker', 'pull', image], stdout=False, stderr=False).wait() == 0
+
+
+def push(image):
+    """pushes `image` without printing anything, returns whether it could"""
+    return process_helpers.run_popen(
+        ['docker', 'push', image], stdout=False, stderr=False).wait() == 0
+
+
+class BuildOutput(object):
+    """the last `size` lines of the output of a `docker build`, as it is
+       read, and the steps the build went through: their instruction, when
+       they started, how long they took if docker said so, and whether the
+       layer cache had them. Pass it to `process_helpers.prevent_deadlock`
+       of a build started with `stderr=STDOUT`, BuildKit writes its progress
+       to stderr.
+    """
+
+    def __init__(self, size=OUTPUT_LINES, clock=None):
+        self.lines = collections.deque(maxlen=size)
+        self.clock = clock or time.time
+        # [instruction, started, seconds, cached]
+        self.steps = []
+        self._buildkit_steps = {}
+        # when the build exited, set by whoever waited for it
+        self.finished = None
+
+    def append(self, line):
+        self.lines.append(line)
+        if isinstance(line, bytes):
+            line = line.decode('utf-8', 'replace')
+        line = line.rstrip()
+        step = STEP.match(line)
+        buildkit_step = BUILDKIT_STEP.match(line)
+        buildkit_cached = BUILDKIT_CACHED.match(line)
+        buildkit_done = BUILDKIT_DONE.match(line)
+        if step:
+            self.steps.append([step.group(1), self.clock(), None, False])
+        elif line.startswith(STEP_CACHED) and self.steps:
+            self.steps[-1][3] = True
+        elif buildkit_step and \
+                buildkit_step.group(1) not in self._buildkit_steps:
+            self._buildkit_steps[buildkit_step.group(1)] = len(self.steps)
+            self.steps.append(
+                [buildkit_step.group(2), self.clock(), None, False])
+        elif buildkit_cached and \
+                buildkit_cached.group(1) in self._buildkit_steps:
+            self.steps[self._buildkit_steps[buildkit_cached.group(1)]][3] = \
+                True
+        elif buildkit_done and buildkit_done.group(1) in self._buildkit_steps:
+            self.steps[self._buildkit_steps[buildkit_done.group(1)]][2] = \
+                float(buildkit_done.group(2))
+
+    def text(self):
+        """the lines kept, joined"""
+        return b''.join(line if isinstance(line, bytes) else
+                        line.encode('utf-8') for line in self.lines)
+
+    def step_durations(self, finished=None):
+        """(instruction, seconds) of every step. Unless docker told, a step
+           lasted until the next one started, or until `finished` (when
+           the build finished, or now, by default) for the last.
+        """
+        finished = finished or self.finished or self.clock()
+        ends = [step[1] for step in self.steps[1:]] + [finished]
+        return [(instruction, seconds if seconds is not None
+                 else max(0.0, end - started))
+                for (instruction, started, seconds, _), end
+                in zip(self.steps, ends)]
+
+    def layer_cache_report(self):
+        """(instruction, cached) of every step that made a layer. Base
+           images aren't steps that can be cached and are left out.
+        """
+        return [(instruction, cached)
+                for instruction, _, _, cached in self.steps
+                if not instruction.upper().startswith('FROM ')]
+
+
+def layer_cache_report(output):
+    """(instruction, cached) of every step of a `docker build` that made a
+       layer, from its `output`
+    """
+    build_output = BuildOutput(size=0)
+    for line in output.splitlines():
+        build_output.append(line)
+    return build_output.layer_cache_report()
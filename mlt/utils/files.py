@@ -17,12 +17,12 @@
 #
 # SPDX-License-Identifier: EPL-2.0
 #
-import glob
-import json
 import os
 import sys
 import yaml
 
+from mlt.utils import state
+
 # to support python2 as well
 try:
     FileNotFoundError
@@ -31,11 +31,16 @@ except NameError:
 
 
 def fetch_action_arg(action, arg):
-    """fetches data from command json files"""
-    action_json = '.{}.json'.format(action)
-    if os.path.isfile(action_json):
-        with open(action_json) as f:
-            return json.load(f).get(arg)
+    """fetches data of the latest `action` from the project state store"""
+    return state.get_store().get_action(action).get(arg)
+
+
+def fetch_action_arg_history(action, arg, limit=None):
+    """`arg` of the latest `limit` entries of `action`, newest first, from
+       the project state store. Entries without `arg` are left out.
+    """
+    history = state.get_store().get_action_history(action, limit=limit)
+    return [data[arg] for data in history if data.get(arg) is not None]
 
 
 def is_custom(target):
@@ -57,19 +62,16 @@ def get_deployed_jobs(job_names_only=False, work_dir=None):
 
        job_names_only: strips the `k8s` folder from the job name and only
                        returns the job name with no folder path
-       work_dir:       the working directory to use to make the `glob` call in
-                       if different than the cwork_dir
+       work_dir:       the project directory to read the jobs from
+                       if different than the cwd
     """
-    # if work_dir not passed in we want `k8s`, else `folder_passed_in` + `k8s`
-    work_dir = 'k8s' if not work_dir else os.path.join(work_dir, 'k8s')
-    jobs = glob.glob(os.path.join(work_dir, '*'))
-    jobs.sort(key=lambda x: os.path.getmtime(x))
-    if job_names_only:
-        jobs = [os.path.basename(job) for job in jobs]
+    jobs = [job['name'] for job in state.get_store(work_dir).get_jobs()]
+    if not job_names_only:
+        jobs = [os.path.join('k8s', job) for job in jobs]
     return jobs
 
 
-def _get_truncated_job_name(job_name):
+def get_truncated_job_name(job_name):
     """When we need to truncate the job name (which is the MLT app name plus
        the app run id) in order to get the prefix for pod names.
 
@@ -80,7 +82,7 @@ def _get_truncated_job_name(job_name):
     return job_name[:job_name.rfind("-")][-53:]
 
 
-def get_only_one_job(job_desired, error_msg):
+def get_only_one_job(job_desired, error_msg, truncate=True):
     """Checks if job desired is in the list of jobs available
        Throws error if more than 1 job found or job doesn't exist
        Function assumes error handling of if jobs exist happens elsewhere
@@ -92,6 +94,7 @@ def get_only_one_job(job_desired, error_msg):
 
        job_desired: `--job-name` parameter string passed to us
        error_msg: What to print if > 1 job or job not found
+       truncate: return the pod name prefix instead of the full job name
     """
     jobs = get_deployed_jobs(job_names_only=True)
     # too many jobs exist with no --job-name flag
@@ -102,17 +105,30 @@ def get_only_one_job(job_desired, error_msg):
     elif job_desired:
         # --job-name was passed in to us
         if job_desired in jobs:
-            return _get_truncated_job_name(job_desired)
+            job = job_desired
         else:
             print("Job {} not found.".format(job_desired))
             print('Jobs to choose from are:\n{}'.format('\n'.join(jobs)))
             sys.exit(1)
     elif jobs:
         # no --job-name flag passed and only 1 job exists
-        return _get_truncated_job_name(jobs[0])
+        job = jobs[0]
     else:
         print("No jobs are deployed.")
         sys.exit(1)
+    return get_truncated_job_name(job) if truncate else job
+
+
+def load_manifests(directory):
+    """every k8s object in the yaml files under `directory`, like the
+       rendered templates of a deployed job in `k8s/<job name>`
+    """
+    objects = []
+    for path, dirs, filenames in os.walk(directory):
+        for filename in sorted(filenames):
+            with open(os.path.join(path, filename)) as f:
+                objects.extend(obj for obj in yaml.safe_load_all(f) if obj)
+    return objects
 
 
 def get_job_kinds():
@@ -0,0 +1,214 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+
+"""
+Matching of paths against .gitignore and .dockerignore patterns, without
+shelling out to git or docker.
+"""
+
+import os
+import re
+
+
+def _translate(pattern):
+    """regex for a glob `pattern`: `*` and `?` don't match `/`, `**` matches
+       any number of directories
+    """
+    i, regex = 0, ''
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            regex += '(?:.*/)?'
+            i += 3
+        elif pattern.startswith('**', i):
+            regex += '.*'
+            i += 2
+        elif pattern[i] == '*':
+            regex += '[^/]*'
+            i += 1
+        elif pattern[i] == '?':
+            regex += '[^/]'
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            chars = pattern[i + 1:end]
+            if chars[0] in '!^':
+                chars = '^' + chars[1:]
+            regex += '[{}]'.format(chars.replace('\\', '\\\\'))
+            i = end + 1
+        else:
+            if pattern[i] == '\\' and i + 1 < len(pattern):
+                i += 1
+            regex += re.escape(pattern[i])
+            i += 1
+    return regex
+
+
+class IgnoreRules(object):
+    """the patterns of an ignore file, in order. With the `gitignore` syntax
+       patterns without a slash match at any depth, and nothing inside an
+       ignored directory can be re-included. With the `dockerignore` syntax
+       patterns are relative to the root and the last match always wins.
+    """
+
+    def __init__(self, lines=(), syntax='gitignore'):
+        self.syntax = syntax
+        self.rules = []
+        for line in lines:
+            self.add(line)
+
+    @classmethod
+    def from_file(cls, path, syntax='gitignore'):
+        """rules of the ignore file at `path`, none if it doesn't exist"""
+        try:
+            with open(path) as f:
+                return cls(f.read().splitlines(), syntax)
+        except (IOError, OSError):
+            return cls(syntax=syntax)
+
+    def add(self, line):
+        pattern = line.strip() if self.syntax == 'dockerignore' \
+            else line.rstrip('\n')
+        if not pattern.strip() or pattern.startswith('#'):
+            return
+        negated = pattern.startswith('!')
+        if negated:
+            pattern = pattern[1:]
+        if pattern.endswith(' ') and not pattern.endswith('\\ '):
+            pattern = pattern.rstrip(' ')
+        directory_only = pattern.endswith('/')
+        pattern = pattern.rstrip('/')
+        if self.syntax == 'dockerignore':
+            pattern = os.path.normpath(pattern).replace(os.sep, '/')
+            anchored = True
+        else:
+            anchored = '/' in pattern
+        pattern = pattern.lstrip('/')
+        if not pattern or pattern == '.':
+            return
+        regex = _translate(pattern)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        self.rules.append((re.compile('^{}$'.format(regex), re.DOTALL),
+                           negated, directory_only))
+
+    @property
+    def has_negations(self):
+        return any(negated for _, negated, _ in self.rules)
+
+    def match(self, path, is_dir=False):
+        """whether the last rule matching `path` ignores it, None if no rule
+           matches. Unlike `ignored`, parent directories aren't looked at.
+        """
+        ignored = None
+        for regex, negated, directory_only in self.rules:
+            if (is_dir or not directory_only) and regex.match(path):
+                ignored = not negated
+        return ignored
+
+    def ignored(self, path, is_dir=False):
+        """whether `path`, relative to the directory of the ignore file and
+           using `/` as separator, is ignored
+        """
+        parts = path.strip('/').split('/')
+        parents = ['/'.join(parts[:i]) for i in range(1, len(parts))]
+        if self.syntax == 'dockerignore':
+            ignored = False
+            for regex, negated, directory_only in self.rules:
+                matched = any(regex.match(parent) for parent in parents) or \
+                    ((is_dir or not directory_only) and regex.match(path))
+                if matched:
+                    ignored = not negated
+            return ignored
+        if any(self.match(parent, True) for parent in parents):
+            return True
+        return bool(self.match('/'.join(parts), is_dir))
+
+
+class GitIgnore(object):
+    """the ignore rules of a git work tree at `root`: every .gitignore in
+       it, each read the first time a path below it is matched, and
+       .git/info/exclude. Call `reload` when one of those files changed.
+    """
+
+    def __init__(self, root='.'):
+        self.root = root
+        # directory of a .gitignore (None for .git/info/exclude) -> rules
+        self._rules = {}
+
+    def _rules_of(self, directory):
+        if directory not in self._rules:
+            if directory is None:
+                path = os.path.join(self.root, '.git', 'info', 'exclude')
+            else:
+                path = os.path.join(self.root, directory, '.gitignore')
+            self._rules[directory] = IgnoreRules.from_file(path)
+        return self._rules[directory]
+
+    def reload(self, path):
+        """forgets the rules read from `path` if it is an ignore file, and
+           returns whether it was
+        """
+        path = path.strip('/')
+        if path == '.git/info/exclude':
+            self._rules.pop(None, None)
+        elif path.split('/')[-1] == '.gitignore':
+            self._rules.pop(path[:-len('.gitignore')].rstrip('/'), None)
+        else:
+            return False
+        return True
+
+    def _match(self, path, is_dir):
+        # the rules of deeper .gitignore files take precedence
+        parts = path.split('/')
+        ignored = self._rules_of(None).match(path, is_dir)
+        for depth in range(len(parts)):
+            matched = self._rules_of('/'.join(parts[:depth])).match(
+                '/'.join(parts[depth:]), is_dir)
+            if matched is not None:
+                ignored = matched
+        return bool(ignored)
+
+    def ignored(self, path, is_dir=False):
+        """whether `path`, relative to the work tree and using `/` as
+           separator, is ignored by git
+        """
+        parts = path.strip('/').split('/')
+        return any(self._match('/'.join(parts[:depth]),
+                               is_dir or depth < len(parts))
+                   for depth in range(1, len(parts) + 1))
+
+
+def walk(root, rules):
+    """relative paths (with `/` separators) of the files under `root` that
+       aren't ignored by `rules`, sorted
+    """
+    found = []
+    # a directory can only be skipped if nothing in it can be re-included
+    prune = not (rules.syntax == 'dockerignore' and rules.has_negations)
+    for directory, dirs, filenames in os.walk(root):
+        relative = os.path.relpath(directory, root).replace(os.sep, '/')
+        prefix = '' if relative == '.' else relative + '/'
+        if prune:
+            dirs[:] = [d for d in dirs
+                       if not rules.ignored(prefix + d, is_dir=True)]
+        found.extend(prefix + name for name in filenames
+                     if not rules.ignored(prefix + name))
+    return sorted(found)
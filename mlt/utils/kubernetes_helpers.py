@@ -18,22 +18,73 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-import json
+import math
 import os
+import re
 import sys
-from subprocess import call
+import time
+from datetime import datetime
+from tabulate import tabulate
 
-from mlt.utils import process_helpers
+from mlt.utils import cluster_backends, state, tracing
 
+# seconds the namespaces and CRDs found in a cluster are remembered for, per
+# kube context, unless `MLT_CLUSTER_CACHE_TTL` says otherwise (0 disables)
+CLUSTER_CACHE_TTL = 300
+CLUSTER_CACHE_TTL_ENV = 'MLT_CLUSTER_CACHE_TTL'
 
+
+def _cluster_cache():
+    """a cache-only store in the user's cache dir, what exists in a
+       cluster is the same for every project deployed to it
+    """
+    return state.get_store(os.path.join(
+        os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'),
+        'mlt'), project=False)
+
+
+def _cluster_cache_ttl():
+    try:
+        return float(os.environ.get(CLUSTER_CACHE_TTL_ENV, CLUSTER_CACHE_TTL))
+    except ValueError:
+        return CLUSTER_CACHE_TTL
+
+
+def _exists(resource, name):
+    """whether the cluster of the current kube context has `resource`
+       `name`, which is remembered for `CLUSTER_CACHE_TTL` seconds once it
+       does. Missing ones are asked about every time, so they show up as soon
+       as they are created.
+    """
+    backend = cluster_backends.get_backend()
+    key = state.cache_key(backend.context, resource, name)
+    store = _cluster_cache()
+    ttl = _cluster_cache_ttl()
+    found = store.get_cached('cluster', key) if ttl > 0 else None
+    if found is not None and time.time() - found < ttl:
+        return True
+    if backend.get(resource, name) is None:
+        return False
+    if ttl > 0:
+        store.set_cached('cluster', key, time.time())
+    return True
+
+
+def invalidate_cluster_cache():
+    """forgets what was found in clusters, e.g. after an apply failed
+       because something remembered is gone
+    """
+    _cluster_cache().clear_cached('cluster')
+
+
+@tracing.traced('namespace check')
 def ensure_namespace_exists(ns):
-    with open(os.devnull, 'wb') as devnull:
-        exit_code = call(["kubectl", "get", "namespace", ns], stdout=devnull,
-                         stderr=devnull)
-    if exit_code is not 0:
-        process_helpers.run(["kubectl", "create", "namespace", ns])
+    if not _exists('namespaces', ns):
+        cluster_backends.get_backend().create('namespaces', {
+            'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': ns}})
 
 
+@tracing.traced('crd check')
 def check_crds(exit_on_failure=False, app_name=None):
     if app_name is None:
         crd_file = 'crd-requirements.txt'
@@ -43,7 +94,7 @@ def check_crds(exit_on_failure=False, app_name=None):
         with open(crd_file) as f:
             # using f.read().splitlines() instead of f.readlines()
             # as it does not include new line(\n)
-            crd_set = set(f.read().splitlines())
+            crd_set = set(filter(None, f.read().splitlines()))
 
         missing_crds = checking_crds_on_k8(crd_set)
         if missing_crds:
@@ -64,15 +115,295 @@ def check_crds(exit_on_failure=False, app_name=None):
 def checking_crds_on_k8(crd_set):
     """
     Check if given crd list installed on K8 or not.
+    Only the CRDs in the list are looked up, not every one in the cluster.
     """
     try:
-        current_crds_json = process_helpers.run_popen(
-            "kubectl get crd -o json", shell=True
-        ).stdout.read().decode('utf-8')
-        current_crds = set([str(x['metadata']['name'])
-                            for x in
-                            json.loads(current_crds_json)['items']])
-        return crd_set - current_crds
+        return set(crd for crd in crd_set
+                   if not _exists('customresourcedefinitions', crd))
     except Exception as ex:
         print("Crd_Checking - Exception: {}".format(ex))
         return set()
+
+
+def parse_timestamp(timestamp):
+    """k8s timestamps look like `2018-08-01T12:00:00Z`"""
+    return datetime(*[int(field) for field in
+                      re.split('[-T:Z.]', timestamp)[:6]])
+
+
+def age(timestamp):
+    """how long ago `timestamp` was, in kubectl's short form like `5m`"""
+    if not timestamp:
+        return '<unknown>'
+    seconds = int((datetime.utcnow() - parse_timestamp(
+        timestamp)).total_seconds())
+    for unit, size in (('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return '{}{}'.format(seconds // size, unit)
+    return '{}s'.format(max(seconds, 0))
+
+
+def pod_status(pod):
+    """the status kubectl shows for a pod, e.g. `ContainerCreating`"""
+    status = pod.get('status', {})
+    if pod['metadata'].get('deletionTimestamp'):
+        return 'Terminating'
+    for container in status.get('containerStatuses') or []:
+        container_state = container.get('state', {})
+        for state_name in ('waiting', 'terminated'):
+            reason = container_state.get(state_name, {}).get('reason')
+            if reason and reason != 'Completed':
+                return reason
+    phase = status.get('phase', 'Unknown')
+    return 'Completed' if phase == 'Succeeded' else phase
+
+
+def pods_table(pods):
+    """lines of a `kubectl get pods -o wide` like table, the pod name is
+       always the first column
+    """
+    rows = []
+    for pod in pods:
+        status = pod.get('status', {})
+        containers = status.get('containerStatuses') or []
+        rows.append([
+            pod['metadata']['name'],
+            '{}/{}'.format(sum(1 for c in containers if c.get('ready')),
+                           len(pod.get('spec', {}).get('containers', []))),
+            pod_status(pod),
+            sum(c.get('restartCount', 0) for c in containers),
+            age(pod['metadata'].get('creationTimestamp')),
+            status.get('podIP', '<none>'),
+            pod.get('spec', {}).get('nodeName', '<none>')])
+    if not rows:
+        return []
+    return tabulate(rows, headers=['NAME', 'READY', 'STATUS', 'RESTARTS',
+                                   'AGE', 'IP', 'NODE'],
+                    tablefmt='plain').splitlines()
+
+
+# label the controller of each `kind` puts on the pods it creates, with the
+# name of the object as value
+POD_LABELS = {
+    'job': 'job-name',
+    'tfjob': 'tf_job_name',
+    'pytorchjob': 'pytorch_job_name',
+}
+
+# kinds that never bring up pods of their own
+PODLESS_KINDS = {'configmap', 'secret', 'service', 'serviceaccount',
+                 'persistentvolumeclaim', 'ingress', 'namespace', 'role',
+                 'rolebinding', 'networkpolicy', 'poddisruptionbudget'}
+
+
+def _pod_creating(objects):
+    return [obj for obj in objects
+            if obj.get('kind', '').lower() not in PODLESS_KINDS]
+
+
+def pod_selector(objects, job_name):
+    """label selector matching the pods of job `job_name` made of the k8s
+       `objects`, None if they aren't all labeled the same way
+    """
+    labels = set(POD_LABELS.get(obj.get('kind', '').lower())
+                 for obj in _pod_creating(objects))
+    if len(labels) != 1 or None in labels:
+        return None
+    return '{}={}'.format(labels.pop(), job_name)
+
+
+def expected_pods(objects):
+    """how many pods the k8s `objects` bring up, None if that can't be told
+       from their specs
+    """
+    total = 0
+    for obj in _pod_creating(objects):
+        kind = obj.get('kind', '').lower()
+        spec = obj.get('spec') or {}
+        if kind == 'pod':
+            total += 1
+        elif kind == 'job':
+            total += spec.get('parallelism', 1)
+        elif kind in ('deployment', 'replicaset', 'statefulset',
+                      'replicationcontroller'):
+            total += spec.get('replicas', 1)
+        elif kind in ('tfjob', 'pytorchjob'):
+            replica_specs = next((spec[key] for key in (
+                'tfReplicaSpecs', 'pytorchReplicaSpecs', 'replicaSpecs')
+                if spec.get(key)), {})
+            if isinstance(replica_specs, dict):
+                replica_specs = replica_specs.values()
+            total += sum(replica_spec.get('replicas', 1)
+                         for replica_spec in replica_specs)
+        else:
+            return None
+    return total or None
+
+
+def wait_for_pods(namespace, label_selector=None, field_selector=None,
+                  name_filter=None, expected=None, timeout=120,
+                  phases=('Running', 'Succeeded')):
+    """watches pods until `expected` of them are in one of `phases`, or all
+       of them when `expected` isn't known
+       name_filter: only count pods with this in their name
+       returns the ready pods by name, or {} if `timeout` seconds pass first
+    """
+    backend = cluster_backends.get_backend()
+    deadline = time.time() + timeout
+    pods = {}
+
+    def update(event_type, pod):
+        name = pod['metadata']['name']
+        if name_filter and name_filter not in name:
+            return
+        if event_type == 'DELETED':
+            pods.pop(name, None)
+        else:
+            pods[name] = pod
+
+    def ready():
+        running = dict((name, pod) for name, pod in pods.items()
+                       if pod.get('status', {}).get('phase') in phases)
+        if running and len(running) >= (expected or len(pods)):
+            return running
+        return None
+
+    # start from a list so pods that already exist are all known before
+    # deciding whether every one of them is ready
+    for pod in backend.list('pods', namespace, label_selector=label_selector,
+                            field_selector=field_selector):
+        update('ADDED', pod)
+    watched = None
+    while True:
+        running = ready()
+        if running:
+            return running
+        if watched is not None and time.time() - watched < 1:
+            # the watch keeps ending right away, don't hammer the server
+            time.sleep(max(0, min(1, deadline - time.time())))
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return {}
+        watched = time.time()
+        for event_type, pod in backend.watch(
+                'pods', namespace, label_selector=label_selector,
+                field_selector=field_selector, timeout=remaining):
+            update(event_type, pod)
+            running = ready()
+            if running:
+                return running
+
+
+# steps a pod goes through coming up, each timed from the end of the one
+# before it, and the time from its creation to its containers running
+LIFECYCLE_STAGES = ('schedule', 'pull', 'create', 'start', 'total')
+
+
+def _seconds(start, end):
+    if start is None or end is None:
+        return None
+    return max(0.0, (parse_timestamp(end) - parse_timestamp(
+        start)).total_seconds())
+
+
+def _event_times(events, reason):
+    """first and last time the kubelet reported `reason` for a pod"""
+    times = []
+    for event in events:
+        if event.get('reason') == reason:
+            # events.k8s.io events only have an `eventTime`
+            times.append(event.get('firstTimestamp') or event.get('eventTime'))
+            times.append(event.get('lastTimestamp') or event.get('eventTime'))
+    times = sorted(filter(None, times))
+    return (times[0], times[-1]) if times else (None, None)
+
+
+def replica_type(pod):
+    """the replica of a TFJob or PyTorchJob `pod` is, like `worker`, `pod`
+       for pods of other kinds
+    """
+    labels = pod['metadata'].get('labels') or {}
+    return next((value.lower() for key, value in sorted(labels.items())
+                 if key.endswith('replica-type')), 'pod')
+
+
+def pod_lifecycle(pod, events):
+    """seconds each of `LIFECYCLE_STAGES` took for `pod`, from its
+       conditions, container statuses and `events`, None for the ones that
+       can't be told, e.g. because the events expired. Pulling takes 0s when
+       the node had the image.
+    """
+    status = pod.get('status', {})
+    created = pod['metadata'].get('creationTimestamp')
+    scheduled = [condition.get('lastTransitionTime')
+                 for condition in status.get('conditions') or []
+                 if condition.get('type') == 'PodScheduled'
+                 if condition.get('status') == 'True']
+    started = sorted(state['startedAt']
+                     for container in status.get('containerStatuses') or []
+                     for state in container.get('state', {}).values()
+                     if state.get('startedAt'))
+    scheduled = scheduled[0] if scheduled else \
+        _event_times(events, 'Scheduled')[1]
+    started = started[-1] if started else _event_times(events, 'Started')[1]
+    pulling = _event_times(events, 'Pulling')[0]
+    pulled = _event_times(events, 'Pulled')[1]
+    containers_created = _event_times(events, 'Created')[1]
+    if pulling is None:
+        # images the node has are only reported as pulled
+        pull = 0.0 if pulled else None
+    else:
+        pull = _seconds(pulling, pulled)
+    return {
+        'replica': replica_type(pod),
+        'schedule': _seconds(created, scheduled),
+        'pull': pull,
+        'create': _seconds(pulled or scheduled, containers_created),
+        'start': _seconds(containers_created, started),
+        'total': _seconds(created, started),
+    }
+
+
+def _percentile(values, percent):
+    """nearest-rank percentile"""
+    values = sorted(values)
+    return values[max(0, int(math.ceil(len(values) * percent / 100.0)) - 1)]
+
+
+def lifecycle_summary(lifecycles):
+    """p50 and max of each stage of the `pod_lifecycle`s, per replica type
+       and for all of them
+    """
+    by_replica = {'all': list(lifecycles)}
+    for lifecycle in lifecycles:
+        by_replica.setdefault(lifecycle['replica'], []).append(lifecycle)
+    summary = {}
+    for replica, replica_lifecycles in by_replica.items():
+        summary[replica] = {'pods': len(replica_lifecycles)}
+        for stat, percent in (('p50', 50), ('max', 100)):
+            summary[replica][stat] = {}
+            for stage in LIFECYCLE_STAGES:
+                values = [lifecycle[stage] for lifecycle in replica_lifecycles
+                          if lifecycle[stage] is not None]
+                summary[replica][stat][stage] = \
+                    _percentile(values, percent) if values else None
+    return summary
+
+
+def format_seconds(seconds):
+    return '-' if seconds is None else '{:.1f}s'.format(seconds)
+
+
+def lifecycle_table(summary):
+    """lines of a table of a `lifecycle_summary`, the replica types first
+       and the aggregate over all pods last
+    """
+    rows = []
+    for replica in sorted(summary, key=lambda r: (r == 'all', r)):
+        for stat in ('p50', 'max'):
+            rows.append([replica, summary[replica]['pods'], stat] + [
+                format_seconds(summary[replica][stat][stage])
+                for stage in LIFECYCLE_STAGES])
+    return tabulate(rows, headers=['REPLICA', 'PODS', ''] + [
+        stage.upper() for stage in LIFECYCLE_STAGES], tablefmt='plain',
+        disable_numparse=True).splitlines()
@@ -17,29 +17,32 @@
 #
 # SPDX-License-Identifier: EPL-2.0
 #
+import os
 import sys
 import subprocess
 
 from termcolor import colored
-from time import sleep
 
-from mlt.utils import files, process_helpers
+from mlt.utils import files, kubernetes_helpers, process_helpers, tracing
 
 
 def call_logs(config, args):
     """
-    This method will check for `.push.json`
+    This method will look up the deployed job
     and provides run-id to _get_logs method to
     fetch logs.
     """
-    job = files.get_only_one_job(
+    job_name = files.get_only_one_job(
         job_desired=args["--job-name"],
-        error_msg="Please use --job-name flag to pick a job to tail.")
+        error_msg="Please use --job-name flag to pick a job to tail.",
+        truncate=False)
+    # kubetail matches pods by the start of their name
+    job = files.get_truncated_job_name(job_name)
 
     namespace = config['namespace']
 
     # check for pod readiness before fetching logs
-    running = check_for_pods_readiness(namespace, job, args["--retries"])
+    running = check_for_pods_readiness(namespace, job_name, args["--timeout"])
 
     if running:
         since = args["--since"]
@@ -48,6 +51,7 @@ def call_logs(config, args):
         print("No logs found for this job.")
 
 
+@tracing.traced('log attach')
 def _get_logs(prefix, since, namespace):
     """
     Fetches logs using kubetail
@@ -74,44 +78,27 @@ def _get_logs(prefix, since, namespace):
         sys.exit()
 
 
-def check_for_pods_readiness(namespace, filter_tag, retries):
+@tracing.traced('readiness wait')
+def check_for_pods_readiness(namespace, job_name, timeout):
+    """waits up to `timeout` seconds for the pods of job `job_name` to be
+       running, reacting to every pod change as the cluster reports it
+       returns the running pods by name, {} if they timed out
+    """
     print("Checking for pod(s) readiness")
-    tries = 0
-
-    pods_found = 0
-    pods_running = 0
-    while True:
-        if tries == retries:
-            print("Max retries Reached.")
-            break
-        try:
-            kubectl_cmd = ["kubectl", "get", "pods", "--namespace", namespace,
-                           "--show-all"]
-            pods = process_helpers.run_popen(kubectl_cmd)\
-                .stdout.read().strip().splitlines()
-
-            if not pods:
-                tries += 1
-                print("Retrying {}/{} \r".format(tries, retries)),
-                sleep(1)
-                continue
-            else:
-                for pod in pods:
-                    if filter_tag in pod.decode('utf-8'):
-                        pods_found += 1
-                        status = pod.split()[2].strip().decode('utf-8')
-                        if status in ['Running', 'Completed']:
-                            pods_running += 1
-
-            if pods_running == pods_found and pods_found > 0:
-                break
-            else:
-                pods_found = 0
-                pods_running = 0
-                tries += 1
-                print("Retrying {}/{} \r".format(tries, retries)),
-                sleep(1)
-        except KeyboardInterrupt:
-            sys.exit()
+    manifests = files.load_manifests(os.path.join('k8s', job_name))
+    label_selector = kubernetes_helpers.pod_selector(manifests, job_name)
+    try:
+        running = kubernetes_helpers.wait_for_pods(
+            namespace, label_selector=label_selector,
+            # without a label to go by, go by the pods' names, which k8s
+            # truncates
+            name_filter=None if label_selector else
+            files.get_truncated_job_name(job_name),
+            expected=kubernetes_helpers.expected_pods(manifests),
+            timeout=timeout)
+    except KeyboardInterrupt:
+        sys.exit()
 
-    return pods_running > 0
+    if not running:
+        print("Timed out waiting for pods to be running.")
+    return running
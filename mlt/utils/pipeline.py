@@ -0,0 +1,102 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+
+"""
+Stages of work that run one after the other and are timed, where a running
+stage can be cancelled from another thread. Used by `mlt deploy --watch`.
+"""
+
+import threading
+import time
+
+COMPLETED = 'completed'
+CANCELLED = 'cancelled'
+FAILED = 'failed'
+
+
+class Pipeline(object):
+    """runs its `stages`, (name, run, cancel) tuples, in order. `run()` does
+       the work of a stage, `cancel()` stops it early from another thread,
+       or is None for stages that have to run to the end once started.
+       A stage fails like the commands do, through `sys.exit`.
+    """
+
+    def __init__(self, stages):
+        self.stages = stages
+        self._lock = threading.Lock()
+        self._running = None
+        self._cancelled = False
+
+    def cancel(self):
+        """cancels the stage that is running and skips the stages after it,
+           returns its name. Nothing is cancelled (and None returned) if no
+           stage is running or it can't be cancelled.
+        """
+        with self._lock:
+            if self._running is None or self._running[2] is None:
+                return None
+            self._cancelled = True
+            name, _, cancel = self._running
+        cancel()
+        return name
+
+    def run(self):
+        """runs the stages, returns how the run ended (`COMPLETED`,
+           `CANCELLED` or `FAILED`) and the (name, seconds) of every stage
+           that was started
+        """
+        with self._lock:
+            self._cancelled = False
+        timings = []
+        for stage in self.stages:
+            with self._lock:
+                if self._cancelled:
+                    return CANCELLED, timings
+                self._running = stage
+            started = time.time()
+            try:
+                stage[1]()
+                status = COMPLETED
+            except SystemExit:
+                status = FAILED
+            except Exception as e:
+                print("{} failed: {}".format(stage[0].capitalize(), e))
+                status = FAILED
+            finally:
+                with self._lock:
+                    self._running = None
+                    if self._cancelled:
+                        status = CANCELLED
+            timings.append((stage[0], time.time() - started))
+            if status != COMPLETED:
+                return status, timings
+        return COMPLETED, timings
+
+
+def format_timings(timings, total=None):
+    """one line with the seconds every stage took, and their sum or the
+       `total` they took when some of them ran at the same time
+    """
+    if total is None:
+        total = sum(seconds for _, seconds in timings)
+    return ', '.join('{} {:.2f}s'.format(name, seconds)
+                     for name, seconds in timings) + \
+        ' (total {:.2f}s)'.format(total)
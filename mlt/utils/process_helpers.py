@@ -18,14 +18,20 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 import os
+import signal
 import sys
+import threading
 from contextlib import contextmanager
 from subprocess import check_output, CalledProcessError, Popen, PIPE
 
+from mlt.utils import tracing
+
 
 def run(command, cwd=None, raise_on_failure=False):
     try:
-        output = check_output(command, cwd=cwd).decode("utf-8")
+        with tracing.span(tracing.command_name(command),
+                          category='subprocess', command=command):
+            output = check_output(command, cwd=cwd).decode("utf-8")
     except CalledProcessError as e:
         if raise_on_failure:
             raise e
@@ -36,7 +42,7 @@ def run(command, cwd=None, raise_on_failure=False):
 
 
 def run_popen(command, shell=False, stdout=PIPE, stderr=PIPE, cwd=None,
-              preexec_fn=None):
+              preexec_fn=None, stdin=None):
     """to suppress output, pass False to stdout or stderr
        None is a valid option that we want to allow"""
     with open(os.devnull, 'w') as quiet:
@@ -46,20 +52,54 @@ def run_popen(command, shell=False, stdout=PIPE, stderr=PIPE, cwd=None,
             print("The following command is invalid:\n{}".format(command))
             sys.exit(1)
         try:
-            return Popen(command, stdout=stdout, stderr=stderr, shell=shell,
-                         cwd=cwd, preexec_fn=preexec_fn)
+            popen = tracing.TracedPopen if tracing.enabled() else Popen
+            return popen(command, stdout=stdout, stderr=stderr, shell=shell,
+                         cwd=cwd, preexec_fn=preexec_fn, stdin=stdin)
         except CalledProcessError as e:
             print(e.output)
             sys.exit(1)
 
 
+def terminate(proc):
+    """stops `proc` if it is still running, along with everything it
+       started if it leads a process group of its own (`run_popen` with
+       `preexec_fn=os.setsid`)
+    """
+    if proc is None or proc.poll() is not None:
+        return
+    try:
+        if os.getpgid(proc.pid) == proc.pid:
+            os.killpg(proc.pid, signal.SIGTERM)
+        else:
+            proc.terminate()
+    except OSError:
+        pass  # it exited in the meantime
+
+
 @contextmanager
-def prevent_deadlock(proc):
+def prevent_deadlock(proc, output=None):
     """function designed to read from a process' pipe and prevent deadlock
        Useful for when we can't use `.communicate()` and need a `.wait()` with
        also using PIPEs.
-       We won't actually do anything with the output here.
+       The pipe is read on another thread, which also waits for the process
+       to exit. Yields a `threading.Event` set once it has, so callers can
+       block on it instead of polling the process.
+       The lines read are appended to the `output` list if one is given,
+       otherwise we won't actually do anything with them.
     """
-    yield
-    for line in iter(proc.stdout.readline, b''):
-        pass
+    exited = threading.Event()
+
+    def drain():
+        try:
+            for line in iter(proc.stdout.readline, b''):
+                if output is not None:
+                    output.append(line)
+            proc.wait()
+        finally:
+            exited.set()
+
+    thread = threading.Thread(target=drain)
+    thread.daemon = True
+    thread.start()
+    yield exited
+    thread.join()
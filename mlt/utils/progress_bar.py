@@ -21,14 +21,43 @@
 import progressbar
 import time
 
+# how many past durations the estimate of the next one is based on
+HISTORY_SIZE = 10
+# seconds between redraws of the bar while the duration isn't known
+REFRESH_INTERVAL = 0.1
 
-def duration_progress(activity, duration, is_done):
+
+def estimate_duration(durations):
+    """median of the latest `HISTORY_SIZE` of `durations` (newest first),
+       None if there are none. A median rather than the last duration, so
+       a single cached or cold build doesn't throw the estimate off.
+    """
+    durations = sorted(float(d) for d in durations[:HISTORY_SIZE]
+                       if d is not None)
+    if not durations:
+        return None
+    middle = len(durations) // 2
+    if len(durations) % 2:
+        return durations[middle]
+    return (durations[middle - 1] + durations[middle]) / 2
+
+
+def duration_progress(activity, duration, is_done, wait=None):
+    """shows a progress bar for `activity` until `is_done()`.
+       `wait(timeout)` should block until the activity is done or `timeout`
+       seconds have passed, e.g. the `wait` of a `threading.Event`; without
+       it we sleep between checks. Either way the bar is only redrawn
+       every so often instead of in a busy loop.
+    """
     def progress(activity, iterations=100):
         bar = progressbar.ProgressBar(
             widgets=[activity, ' ', progressbar.Bar(),
                      ' (', progressbar.ETA(), ') ', ])
         return bar(range(iterations))
 
+    if wait is None:
+        wait = time.sleep
+
     if duration is not None:
         iterations = 100
         time_per_iteration = float(duration) / float(iterations)
@@ -37,7 +66,7 @@ def duration_progress(activity, duration, is_done):
         cursor = 0
         for cursor in range(iterations):
             bar.next()
-            time.sleep(time_per_iteration)
+            wait(time_per_iteration)
 
             # If done early.
             if is_done():
@@ -54,5 +83,6 @@ def duration_progress(activity, duration, is_done):
         while not is_done():
             bar.update(i)
             i += 1
+            wait(REFRESH_INTERVAL)
 
     print("")
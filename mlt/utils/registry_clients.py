@@ -0,0 +1,326 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+Registry clients, to ask a container registry about an image without pulling
+or pushing it. `HttpRegistryClient` talks to the registry's HTTP API
+in-process, with the credentials docker was logged in with, and
+`DockerRegistryClient` spawns `docker manifest inspect`.
+
+`MLT_REGISTRY_CLIENT` picks the client: `http`, `docker` or `auto` (the
+default), which uses the HTTP API and falls back to docker when that fails,
+e.g. for registries with an authentication docker knows better.
+"""
+
+import base64
+import hashlib
+import json
+import os
+import re
+import socket
+import threading
+from subprocess import PIPE
+
+try:
+    import http.client as httplib
+    from urllib.parse import urlencode, urlparse
+except ImportError:  # python 2
+    import httplib
+    from urllib import urlencode
+    from urlparse import urlparse
+
+from mlt.utils import process_helpers
+
+CLIENT_ENV = 'MLT_REGISTRY_CLIENT'
+CLIENTS = ('auto', 'http', 'docker')
+
+REQUEST_TIMEOUT = 30
+
+# where images without a registry in their name live, and the key docker
+# keeps its credentials under
+DOCKER_HUB = 'registry-1.docker.io'
+DOCKER_HUB_AUTH = 'https://index.docker.io/v1/'
+
+# registries talked to over plain http, like docker does
+INSECURE_HOSTS = ('localhost', '127.0.0.1')
+
+MANIFEST_TYPES = (
+    'application/vnd.docker.distribution.manifest.v2+json',
+    'application/vnd.docker.distribution.manifest.list.v2+json',
+    'application/vnd.oci.image.manifest.v1+json',
+    'application/vnd.oci.image.index.v1+json')
+MANIFEST_LIST_TYPES = MANIFEST_TYPES[1::2]
+
+_client = None
+_client_lock = threading.Lock()
+
+
+class RegistryError(Exception):
+    def __init__(self, message, status=None):
+        super(RegistryError, self).__init__(message)
+        self.status = status
+
+
+def get_client():
+    """returns the registry client, created once per process"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _create_client(os.environ.get(CLIENT_ENV, 'auto'))
+        return _client
+
+
+def _create_client(choice):
+    if choice not in CLIENTS:
+        raise ValueError("{} must be one of {}, not `{}`".format(
+            CLIENT_ENV, ', '.join(CLIENTS), choice))
+    if choice == 'docker':
+        return DockerRegistryClient()
+    return HttpRegistryClient(
+        fallback=DockerRegistryClient() if choice == 'auto' else None)
+
+
+def parse_image(image):
+    """splits an image name into (registry host, repository, tag or digest)
+       the way docker does
+    """
+    name, at, reference = image.partition('@')
+    host, _, path = name.partition('/')
+    if not path or not ('.' in host or ':' in host or host == 'localhost'):
+        host, path = DOCKER_HUB, name
+        if '/' not in path:
+            path = 'library/' + path
+    if not at:
+        repository, colon, reference = path.rpartition(':')
+        if colon and '/' not in reference:
+            path = repository
+        else:
+            reference = 'latest'
+    return host, path, reference
+
+
+def load_credentials(host, config_dir=None):
+    """(username, password) docker was logged in to `host` with, from its
+       config file or its credential helper, None if there are none
+    """
+    config_dir = config_dir or os.environ.get(
+        'DOCKER_CONFIG', os.path.expanduser('~/.docker'))
+    try:
+        with open(os.path.join(config_dir, 'config.json')) as f:
+            config = json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+    server = DOCKER_HUB_AUTH if host == DOCKER_HUB else host
+    helper = config.get('credHelpers', {}).get(server) or \
+        config.get('credsStore')
+    if helper:
+        proc = process_helpers.run_popen(
+            ['docker-credential-' + helper, 'get'], stdin=PIPE)
+        out, _ = proc.communicate(server.encode('utf-8'))
+        if proc.returncode == 0:
+            try:
+                credentials = json.loads(out.decode('utf-8'))
+                return credentials['Username'], credentials['Secret']
+            except (ValueError, KeyError):
+                pass
+    auths = config.get('auths', {})
+    entry = auths.get(server) or auths.get('https://' + server) or {}
+    auth = entry.get('auth')
+    if auth:
+        username, _, password = base64.b64decode(auth).decode(
+            'utf-8').partition(':')
+        return username, password
+    return None
+
+
+def _basic(credentials):
+    return 'Basic {}'.format(base64.b64encode(
+        '{}:{}'.format(*credentials).encode('utf-8')).decode('ascii'))
+
+
+class HttpRegistryClient(object):
+    """talks to the registry HTTP API (v2) in-process. Anything going wrong
+       other than a missing image is asked of the `fallback` client, if
+       there is one.
+    """
+    name = 'http'
+
+    def __init__(self, fallback=None, config_dir=None,
+                 timeout=REQUEST_TIMEOUT):
+        self.fallback = fallback
+        self.config_dir = config_dir
+        self.timeout = timeout
+        # (host, repository) -> Authorization header
+        self._authorizations = {}
+
+    def _connect(self, host):
+        hostname = host.split(':')[0]
+        if hostname in INSECURE_HOSTS:
+            return httplib.HTTPConnection(host, timeout=self.timeout)
+        return httplib.HTTPSConnection(host, timeout=self.timeout)
+
+    def _send(self, method, url, headers):
+        """returns (status, headers, body) of a request to an absolute url"""
+        url = urlparse(url)
+        conn = self._connect(url.netloc)
+        try:
+            path = url.path + ('?' + url.query if url.query else '')
+            conn.request(method, path, None, headers)
+            response = conn.getresponse()
+            return (response.status, dict((k.lower(), v) for k, v in
+                                          response.getheaders()),
+                    response.read())
+        except (httplib.HTTPException, socket.error) as e:
+            raise RegistryError("{} {} failed: {}".format(
+                method, url.geturl(), e))
+        finally:
+            conn.close()
+
+    def _authorize(self, host, repository, challenge):
+        """Authorization header answering a `WWW-Authenticate` challenge"""
+        scheme = challenge.split(' ', 1)[0].lower()
+        params = dict(re.findall(r'(\w+)="([^"]*)"', challenge))
+        credentials = load_credentials(host, self.config_dir)
+        if scheme == 'basic':
+            if not credentials:
+                raise RegistryError(
+                    "no credentials for {}, run `docker login`".format(host),
+                    401)
+            return _basic(credentials)
+        if scheme != 'bearer' or 'realm' not in params:
+            raise RegistryError("unsupported authentication `{}`".format(
+                challenge), 401)
+        query = dict((k, v) for k, v in params.items()
+                     if k in ('service', 'scope'))
+        query.setdefault('scope', 'repository:{}:pull'.format(repository))
+        headers = {'Authorization': _basic(credentials)} \
+            if credentials else {}
+        status, _, body = self._send('GET', '{}?{}'.format(
+            params['realm'], urlencode(sorted(query.items()))), headers)
+        if status != 200:
+            raise RegistryError("getting a token for {} returned {}".format(
+                host, status), status)
+        data = json.loads(body.decode('utf-8'))
+        token = data.get('token') or data.get('access_token')
+        return 'Bearer {}'.format(token)
+
+    def _manifest(self, method, image, reference=None):
+        """(status, headers, body) of the manifest of `image`, or of
+           `reference` in its repository
+        """
+        host, repository, tag = parse_image(image)
+        url = '{}://{}/v2/{}/manifests/{}'.format(
+            'http' if host.split(':')[0] in INSECURE_HOSTS else 'https',
+            host, repository, reference or tag)
+        headers = {'Accept': ', '.join(MANIFEST_TYPES)}
+        key = (host, repository)
+        for _ in range(2):
+            if key in self._authorizations:
+                headers['Authorization'] = self._authorizations[key]
+            status, response_headers, body = self._send(method, url, headers)
+            if status != 401 or 'www-authenticate' not in response_headers:
+                break
+            self._authorizations[key] = self._authorize(
+                host, repository, response_headers['www-authenticate'])
+        if status == 404:
+            return None
+        if status >= 400:
+            raise RegistryError("{} {} returned {}".format(
+                method, url, status), status)
+        return status, response_headers, body
+
+    def _or_fallback(self, method, image):
+        try:
+            return getattr(self, '_' + method)(image)
+        except RegistryError:
+            if self.fallback is None:
+                raise
+            return getattr(self.fallback, method)(image)
+
+    def manifest_digest(self, image):
+        """digest of the manifest the registry has for `image`, None if it
+           doesn't have it
+        """
+        return self._or_fallback('manifest_digest', image)
+
+    def config_digest(self, image):
+        """digest of the config of `image` in the registry, which is the id
+           docker gave the image it was pushed from. None if the registry
+           doesn't have it.
+        """
+        return self._or_fallback('config_digest', image)
+
+    def _manifest_digest(self, image):
+        response = self._manifest('HEAD', image)
+        if response is None:
+            return None
+        digest = response[1].get('docker-content-digest')
+        if digest:
+            return digest
+        # not every registry tells on HEAD
+        _, _, body = self._manifest('GET', image)
+        return 'sha256:' + hashlib.sha256(body).hexdigest()
+
+    def _config_digest(self, image):
+        response = self._manifest('GET', image)
+        if response is None:
+            return None
+        manifest = json.loads(response[2].decode('utf-8'))
+        if manifest.get('mediaType') in MANIFEST_LIST_TYPES:
+            entries = manifest.get('manifests') or [{}]
+            entry = next((m for m in entries if m.get('platform', {}).get(
+                'architecture') == 'amd64'), entries[0])
+            response = self._manifest('GET', image, entry.get('digest'))
+            if response is None:
+                return None
+            manifest = json.loads(response[2].decode('utf-8'))
+        return manifest.get('config', {}).get('digest')
+
+
+class DockerRegistryClient(object):
+    """fallback that spawns `docker manifest inspect`"""
+    name = 'docker'
+
+    @staticmethod
+    def _inspect(image):
+        proc = process_helpers.run_popen(
+            ['docker', 'manifest', 'inspect', '--verbose', image])
+        out, err = proc.communicate()
+        if proc.returncode != 0:
+            err = err.decode('utf-8').strip()
+            if 'no such manifest' in err.lower() or \
+                    'not found' in err.lower():
+                return None
+            raise RegistryError(err)
+        inspected = json.loads(out.decode('utf-8'))
+        # manifest lists are inspected as a list of their manifests
+        return inspected[0] if isinstance(inspected, list) else inspected
+
+    def manifest_digest(self, image):
+        inspected = self._inspect(image)
+        return inspected and inspected['Descriptor']['digest']
+
+    def config_digest(self, image):
+        inspected = self._inspect(image)
+        if not inspected:
+            return None
+        manifest = inspected.get('SchemaV2Manifest') or \
+            inspected.get('OCIManifest') or {}
+        return manifest.get('config', {}).get('digest')
@@ -20,7 +20,10 @@
 
 import yaml
 import glob
-import jsonschema
+from jsonschema.exceptions import best_match
+from jsonschema.validators import validator_for
+
+from mlt.utils import state, tracing
 
 schema = """
 ---
@@ -75,11 +78,46 @@ properties:
 """
 
 
+_validator = None
+
+# cache keys of the template files validated by this process
+_validated = set()
+
+
+def _get_validator():
+    """the schema, parsed and checked once per process"""
+    global _validator
+    if _validator is None:
+        template_schema = yaml.safe_load(schema)
+        validator_class = validator_for(template_schema)
+        validator_class.check_schema(template_schema)
+        _validator = validator_class(template_schema)
+    return _validator
+
+
+@tracing.traced('schema validation')
 def validate():
     """ Validates template yamls in <app>/k8s-templates directory.
-        Raises ValidationError on invalid yaml """
-    for template_yaml in glob.glob("k8s-templates/*.yaml"):
+        Raises ValidationError on invalid yaml, naming the file and the
+        index of the document in it
+        Templates that validated before and haven't changed since are
+        skipped """
+    store = state.get_store()
+    for template_yaml in sorted(glob.glob("k8s-templates/*.yaml")):
         with open(template_yaml) as template:
-            docs = yaml.load_all(template)
-            for doc in docs:
-                jsonschema.validate(doc, yaml.load(schema))
+            content = template.read()
+        # the schema is part of the key so a new mlt version re-validates
+        key = state.cache_key(content, schema)
+        if key in _validated or store.get_cached('validation', key):
+            _validated.add(key)
+            continue
+
+        for index, doc in enumerate(yaml.safe_load_all(content)):
+            error = best_match(_get_validator().iter_errors(doc))
+            if error is not None:
+                error.message = "{} (document {}): {}".format(
+                    template_yaml, index, error.message)
+                raise error
+
+        _validated.add(key)
+        store.set_cached('validation', key, True)
@@ -0,0 +1,342 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+Project state store. Everything mlt remembers about a project between
+commands (builds, pushes, sync specs and deployed jobs) lives in one sqlite
+database under `.mlt/`, so lookups are indexed queries instead of json file
+reads and `k8s/` directory scans, and every write is transactional.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import yaml
+
+from mlt.utils import constants
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS actions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    action TEXT NOT NULL,
+    created REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS actions_by_action ON actions (action, id);
+CREATE TABLE IF NOT EXISTS jobs (
+    name TEXT PRIMARY KEY,
+    app_run_id TEXT,
+    kind TEXT,
+    created REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_created ON jobs (created);
+CREATE INDEX IF NOT EXISTS jobs_by_kind ON jobs (kind, created);
+CREATE TABLE IF NOT EXISTS cache (
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    used REAL NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (kind, key)
+);
+"""
+
+# the json files that were used to store action data before the state store
+LEGACY_ACTIONS = ('build', 'push', 'sync')
+
+# cached values kept per kind, the least recently used ones go first
+CACHE_SIZE = 256
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(work_dir=None, project=True):
+    """returns the state store of the project in `work_dir` (default: cwd)
+       stores are opened once per process and shared
+       project: False for a store that only caches, see `StateStore`
+    """
+    path = os.path.abspath(work_dir or '.')
+    with _stores_lock:
+        if (path, project) not in _stores:
+            _stores[path, project] = StateStore(path, project=project)
+        return _stores[path, project]
+
+
+def cache_key(*parts):
+    """hash of everything a cached value is derived from"""
+    return hashlib.sha256(json.dumps(
+        parts, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def resolve_kind(kinds):
+    """a job made of a single kind of k8s object is tracked as that kind,
+       one made of different kinds is `custom` because no single kubectl
+       call can get the status of everything
+    """
+    kinds = set(kinds or [])
+    if not kinds:
+        return None
+    return kinds.pop() if len(kinds) == 1 else 'custom'
+
+
+class StateStore(object):
+    def __init__(self, work_dir, project=True):
+        """work_dir: the project directory, the database is kept in its
+           `.mlt` directory
+           project: False to keep the database right in `work_dir`, for a
+           store that only caches and isn't any project's, so nothing older
+           versions of mlt wrote is looked for there
+        """
+        self.work_dir = work_dir
+        state_dir = os.path.join(work_dir, constants.STATE_DIR) \
+            if project else work_dir
+        if not os.path.isdir(state_dir):
+            os.makedirs(state_dir)
+
+        self._lock = threading.RLock()
+        # one connection shared by every thread, access is serialized by
+        # `self._lock`; the timeout covers other mlt processes writing
+        self._conn = sqlite3.connect(
+            os.path.join(state_dir, constants.STATE_DB), timeout=30,
+            check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+        if project:
+            self._migrate()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _migrate(self):
+        """one time import of `.build.json`, `.push.json`, `.sync.json` and
+           the job dirs in `k8s/` that older versions of mlt wrote
+        """
+        with self._lock, self._conn:
+            if self._get_meta('migrated'):
+                return
+            for action in LEGACY_ACTIONS:
+                action_json = os.path.join(
+                    self.work_dir, '.{}.json'.format(action))
+                try:
+                    with open(action_json) as f:
+                        data = json.load(f)
+                except (IOError, OSError, ValueError):
+                    continue
+                self._insert_action(action, data,
+                                    os.path.getmtime(action_json))
+
+            for job_dir in glob.glob(os.path.join(self.work_dir, 'k8s', '*')):
+                if not os.path.isdir(job_dir):
+                    continue
+                self._insert_job(os.path.basename(job_dir),
+                                 kinds=self._manifest_kinds(job_dir),
+                                 created=os.path.getmtime(job_dir))
+            self._set_meta('migrated', time.time())
+
+    @staticmethod
+    def _manifest_kinds(job_dir):
+        """`kind: ` of every k8s object rendered into a job dir"""
+        kinds = set()
+        for manifest in glob.glob(os.path.join(job_dir, '*')):
+            try:
+                with open(manifest) as f:
+                    for doc in yaml.safe_load_all(f):
+                        if isinstance(doc, dict) and doc.get('kind'):
+                            kinds.add(doc['kind'].lower())
+            except (IOError, OSError, yaml.YAMLError):
+                continue
+        return kinds
+
+    def _get_meta(self, key):
+        row = self._conn.execute(
+            "SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row['value']) if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+            (key, json.dumps(value)))
+
+    # actions: builds, pushes, sync specs, ...
+
+    def _insert_action(self, action, data, created=None):
+        self._conn.execute(
+            "INSERT INTO actions (action, created, data) VALUES (?, ?, ?)",
+            (action, created or time.time(), json.dumps(data)))
+
+    def record_action(self, action, data):
+        """adds a new entry to the history of `action`"""
+        with self._lock, self._conn:
+            self._insert_action(action, data)
+
+    def update_action(self, action, data):
+        """merges `data` into the latest entry of `action`, or records it
+           as the first entry
+        """
+        with self._lock, self._conn:
+            row = self._latest_action_row(action)
+            if row is None:
+                self._insert_action(action, data)
+            else:
+                merged = json.loads(row['data'])
+                merged.update(data)
+                self._conn.execute(
+                    "UPDATE actions SET data = ? WHERE id = ?",
+                    (json.dumps(merged), row['id']))
+
+    def _latest_action_row(self, action):
+        return self._conn.execute(
+            "SELECT id, data FROM actions WHERE action = ? "
+            "ORDER BY id DESC LIMIT 1", (action,)).fetchone()
+
+    def get_action(self, action):
+        """data of the latest entry of `action`, {} if there is none"""
+        with self._lock:
+            row = self._latest_action_row(action)
+        return json.loads(row['data']) if row else {}
+
+    def get_action_history(self, action, limit=None):
+        """data of the latest `limit` entries of `action`, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM actions WHERE action = ? "
+                "ORDER BY id DESC LIMIT ?",
+                (action, -1 if limit is None else limit)).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    # cache: values derived from files, keyed by a `cache_key` of them
+
+    def get_cached(self, kind, key):
+        """value cached under `key`, None if there is none"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE kind = ? AND key = ?",
+                (kind, key)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "UPDATE cache SET used = ? WHERE kind = ? AND key = ?",
+                (time.time(), kind, key))
+        return json.loads(row['value'])
+
+    def set_cached(self, kind, key, value):
+        """caches `value`, keeping the CACHE_SIZE most recently used values
+           of `kind`
+        """
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (kind, key, used, value) "
+                "VALUES (?, ?, ?, ?)",
+                (kind, key, time.time(), json.dumps(value)))
+            self._conn.execute(
+                "DELETE FROM cache WHERE kind = ? AND key NOT IN ("
+                "SELECT key FROM cache WHERE kind = ? "
+                "ORDER BY used DESC LIMIT ?)", (kind, kind, CACHE_SIZE))
+
+    def clear_cached(self, kind):
+        """drops every value cached of `kind`"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache WHERE kind = ?", (kind,))
+
+    # jobs
+
+    def _insert_job(self, name, app_run_id=None, kinds=None, created=None,
+                    **data):
+        data['kinds'] = sorted(kinds or [])
+        self._conn.execute(
+            "INSERT OR IGNORE INTO jobs (name, app_run_id, kind, created, "
+            "data) VALUES (?, ?, ?, ?, ?)",
+            (name, app_run_id, resolve_kind(kinds), created or time.time(),
+             json.dumps(data)))
+
+    def add_job(self, name, app_run_id=None, kinds=None, created=None,
+                **data):
+        """tracks a deployed job, tracking the same job again is a no-op
+           kinds: `kind`s of the k8s objects the job is made of
+           data: anything else worth remembering about the job
+        """
+        with self._lock, self._conn:
+            self._insert_job(name, app_run_id, kinds, created, **data)
+
+    def update_job(self, name, **data):
+        """merges `data` into what is stored for job `name`"""
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT data FROM jobs WHERE name = ?", (name,)).fetchone()
+            if row is not None:
+                merged = json.loads(row['data'])
+                merged.update(data)
+                self._conn.execute(
+                    "UPDATE jobs SET data = ? WHERE name = ?",
+                    (json.dumps(merged), name))
+
+    def remove_jobs(self, names):
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM jobs WHERE name = ?",
+                [(name,) for name in names])
+
+    @staticmethod
+    def _job(row):
+        job = json.loads(row['data'])
+        job.update(name=row['name'], app_run_id=row['app_run_id'],
+                   kind=row['kind'], created=row['created'])
+        return job
+
+    def get_job(self, name):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM jobs WHERE name = ?", (name,)).fetchone()
+        return self._job(row) if row else None
+
+    def get_jobs(self, latest=None, prefix=None, kind=None):
+        """deployed jobs sorted by creation time, oldest first
+           latest: only return the `latest` most recently created jobs
+           prefix: only jobs whose name starts with `prefix`
+           kind: only jobs of this kind, see `resolve_kind`
+        """
+        query = "SELECT * FROM jobs"
+        conditions, params = [], []
+        if prefix:
+            # a range instead of LIKE so the primary key index is used
+            conditions.append("name >= ? AND name < ?")
+            params.extend([prefix, prefix + u'\uffff'])
+        if kind:
+            conditions.append("kind = ?")
+            params.append(kind)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY created DESC, name DESC LIMIT ?"
+        params.append(-1 if latest is None else latest)
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [self._job(row) for row in reversed(rows)]
@@ -18,20 +18,12 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-import json
-import os
+from mlt.utils import state
 
 
 def get_sync_spec():
     """
-    Returns dict value for 'sync_spec' in case '.sync.json' exists
-    otherwise return None
+    Returns the 'sync_spec' recorded in the project state in case one was
+    created, otherwise return None
     """
-    sync_file = '.sync.json'
-    if os.path.isfile(sync_file):
-        with open(sync_file, 'r') as f:
-            sync_data = json.load(f)
-            if 'sync_spec' in sync_data.keys():
-                return sync_data['sync_spec']
-
-    return None
+    return state.get_store().get_action('sync').get('sync_spec')
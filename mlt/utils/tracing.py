@@ -0,0 +1,191 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+Nested, timed spans of what a command does, written as Chrome trace events
+(load them in chrome://tracing or https://ui.perfetto.dev). Tracing is off
+unless `start()` was called, by `--trace` or the `MLT_TRACE` env var, and
+spans cost next to nothing then.
+
+`MLT_TRACE` is either `1`/`true`, to write the trace to
+`.mlt/traces/<command>-<time>.json`, or the file to write it to.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from subprocess import Popen
+
+from mlt.utils import constants
+
+TRACE_ENV = 'MLT_TRACE'
+TRACES_DIR = os.path.join(constants.STATE_DIR, 'traces')
+
+_tracer = None
+
+
+class Tracer(object):
+    def __init__(self, path):
+        self.path = path
+        self.started = time.time()
+        self.events = []
+        self._lock = threading.Lock()
+        # small thread ids read better in trace viewers than idents
+        self._threads = {}
+
+    def _tid(self):
+        thread = threading.current_thread()
+        with self._lock:
+            if thread.ident not in self._threads:
+                self._threads[thread.ident] = len(self._threads) + 1
+                self.events.append({
+                    'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(),
+                    'tid': self._threads[thread.ident],
+                    'args': {'name': thread.name}})
+            return self._threads[thread.ident]
+
+    def _micros(self, timestamp):
+        return int((timestamp - self.started) * 1e6)
+
+    def add(self, name, started, finished, tid=None, category='mlt',
+            **args):
+        """records a complete span"""
+        event = {'name': name, 'cat': category, 'ph': 'X',
+                 'ts': self._micros(started),
+                 'dur': self._micros(finished) - self._micros(started),
+                 'pid': os.getpid(), 'tid': tid or self._tid()}
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+
+    def write(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with self._lock, open(self.path, 'w') as f:
+            json.dump({'traceEvents': self.events,
+                       'displayTimeUnit': 'ms'}, f)
+
+
+def trace_path(command, value=None):
+    """where the trace of `command` goes, for a `MLT_TRACE` of `value`"""
+    if value and value.lower() not in ('1', 'true'):
+        return value
+    return os.path.join(TRACES_DIR, '{}-{}.json'.format(
+        command, time.strftime('%Y%m%d-%H%M%S')))
+
+
+def start(path):
+    global _tracer
+    _tracer = Tracer(path)
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def finish():
+    """writes the trace and stops tracing, returns where it was written"""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is None:
+        return None
+    tracer.write()
+    return tracer.path
+
+
+def command_name(command):
+    """short name of a subprocess for its span, like `docker push`"""
+    if not isinstance(command, str):
+        command = ' '.join(command)
+    # leave out the env vars set in shell commands
+    return ' '.join([word for word in command.split()
+                     if '=' not in word][:2]) or command
+
+
+@contextmanager
+def span(name, category='mlt', **args):
+    """times the `with` block as span `name`, nested in the spans open
+       around it on the same thread
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    started = time.time()
+    try:
+        yield
+    finally:
+        tracer.add(name, started, time.time(), category=category, **args)
+
+
+def traced(name):
+    """decorator to time every call of a function as span `name`"""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class TracedPopen(Popen):
+    """a Popen timed from its start until it is seen to have exited, by
+       `wait`, `poll` or `communicate`, as a span of the thread that started
+       it
+    """
+
+    def __init__(self, command, *args, **kwargs):
+        self._tracer = _tracer
+        self._traced_command = command if isinstance(command, str) else \
+            ' '.join(command)
+        self._tid = self._tracer._tid()
+        self._started = time.time()
+        self._traced = False
+        super(TracedPopen, self).__init__(command, *args, **kwargs)
+
+    def _trace_exit(self):
+        if self.returncode is not None and not self._traced:
+            self._traced = True
+            self._tracer.add(
+                command_name(self._traced_command), self._started,
+                time.time(), tid=self._tid, category='subprocess',
+                command=self._traced_command, returncode=self.returncode)
+
+    def poll(self):
+        returncode = super(TracedPopen, self).poll()
+        self._trace_exit()
+        return returncode
+
+    def wait(self, *args, **kwargs):
+        returncode = super(TracedPopen, self).wait(*args, **kwargs)
+        self._trace_exit()
+        return returncode
+
+    def communicate(self, *args, **kwargs):
+        output = super(TracedPopen, self).communicate(*args, **kwargs)
+        self._trace_exit()
+        return output
@@ -0,0 +1,126 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+"""
+Cluster backend benchmark: runs the cluster calls mlt commands make against
+a local fake API server and reports the latency of each call for the
+in-process API backend and the kubectl backend (skipped when kubectl isn't
+installed). MLT_API_LATENCY sets the simulated network latency (seconds per
+request) and MLT_BACKEND_BUDGET how much the API backend may add on top of
+it per call.
+"""
+from __future__ import print_function
+
+import os
+import time
+from distutils.spawn import find_executable
+
+import pytest
+from tabulate import tabulate
+
+from mlt.utils.cluster_backends import (ApiServerBackend, KubectlBackend,
+                                        load_kube_config)
+from test_utils.fake_api_server import FakeApiServer
+
+API_LATENCY = float(os.getenv('MLT_API_LATENCY', 0.002))
+BACKEND_BUDGET = float(os.getenv('MLT_BACKEND_BUDGET', 0.05))
+CALLS = 20
+NAMESPACE = 'benchmark'
+JOB = 'app-1234'
+
+# what each command asks the cluster for
+OPERATIONS = (
+    ('deploy: namespace check', lambda b: b.get('namespaces', NAMESPACE)),
+    ('deploy: crd check', lambda b: b.list('customresourcedefinitions')),
+    ('deploy -i: pod phase', lambda b: b.get(
+        'pods', JOB + '-worker-0', NAMESPACE)),
+    ('status: job pods', lambda b: b.list(
+        'pods', NAMESPACE, label_selector='tf_job_name=' + JOB)),
+    ('status: tfjob', lambda b: b.get('tfjob', JOB, NAMESPACE)),
+    ('logs: pods readiness', lambda b: b.list('pods', NAMESPACE)),
+    ('events: events', lambda b: b.list('events', NAMESPACE)),
+)
+
+
+@pytest.fixture(scope='module')
+def api_server(tmpdir_factory):
+    server = FakeApiServer(latency=API_LATENCY).start()
+    server.add({'apiVersion': 'v1', 'kind': 'Namespace',
+                'metadata': {'name': NAMESPACE}})
+    server.add({'apiVersion': 'apiextensions.k8s.io/v1',
+                'kind': 'CustomResourceDefinition',
+                'metadata': {'name': 'tfjobs.kubeflow.org'}})
+    server.add({'apiVersion': 'kubeflow.org/v1alpha2', 'kind': 'TFJob',
+                'metadata': {'name': JOB}}, namespace=NAMESPACE)
+    # a shared namespace with other people's pods and events in it
+    for i in range(200):
+        name = '{}-worker-{}'.format(JOB if i < 2 else 'other', i)
+        server.add({'apiVersion': 'v1', 'kind': 'Pod', 'metadata': {
+            'name': name, 'labels': {'tf_job_name': name.rsplit('-', 2)[0]}},
+            'status': {'phase': 'Running'}}, namespace=NAMESPACE)
+        server.add({'apiVersion': 'v1', 'kind': 'Event', 'metadata': {
+            'name': name + '.1'}, 'involvedObject': {'name': name},
+            'message': 'Started container'}, namespace=NAMESPACE)
+    server.kubeconfig = server.write_kubeconfig(
+        str(tmpdir_factory.mktemp('kube').join('config')))
+    yield server
+    server.stop()
+
+
+def _measure(backend):
+    """average seconds per call of every operation"""
+    timings = []
+    for name, operation in OPERATIONS:
+        # first call pays for discovery and connecting
+        operation(backend)
+        start = time.time()
+        for _ in range(CALLS):
+            operation(backend)
+        timings.append((name, (time.time() - start) / CALLS))
+    return timings
+
+
+def _report(backend_name, timings):
+    print("\n{} backend, {:.1f}ms simulated API latency".format(
+        backend_name, API_LATENCY * 1000))
+    print(tabulate([(name, '{:.1f}'.format(seconds * 1000))
+                    for name, seconds in timings],
+                   headers=['call', 'ms per call']))
+
+
+def test_api_backend(api_server):
+    backend = ApiServerBackend(load_kube_config(api_server.kubeconfig))
+    try:
+        timings = _measure(backend)
+    finally:
+        backend.close()
+    _report('api', timings)
+
+    # every call went over the same keep-alive connection
+    assert api_server.connections == 1
+    for name, seconds in timings:
+        assert seconds < API_LATENCY + BACKEND_BUDGET, \
+            "{} took {:.3f}s per call".format(name, seconds)
+
+
+@pytest.mark.skipif(not find_executable('kubectl'),
+                    reason="kubectl is not installed")
+def test_kubectl_backend(api_server, monkeypatch):
+    monkeypatch.setenv('KUBECONFIG', api_server.kubeconfig)
+    _report('kubectl', _measure(KubectlBackend()))
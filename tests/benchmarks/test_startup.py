@@ -0,0 +1,100 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+"""
+Startup benchmark: measures how long it takes a fresh interpreter to import
+`mlt.main` plus the one command docopt picked. Fails if a command goes over
+its import budget (seconds), which can be raised for slow machines with the
+MLT_STARTUP_BUDGET env var.
+"""
+from __future__ import print_function
+
+import json
+import os
+import pytest
+import subprocess
+import sys
+
+from mlt.main import COMMAND_MAP
+from project import basedir
+
+# seconds a fresh interpreter gets to import mlt.main and one command
+STARTUP_BUDGET = float(os.getenv('MLT_STARTUP_BUDGET', 0.5))
+
+# best of N runs, so a busy machine doesn't fail the benchmark
+RUNS = 3
+
+# modules only some commands need, `mlt --version` shouldn't pay for them
+HEAVY_MODULES = ('watchdog', 'progressbar', 'yaml', 'jsonschema', 'pytz',
+                 'tabulate')
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.time()
+import mlt.main
+if {class_name!r}:
+    mlt.main.load_command({class_name!r})
+duration = time.time() - start
+# python 2 keeps `None` placeholders for failed implicit relative imports
+modules = [name for name, module in sys.modules.items() if module]
+print(json.dumps({{'duration': duration, 'modules': modules}}))
+"""
+
+
+def _time_import(class_name=None):
+    """imports mlt in a new interpreter, returns best duration and the
+       modules that were loaded
+    """
+    results = []
+    for _ in range(RUNS):
+        output = subprocess.check_output(
+            [sys.executable, '-c', IMPORT_SCRIPT.format(
+                class_name=class_name)], cwd=basedir())
+        results.append(json.loads(output.decode('utf-8')))
+    best = min(results, key=lambda result: result['duration'])
+    return best['duration'], set(best['modules'])
+
+
+def _top_level(modules):
+    return set(module.split('.')[0] for module in modules)
+
+
+def test_main_import_is_light():
+    """`mlt --version` or `mlt -h` only need docopt"""
+    duration, modules = _time_import()
+    print("\nmlt.main: {:.3f}s".format(duration))
+    assert not _top_level(modules) & set(HEAVY_MODULES)
+    commands = set(module for module in modules
+                   if module.startswith('mlt.commands.'))
+    assert commands <= {'mlt.commands.base'}
+    assert duration < STARTUP_BUDGET
+
+
+@pytest.mark.parametrize('command,class_name', COMMAND_MAP)
+def test_command_import_budget(command, class_name):
+    duration, modules = _time_import(class_name)
+    print("\nmlt {}: {:.3f}s ({} modules)".format(
+        command, duration, len(modules)))
+
+    # file watching is only needed by commands that can build
+    if class_name not in ('BuildCommand', 'DeployCommand'):
+        assert 'watchdog' not in _top_level(modules)
+    assert duration < STARTUP_BUDGET, \
+        "mlt {} took {:.3f}s to import, budget is {}s".format(
+            command, duration, STARTUP_BUDGET)
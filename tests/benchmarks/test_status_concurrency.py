@@ -0,0 +1,101 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+Status benchmark: runs `mlt status -n <jobs>` against a fake `kubectl` that
+takes MLT_KUBECTL_LATENCY seconds (default 0.05) per call, once fetching
+one job at a time and once with the worker pool, and reports how both
+scale with the number of jobs.
+"""
+from __future__ import print_function
+
+import json
+import os
+import time
+
+import pytest
+from tabulate import tabulate
+
+from mlt.commands import status
+from mlt.commands.status import StatusCommand
+from mlt.utils import cluster_backends, state
+from test_utils.io import catch_stdout
+
+KUBECTL_LATENCY = float(os.getenv('MLT_KUBECTL_LATENCY', 0.05))
+JOB_COUNTS = (1, 10, 25, 50)
+
+FAKE_KUBECTL = """#!/bin/sh
+sleep {latency}
+echo '{{"items": [{{"metadata": {{"name": "pod"}}, "status": {{}}}}]}}'
+"""
+
+
+@pytest.fixture
+def project(tmpdir, monkeypatch):
+    """an app with JOB_COUNTS[-1] deployed jobs, and a fake kubectl"""
+    bin_dir = tmpdir.mkdir('bin')
+    kubectl = bin_dir.join('kubectl')
+    kubectl.write(FAKE_KUBECTL.format(latency=KUBECTL_LATENCY))
+    kubectl.chmod(0o755)
+    monkeypatch.setenv('PATH', '{}{}{}'.format(
+        bin_dir, os.pathsep, os.environ['PATH']))
+    monkeypatch.setattr(cluster_backends, '_backend',
+                        cluster_backends.KubectlBackend())
+
+    app = tmpdir.mkdir('app')
+    app.join('mlt.json').write(json.dumps(
+        {'name': 'app', 'namespace': 'benchmark'}))
+    app.mkdir('k8s-templates').join('job.yaml').write(
+        'apiVersion: batch/v1\nkind: Job\nmetadata:\n  name: app\n')
+    monkeypatch.chdir(app)
+    store = state.get_store()
+    store.record_action('push', {'last_remote_container': 'app:1'})
+    for i in range(JOB_COUNTS[-1]):
+        store.add_job('app-{}'.format(i), created=i)
+    return app
+
+
+def _time_status(count):
+    start = time.time()
+    with catch_stdout() as caught_output:
+        StatusCommand({'<count>': count}).action()
+        output = caught_output.getvalue()
+    assert output.count('Job: ') == count
+    return time.time() - start
+
+
+def test_status_scales_with_workers(project, monkeypatch):
+    rows = []
+    for count in JOB_COUNTS:
+        monkeypatch.setattr(status, 'WORKERS', 1)
+        sequential = _time_status(count)
+        monkeypatch.setattr(status, 'WORKERS', cluster_backends.POOL_SIZE)
+        concurrent = _time_status(count)
+        rows.append((count, sequential, concurrent, sequential / concurrent))
+
+    print("\nmlt status, {:.0f}ms per kubectl call, {} workers".format(
+        KUBECTL_LATENCY * 1000, cluster_backends.POOL_SIZE))
+    print(tabulate(rows, headers=['jobs', 'one at a time (s)',
+                                  'concurrent (s)', 'speedup'],
+                   floatfmt='.2f'))
+
+    # with the most jobs the pool should be kept busy
+    _, sequential, concurrent, _ = rows[-1]
+    assert concurrent < sequential / 3
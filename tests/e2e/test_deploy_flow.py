@@ -106,7 +106,7 @@ class TestDeployFlow(CommandTester):
         self.status()
         self.logs()
         self.status()
-        self.deploy(logs=True, retries=300, no_push=True)
+        self.deploy(logs=True, timeout=300, no_push=True)
         self.verify_pod_status()
 
     def test_no_push_deploy(self):
@@ -131,7 +131,7 @@ class TestDeployFlow(CommandTester):
         # we don't need the original deployment and it interferes with
         # picking the right tfjob pod to check
         self.undeploy(use_job_name=True)
-        self.deploy(interactive=True, no_push=True, retries=60)
+        self.deploy(interactive=True, no_push=True, timeout=60)
         self.verify_pod_status(expected_status="Running")
         self.status()
 
@@ -36,6 +36,7 @@ from subprocess import PIPE
 from mlt.utils.files import get_deployed_jobs
 from mlt.utils.git_helpers import clone_repo, get_experiments_version
 from mlt.utils.process_helpers import run, run_popen
+from mlt.utils.state import get_store
 from project import basedir
 
 
@@ -68,8 +69,6 @@ class CommandTester(object):
 
         self.project_dir = os.path.join(pytest.workdir, self.app_name)
         self.mlt_json = os.path.join(self.project_dir, 'mlt.json')
-        self.build_json = os.path.join(self.project_dir, '.build.json')
-        self.deploy_json = os.path.join(self.project_dir, '.push.json')
         self.train_file = os.path.join(self.project_dir, 'main.py')
 
     def _grab_latest_pod_or_tfjob(self):
@@ -221,7 +220,7 @@ class CommandTester(object):
             # then kill the build proc or it won't terminate
             # we could be building TF which takes awhile
             start = time.time()
-            while not os.path.exists(self.build_json):
+            while not get_store(self.project_dir).get_action('build'):
                 time.sleep(1)
                 if time.time() - start >= 360:
                     break
@@ -234,19 +233,17 @@ class CommandTester(object):
             else:
                 self._launch_popen_call(**call_args)
 
-        assert os.path.isfile(self.build_json)
-        with open(self.build_json) as f:
-            build_data = json.loads(f.read())
-            assert 'last_container' in build_data and \
-                   'last_build_duration' in build_data
-            # verify that we created a docker image
-            self._launch_popen_call(
-                "docker image inspect {}".format(build_data['last_container']),
-                shell=True, stdout=None, stderr=None)
-
-    def deploy(self, no_push=False, interactive=False, retries=10,
+        build_data = get_store(self.project_dir).get_action('build')
+        assert 'last_container' in build_data and \
+               'last_build_duration' in build_data
+        # verify that we created a docker image
+        self._launch_popen_call(
+            "docker image inspect {}".format(build_data['last_container']),
+            shell=True, stdout=None, stderr=None)
+
+    def deploy(self, no_push=False, interactive=False, timeout=10,
                sync=False, logs=False, verbose=False):
-        deploy_cmd = ['mlt', 'deploy', '--retries', str(retries)]
+        deploy_cmd = ['mlt', 'deploy', '--timeout', str(timeout)]
         call_args = {'command': deploy_cmd}
         if no_push:
             deploy_cmd.append('--no-push')
@@ -302,11 +299,9 @@ class CommandTester(object):
                 self._launch_popen_call(**call_args)
 
         if not no_push:
-            assert os.path.isfile(self.deploy_json)
-            with open(self.deploy_json) as f:
-                deploy_data = json.loads(f.read())
-                assert 'last_push_duration' in deploy_data and \
-                       'last_remote_container' in deploy_data
+            deploy_data = get_store(self.project_dir).get_action('push')
+            assert 'last_push_duration' in deploy_data and \
+                   'last_remote_container' in deploy_data
 
     def sync(self, create=False, reload=False, delete=False):
         sync_cmd = ['mlt', 'sync']
@@ -0,0 +1,378 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+A small in-memory stand-in for the kubernetes API server, good enough for
+the requests mlt's cluster backends make: discovery, get, list with label
+and field selectors, watch, create, merge patch, server-side apply and
+delete.
+"""
+
+import json
+import socket
+import threading
+import time
+import yaml
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+# group version -> (plural, singular, kind, namespaced)
+RESOURCES = {
+    'v1': [('namespaces', 'namespace', 'Namespace', False),
+           ('pods', 'pod', 'Pod', True),
+           ('events', 'event', 'Event', True),
+           ('services', 'service', 'Service', True)],
+    'batch/v1': [('jobs', 'job', 'Job', True)],
+    'apps/v1': [('deployments', 'deployment', 'Deployment', True)],
+    'apiextensions.k8s.io/v1': [('customresourcedefinitions',
+                                 'customresourcedefinition',
+                                 'CustomResourceDefinition', False)],
+    'kubeflow.org/v1alpha2': [('tfjobs', 'tfjob', 'TFJob', True),
+                              ('pytorchjobs', 'pytorchjob', 'PyTorchJob',
+                               True)],
+}
+
+
+def _merge(target, patch):
+    for key, value in patch.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        elif value is None:
+            target.pop(key, None)
+        else:
+            target[key] = value
+
+
+def _field(obj, path):
+    for key in path.split('.'):
+        obj = obj.get(key, {}) if isinstance(obj, dict) else {}
+    return obj if not isinstance(obj, dict) else None
+
+
+def _matches(obj, label_selector, field_selector):
+    labels = obj.get('metadata', {}).get('labels') or {}
+    for requirement in filter(None, (label_selector or '').split(',')):
+        key, _, value = requirement.partition('=')
+        if labels.get(key) != value:
+            return False
+    for requirement in filter(None, (field_selector or '').split(',')):
+        key, _, value = requirement.partition('=')
+        if _field(obj, key) != value:
+            return False
+    return True
+
+
+class FakeApiServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        # seconds every request takes, to mimic a remote cluster
+        self.latency = latency
+        # send `Connection: close` with watches, like some proxies do
+        self.close_watches = False
+        # API servers before 1.16 answer server-side apply with 415
+        self.server_side_apply = True
+        self.connections = 0
+        self.requests = []
+        self.objects = {}
+        # (key, event type, object) for every change, read by watches
+        self.changes = []
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def write_kubeconfig(self, path, namespace='default'):
+        with open(path, 'w') as f:
+            yaml.safe_dump({
+                'apiVersion': 'v1', 'kind': 'Config',
+                'current-context': 'fake',
+                'clusters': [{'name': 'fake', 'cluster': {
+                    'server': self.url}}],
+                'contexts': [{'name': 'fake', 'context': {
+                    'cluster': 'fake', 'user': 'fake',
+                    'namespace': namespace}}],
+                'users': [{'name': 'fake', 'user': {'token': 'fake-token'}}],
+            }, f)
+        return path
+
+    @staticmethod
+    def resource(group_version, kind):
+        for plural, _, resource_kind, namespaced in RESOURCES[group_version]:
+            if resource_kind == kind:
+                return plural, namespaced
+
+    def add(self, obj, namespace=None):
+        """stores a k8s object as if it had been created"""
+        plural, namespaced = self.resource(obj['apiVersion'], obj['kind'])
+        metadata = obj.setdefault('metadata', {})
+        metadata.setdefault('creationTimestamp', time.strftime(
+            '%Y-%m-%dT%H:%M:%SZ', time.gmtime()))
+        if namespaced:
+            metadata.setdefault('namespace', namespace or 'default')
+        key = (obj['apiVersion'], plural, metadata.get('namespace'))
+        with self.lock:
+            objects = self.objects.setdefault(key, {})
+            self._changed(key, 'MODIFIED' if metadata['name'] in objects
+                          else 'ADDED', obj)
+            objects[metadata['name']] = obj
+        return obj
+
+    def delete(self, obj):
+        """removes a k8s object stored with `add`"""
+        plural, _ = self.resource(obj['apiVersion'], obj['kind'])
+        key = (obj['apiVersion'], plural, obj['metadata'].get('namespace'))
+        with self.lock:
+            del self.objects[key][obj['metadata']['name']]
+            self._changed(key, 'DELETED', obj)
+
+    def _changed(self, key, event_type, obj):
+        # must be called holding the lock
+        self.changes.append((key, event_type, json.loads(json.dumps(obj))))
+        self.changed.notify_all()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        # headers and body are written separately, don't let nagle hold
+        # the body back waiting for an ack (real API servers do the same)
+        self.connection.setsockopt(
+            socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _status(self, code, reason, message):
+        self._send(code, {'kind': 'Status', 'apiVersion': 'v1',
+                          'status': 'Failure', 'reason': reason,
+                          'message': message, 'code': code})
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length).decode('utf-8'))
+
+    def _route(self):
+        """splits a path into (group version, plural, namespace, name), or
+           returns a discovery document
+        """
+        url = urlparse(self.path)
+        self.query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        parts = [p for p in url.path.split('/') if p]
+        if parts[:1] == ['api']:
+            group_version, parts = 'v1', parts[2:]
+        elif parts == ['apis']:
+            return {'kind': 'APIGroupList', 'groups': [
+                {'name': gv.split('/')[0],
+                 'preferredVersion': {'groupVersion': gv}}
+                for gv in sorted(RESOURCES) if gv != 'v1']}
+        else:
+            group_version, parts = '/'.join(parts[1:3]), parts[3:]
+        if group_version not in RESOURCES:
+            return None
+        if not parts:
+            return {'kind': 'APIResourceList', 'groupVersion': group_version,
+                    'resources': [
+                        {'name': plural, 'singularName': singular,
+                         'kind': kind, 'namespaced': namespaced}
+                        for plural, singular, kind, namespaced in
+                        RESOURCES[group_version]]}
+        namespace = None
+        if parts[0] == 'namespaces' and len(parts) >= 3:
+            namespace, parts = parts[1], parts[2:]
+        return (group_version, parts[0], namespace,
+                parts[1] if len(parts) > 1 else None)
+
+    def _list(self, group_version, plural, namespace):
+        items = []
+        for (gv, p, ns), objects in sorted(self.server.objects.items()):
+            if (gv, p) != (group_version, plural) or \
+                    namespace not in (None, ns):
+                continue
+            items.extend(obj for _, obj in sorted(objects.items())
+                         if _matches(obj, self.query.get('labelSelector'),
+                                     self.query.get('fieldSelector')))
+        return items
+
+    def _watch(self, group_version, plural, namespace):
+        """streams the matching objects as ADDED events, then every change
+           to them until `timeoutSeconds` pass
+        """
+        deadline = time.time() + float(self.query.get('timeoutSeconds', 60))
+        label_selector = self.query.get('labelSelector')
+        field_selector = self.query.get('fieldSelector')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Transfer-Encoding', 'chunked')
+        if self.server.close_watches:
+            self.send_header('Connection', 'close')
+        self.end_headers()
+
+        with self.server.lock:
+            events = [('ADDED', obj) for obj in self._list(
+                group_version, plural, namespace)]
+            seen = len(self.server.changes)
+        try:
+            while True:
+                for event_type, obj in events:
+                    line = json.dumps({'type': event_type,
+                                       'object': obj}).encode('utf-8')
+                    self.wfile.write('{:x}\r\n'.format(
+                        len(line) + 1).encode('ascii'))
+                    self.wfile.write(line + b'\n\r\n')
+                self.wfile.flush()
+                with self.server.lock:
+                    if len(self.server.changes) == seen:
+                        self.server.changed.wait(
+                            max(0, deadline - time.time()))
+                    if time.time() >= deadline:
+                        break
+                    events = [
+                        (event_type, obj) for (gv, p, ns), event_type, obj
+                        in self.server.changes[seen:]
+                        if (gv, p) == (group_version, plural) and all((
+                            namespace in (None, ns),
+                            _matches(obj, label_selector, field_selector)))]
+                    seen = len(self.server.changes)
+            self.wfile.write(b'0\r\n\r\n')
+        except socket.error:
+            pass  # the client stopped watching
+        self.close_connection = True
+
+    def _handle(self, method):
+        with self.server.lock:
+            self.server.requests.append((method, self.path))
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        route = self._route()
+        if not isinstance(route, tuple):
+            if route is None:
+                return self._status(404, 'NotFound', 'not found')
+            return self._send(200, route)
+        group_version, plural, namespace, name = route
+        key = (group_version, plural, namespace)
+
+        if name is None and method == 'GET' and \
+                self.query.get('watch') == 'true':
+            return self._watch(group_version, plural, namespace)
+        if method == 'PATCH' and self.headers.get('Content-Type') == \
+                'application/apply-patch+yaml':
+            return self._apply(key, name, namespace)
+        with self.server.lock:
+            if name is None and method == 'GET':
+                return self._send(200, {'kind': 'List', 'items': self._list(
+                    group_version, plural, namespace)})
+
+            objects = self.server.objects.get(key, {})
+            if method == 'POST':
+                obj = self._body()
+                obj.setdefault('apiVersion', group_version)
+                obj.setdefault('kind', next(
+                    kind for p, _, kind, _ in RESOURCES[group_version]
+                    if p == plural))
+                name = obj['metadata']['name']
+                if name in objects:
+                    return self._status(409, 'AlreadyExists',
+                                        '{} "{}" already exists'.format(
+                                            plural, name))
+            elif name not in objects:
+                return self._status(404, 'NotFound',
+                                    '{} "{}" not found'.format(plural, name))
+
+        if method == 'POST':
+            return self._send(201, self.server.add(obj, namespace))
+        with self.server.lock:
+            obj = self.server.objects[key][name]
+            if method == 'PATCH':
+                _merge(obj, self._body())
+                self.server._changed(key, 'MODIFIED', obj)
+            elif method == 'DELETE':
+                del self.server.objects[key][name]
+                self.server._changed(key, 'DELETED', obj)
+        return self._send(200, obj)
+
+    def _apply(self, key, name, namespace):
+        """server-side apply by a single field manager: the object ends up
+           as applied, fields it leaves out are gone
+        """
+        if not self.server.server_side_apply:
+            return self._status(415, 'UnsupportedMediaType',
+                                'the body of the request was in an unknown '
+                                'format')
+        obj = yaml.safe_load(self.rfile.read(
+            int(self.headers.get('Content-Length') or 0)).decode('utf-8'))
+        with self.server.lock:
+            existing = self.server.objects.get(key, {}).get(name)
+            if existing is not None:
+                obj['metadata']['creationTimestamp'] = \
+                    existing['metadata'].get('creationTimestamp')
+                obj['metadata'].setdefault('namespace', namespace)
+                self.server.objects[key][name] = obj
+                self.server._changed(key, 'MODIFIED', obj)
+                return self._send(200, obj)
+        return self._send(201, self.server.add(obj, namespace))
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PATCH(self):
+        self._handle('PATCH')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
@@ -0,0 +1,140 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+"""
+A small in-memory stand-in for a container registry, serving the manifest
+requests of mlt's registry clients, behind a bearer token if asked to.
+"""
+
+import hashlib
+import json
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import parse_qs, urlparse
+except ImportError:  # python 2
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import parse_qs, urlparse
+
+MANIFEST = 'application/vnd.docker.distribution.manifest.v2+json'
+MANIFEST_LIST = 'application/vnd.docker.distribution.manifest.list.v2+json'
+
+
+class FakeRegistry(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, token=None, head_digest=True):
+        HTTPServer.__init__(self, ('127.0.0.1', 0), _Handler)
+        # bearer token the manifests are behind, handed out by /token
+        self.token = token
+        # whether HEAD requests tell the digest, not all registries do
+        self.head_digest = head_digest
+        self.requests = []
+        # (repository, tag or digest) -> (media type, manifest bytes)
+        self.manifests = {}
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def host(self):
+        return '127.0.0.1:{}'.format(self.server_address[1])
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        kwargs={'poll_interval': 0.05})
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def add(self, repository, tag, body, media_type=MANIFEST):
+        """stores a manifest as if it had been pushed, returns its digest"""
+        data = json.dumps(body).encode('utf-8')
+        digest = 'sha256:' + hashlib.sha256(data).hexdigest()
+        with self.lock:
+            for reference in (tag, digest):
+                self.manifests[(repository, reference)] = (media_type, data)
+        return digest
+
+    def push(self, repository, tag, config_digest):
+        """stores the manifest of an image whose id is `config_digest`"""
+        return self.add(repository, tag, {
+            'schemaVersion': 2, 'mediaType': MANIFEST,
+            'config': {'digest': config_digest}, 'layers': []})
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, data=b'', headers=None, body=True):
+        self.send_response(status)
+        for key, value in sorted((headers or {}).items()):
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        if body:
+            self.wfile.write(data)
+
+    def _handle(self, method):
+        url = urlparse(self.path)
+        with self.server.lock:
+            self.server.requests.append(
+                (method, self.path, self.headers.get('Authorization')))
+        if url.path == '/token':
+            query = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+            return self._send(200, json.dumps({
+                'token': self.server.token,
+                'scope': query.get('scope')}).encode('utf-8'))
+        if self.server.token and self.headers.get('Authorization') != \
+                'Bearer {}'.format(self.server.token):
+            return self._send(401, headers={
+                'WWW-Authenticate': 'Bearer realm="http://{}/token",'
+                                    'service="fake"'.format(
+                                        self.server.host)})
+        parts = url.path.split('/')
+        if parts[:2] != ['', 'v2'] or parts[-2] != 'manifests':
+            return self._send(404)
+        key = ('/'.join(parts[2:-2]), parts[-1])
+        with self.server.lock:
+            manifest = self.server.manifests.get(key)
+        if manifest is None:
+            return self._send(404)
+        media_type, data = manifest
+        headers = {'Content-Type': media_type}
+        if method == 'GET' or self.server.head_digest:
+            headers['Docker-Content-Digest'] = \
+                'sha256:' + hashlib.sha256(data).hexdigest()
+        self._send(200, data, headers, body=method == 'GET')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_HEAD(self):
+        self._handle('HEAD')
@@ -20,9 +20,28 @@
 
 import pytest
 
-from mlt.commands import Command
+import mlt.commands
+from mlt.commands import Command, load_command
+from mlt.commands.build import BuildCommand
 
 
 def test_command_invalid_action():
     with pytest.raises(NotImplementedError):
         Command({}).action()
+
+
+def test_load_command():
+    assert load_command('BuildCommand') is BuildCommand
+
+
+def test_load_command_unknown():
+    with pytest.raises(KeyError):
+        load_command('FooCommand')
+
+
+def test_lazy_command_attribute():
+    """`from mlt.commands import XCommand` only works on python 3.7+"""
+    getattr_ = getattr(mlt.commands, '__getattr__')
+    assert getattr_('BuildCommand') is BuildCommand
+    with pytest.raises(AttributeError):
+        getattr_('FooCommand')
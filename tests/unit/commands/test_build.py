@@ -20,7 +20,10 @@
 
 from __future__ import print_function
 
+import os
 import pytest
+import shlex
+import threading
 
 from mock import patch, MagicMock
 from test_utils.io import catch_stdout
@@ -40,7 +43,18 @@ def open_mock(patch):
 
 @pytest.fixture
 def progress_bar_mock(patch):
-    return patch('progress_bar')
+    progress_bar_mock = patch('progress_bar')
+    progress_bar_mock.HISTORY_SIZE = 10
+    return progress_bar_mock
+
+
+@pytest.fixture(autouse=True)
+def context_size(patch):
+    """nothing is measured or written in the cwd"""
+    patch('context_helpers.update_dockerignore',
+          MagicMock(return_value=False))
+    return patch('context_helpers.context_size',
+                 MagicMock(return_value=(2048, [('main.py', 2048)])))
 
 
 @pytest.fixture
@@ -53,19 +67,20 @@ def popen_mock(patch):
 @pytest.fixture
 def prevent_deadlock_mock(patch):
     prevent_deadlock_mock = MagicMock()
-    prevent_deadlock_mock.return_value.__enter__.return_value = None
+    prevent_deadlock_mock.return_value.__enter__.return_value = \
+        threading.Event()
     return patch('process_helpers.prevent_deadlock', prevent_deadlock_mock)
 
 
 def test_simple_build(progress_bar_mock, popen_mock, prevent_deadlock_mock,
                       open_mock, init_mock):
     progress_bar_mock.duration_progress.side_effect = \
-        lambda x, y, z: print('Building')
+        lambda *args: print('Building')
 
     build = BuildCommand({'build': True,
                           '--watch': False,
                           '--verbose': False})
-    build.config = MagicMock()
+    build.config = {'name': 'app'}
 
     with catch_stdout() as caught_output:
         build.action()
@@ -94,7 +109,7 @@ def test_build_errors(popen_mock, progress_bar_mock, prevent_deadlock_mock,
     build = BuildCommand({'build': True,
                           '--watch': False,
                           '--verbose': False})
-    build.config = MagicMock()
+    build.config = {'name': 'app'}
 
     with catch_stdout() as caught_output:
         with pytest.raises(SystemExit):
@@ -117,7 +132,7 @@ def test_watch_build(observer, sleep_mock, prevent_deadlock_mock, open_mock,
     build = BuildCommand({'build': True,
                           '--watch': True,
                           '--verbose': False})
-    build.config = MagicMock()
+    build.config = {'name': 'app'}
 
     with patch('mlt.commands.build.EventHandler'):
         build.action()
@@ -127,7 +142,7 @@ def test_build_verbose(popen_mock, open_mock, init_mock):
     build = BuildCommand({'build': True,
                           '--watch': False,
                           '--verbose': True})
-    build.config = MagicMock()
+    build.config = {'name': 'app'}
 
     with catch_stdout() as caught_output:
         build.action()
@@ -138,3 +153,451 @@ def test_build_verbose(popen_mock, open_mock, init_mock):
     built = output.find('Built')
     assert all(var >= 0 for var in (starting, built))
     assert starting < built
+
+
+@pytest.fixture
+def context_hash(patch):
+    return patch('context_helpers.context_hash',
+                 MagicMock(return_value='ab' * 32))
+
+
+@pytest.fixture
+def image_exists(patch):
+    return patch('docker_helpers.image_exists')
+
+
+def content_tag_build():
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--content-tag': True,
+                          '--verbose': False})
+    build.config = {'name': 'app', 'template_parameters': {'gpus': 1}}
+
+    with catch_stdout() as caught_output:
+        build.action()
+        return caught_output.getvalue()
+
+
+def test_build_content_tag_up_to_date(
+        progress_bar_mock, popen_mock, context_hash, image_exists,
+        open_mock, init_mock, state_store):
+    image_exists.return_value = True
+
+    output = content_tag_build()
+    assert 'app:sha-abababababababab is up to date' in output
+    popen_mock.assert_not_called()
+    context_hash.assert_called_once_with(build_args={'GPUS': 1})
+    assert state_store.get_action('build') == {
+        'last_container': 'app:sha-abababababababab',
+        'context_hash': 'ab' * 32,
+        'context_size': 2048}
+
+
+def test_build_content_tag(
+        progress_bar_mock, popen_mock, prevent_deadlock_mock, context_hash,
+        image_exists, open_mock, init_mock, state_store):
+    image_exists.return_value = False
+
+    output = content_tag_build()
+    assert 'Built app:sha-abababababababab' in output
+    assert popen_mock.call_args[0][0].startswith(
+        'CONTAINER_NAME=app:sha-abababababababab GPUS=1 ')
+    build_data = state_store.get_action('build')
+    assert build_data['context_hash'] == 'ab' * 32
+    assert 'last_build_duration' in build_data
+
+
+def test_build_cancel(progress_bar_mock, popen_mock, prevent_deadlock_mock,
+                      open_mock, init_mock, state_store):
+    """a build cancelled while running stops its process group and isn't
+       recorded
+    """
+    terminate = patch('mlt.commands.build.process_helpers.terminate')
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--verbose': False})
+    build.config = {'name': 'app'}
+    build.preexec_fn = os.setsid
+    progress_bar_mock.duration_progress.side_effect = \
+        lambda *args: build.cancel()
+
+    with terminate as terminate_mock, catch_stdout() as caught_output:
+        with pytest.raises(SystemExit):
+            build.action()
+        output = caught_output.getvalue()
+
+    assert 'cancelled' in output
+    terminate_mock.assert_called_once_with(popen_mock.return_value)
+    assert popen_mock.call_args[1]['preexec_fn'] is os.setsid
+    assert state_store.get_action('build') == {}
+
+
+def variants_build(parallel=2, content_tag=False, build_variant=None):
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--content-tag': content_tag,
+                          '--parallel': parallel,
+                          '--verbose': False})
+    build.config = {'name': 'app',
+                    'template_parameters': {'gpus': 0},
+                    'build_variants': {'cpu': {'GPUS': '0'},
+                                       'gpu': {'GPUS': '1'},
+                                       'mkl': {'GPUS': '0', 'MKL': '1'}}}
+    if build_variant:
+        build.config['template_parameters']['build_variant'] = build_variant
+    return build
+
+
+@pytest.fixture
+def variant_popen(popen_mock):
+    """build processes that take a little while, counting how many of them
+       run at the same time
+    """
+    counts = {'running': 0, 'most': 0}
+    lock = threading.Lock()
+
+    def start(*args, **kwargs):
+        lines = [b'Step 1/2 : FROM python\n', b'Step 2/2 : RUN make\n']
+
+        def readline():
+            if lines:
+                return lines.pop(0)
+            with lock:
+                counts['running'] += 1
+                counts['most'] = max(counts['most'], counts['running'])
+            threading.Event().wait(0.1)
+            with lock:
+                counts['running'] -= 1
+            return b''
+        process = MagicMock()
+        process.poll.return_value = 0
+        process.stdout.readline.side_effect = readline
+        process.communicate.return_value = (b'', b'')
+        return process
+    popen_mock.side_effect = start
+    popen_mock.counts = counts
+    return popen_mock
+
+
+@pytest.mark.parametrize('parallel', [1, 2, 3])
+def test_build_variants(parallel, progress_bar_mock, variant_popen,
+                        open_mock, init_mock, state_store):
+    progress_bar_mock.duration_progress.side_effect = \
+        lambda activity, duration, is_done, wait: wait()
+
+    with catch_stdout() as caught_output:
+        variants_build(parallel, build_variant='gpu').action()
+        output = caught_output.getvalue()
+
+    assert variant_popen.counts['most'] == parallel
+    commands = sorted(call[0][0].split(' ', 1)[1]
+                      for call in variant_popen.call_args_list)
+    assert commands == [
+        'GPUS=0 MKL=1 make build', 'GPUS=0 make build', 'GPUS=1 make build']
+    build_data = state_store.get_action('build')
+    assert sorted(build_data['variants']) == ['cpu', 'gpu', 'mkl']
+    for variant, data in build_data['variants'].items():
+        assert data['last_container'].endswith('-' + variant)
+        assert 'Built {}'.format(data['last_container']) in output
+    assert build_data['last_container'] == \
+        build_data['variants']['gpu']['last_container']
+    assert 'last_build_duration' in build_data
+
+
+def test_build_variants_content_tag(progress_bar_mock, variant_popen,
+                                    context_hash, image_exists, open_mock,
+                                    init_mock, state_store):
+    """variants that are up to date aren't built again"""
+    image_exists.side_effect = lambda image: image.endswith('-cpu')
+    progress_bar_mock.duration_progress.side_effect = \
+        lambda activity, duration, is_done, wait: wait()
+
+    with catch_stdout() as caught_output:
+        variants_build(content_tag=True).action()
+        output = caught_output.getvalue()
+
+    assert 'app:sha-abababababababab-cpu is up to date' in output
+    assert variant_popen.call_count == 2
+    context_hash.assert_any_call(build_args={'GPUS': '0', 'MKL': '1'})
+    assert state_store.get_action('build')['last_container'] == \
+        'app:sha-abababababababab-cpu'
+
+
+def test_build_variants_error(progress_bar_mock, variant_popen, open_mock,
+                              init_mock, state_store):
+    """a failed variant is reported once all of them are done, and nothing
+       is recorded
+    """
+    def start(*args, **kwargs):
+        process = MagicMock()
+        process.poll.return_value = 1 if 'GPUS=1' in args[0] else 0
+        process.stdout.readline.side_effect = [b'Step 1/1 : FROM cuda\n',
+                                               b'']
+        process.communicate.return_value = (b'', b'no cuda here')
+        return process
+    variant_popen.side_effect = start
+
+    with catch_stdout() as caught_output:
+        with pytest.raises(SystemExit):
+            variants_build().action()
+        output = caught_output.getvalue()
+
+    assert output.count('no cuda here') == 1
+    assert state_store.get_action('build') == {}
+
+
+def test_build_variants_cancel(progress_bar_mock, variant_popen, open_mock,
+                               init_mock, state_store):
+    build = variants_build(parallel=3)
+
+    def cancel(*args):
+        # let every build start before cancelling
+        while len(build.build_processes) < 3:
+            threading.Event().wait(0.01)
+        build.cancel()
+    progress_bar_mock.duration_progress.side_effect = cancel
+    terminate = patch('mlt.commands.build.process_helpers.terminate')
+
+    with terminate as terminate_mock, catch_stdout() as caught_output:
+        with pytest.raises(SystemExit):
+            build.action()
+        output = caught_output.getvalue()
+
+    assert 'Build app cancelled' in output
+    assert terminate_mock.call_count == 3
+    assert state_store.get_action('build') == {}
+
+
+@pytest.mark.parametrize('size,verbose,shown', [
+    (2048, False, False),
+    (2048, True, True),
+    (300 * 1024 * 1024, False, True)])
+def test_build_context_size(size, verbose, shown, popen_mock,
+                            progress_bar_mock, prevent_deadlock_mock,
+                            context_size, open_mock, init_mock, state_store):
+    context_size.return_value = (size, [('data/', size - 2), ('main.py', 2)])
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--verbose': verbose})
+    build.config = {'name': 'app'}
+
+    with catch_stdout() as caught_output:
+        build.action()
+        output = caught_output.getvalue()
+
+    assert ('Build context is' in output) == shown
+    if size > 1024 * 1024:
+        assert 'the largest parts are data/ (300.0 MB), main.py (2 B)' \
+            in output
+        assert "Add what the image doesn't need to .dockerignore" in output
+    assert state_store.get_action('build')['context_size'] == size
+
+
+def test_build_updates_dockerignore(popen_mock, progress_bar_mock,
+                                    prevent_deadlock_mock, open_mock,
+                                    init_mock, patch):
+    patch('context_helpers.update_dockerignore', MagicMock(return_value=True))
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--verbose': False})
+    build.config = {'name': 'app'}
+
+    with catch_stdout() as caught_output:
+        build.action()
+        assert 'Updated .dockerignore' in caught_output.getvalue()
+
+
+@pytest.fixture
+def pull(patch):
+    return patch('docker_helpers.pull')
+
+
+def remote_cache_build(registry='gcr.io/project'):
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--remote-cache': True,
+                          '--verbose': False})
+    build.config = {'name': 'app', 'registry': registry}
+
+    with catch_stdout() as caught_output:
+        build.action()
+        return caught_output.getvalue()
+
+
+@pytest.mark.parametrize('pulled', [
+    'gcr.io/project/app:cache', 'gcr.io/project/app:1234', None])
+def test_build_remote_cache(pulled, pull, popen_mock, progress_bar_mock,
+                            open_mock, init_mock, state_store, patch):
+    """the cache tag is pulled, or else the last pushed image, and its
+       layers are reported as cached or built
+    """
+    state_store.record_action(
+        'push', {'last_remote_container': 'gcr.io/project/app:1234'})
+    pull.side_effect = lambda image: image == pulled
+
+    def prevent_deadlock(process, output):
+        for line in [b'Step 1/3 : FROM python\n',
+                     b'Step 2/3 : RUN pip install -r requirements.txt\n',
+                     b' ---> Using cache\n',
+                     b'Step 3/3 : ADD . /src/app\n']:
+            output.append(line)
+        return MagicMock()
+    patch('process_helpers.prevent_deadlock', prevent_deadlock)
+
+    output = remote_cache_build()
+
+    build_cmd = popen_mock.call_args[0][0]
+    build_data = state_store.get_action('build')
+    assert build_data['cache_tag'] == 'gcr.io/project/app:cache'
+    assert build_data['cache_from'] == pulled
+    if pulled:
+        assert 'CACHE_FROM={} '.format(pulled) in build_cmd
+        assert 'Using the layers of {} as cache'.format(pulled) in output
+    else:
+        assert 'CACHE_FROM' not in build_cmd
+        assert "There's no layer cache in the registry yet" in output
+    assert '1 of 2 steps cached' in output
+    assert 'cached  RUN pip install -r requirements.txt' in output
+    assert 'built   ADD . /src/app' in output
+    assert build_data['layers'] == 2
+    assert build_data['cached_layers'] == 1
+
+
+def test_build_remote_cache_no_registry(pull, popen_mock, init_mock):
+    with pytest.raises(SystemExit):
+        remote_cache_build(registry=None)
+    popen_mock.assert_not_called()
+
+
+def test_build_variants_remote_cache(pull, progress_bar_mock, variant_popen,
+                                     open_mock, init_mock, state_store):
+    """every variant has a cache tag of its own"""
+    pull.return_value = True
+    build = variants_build()
+    build.args['--remote-cache'] = True
+    build.config['registry'] = 'gcr.io/project'
+
+    with catch_stdout():
+        build.action()
+
+    assert sorted(call[0][0] for call in pull.call_args_list) == [
+        'gcr.io/project/app:cache-cpu', 'gcr.io/project/app:cache-gpu',
+        'gcr.io/project/app:cache-mkl']
+    assert all('CACHE_FROM=gcr.io/project/app:cache-' in call[0][0]
+               for call in variant_popen.call_args_list)
+    build_data = state_store.get_action('build')
+    assert build_data['cache_tag'] == 'gcr.io/project/app:cache-cpu'
+    assert build_data['variants']['gpu']['cache_from'] == \
+        'gcr.io/project/app:cache-gpu'
+
+
+def quiet_build_output(lines, clock):
+    """a prevent_deadlock that reads `lines`, as (seconds, line), from the
+       build with `clock` set to the time they came in
+    """
+    def prevent_deadlock(process, output):
+        for at, line in lines:
+            clock[0] = at
+            output.append(line)
+        exited = MagicMock()
+        exited.__enter__.return_value = threading.Event()
+        return exited
+    return prevent_deadlock
+
+
+def test_build_errors_show_recent_output(popen_mock, progress_bar_mock,
+                                         open_mock, init_mock, patch):
+    """the output drained from a failed build isn't lost"""
+    popen_mock.return_value.poll.return_value = 1
+    popen_mock.return_value.communicate.return_value = (b'', b'error 1')
+    patch('process_helpers.prevent_deadlock', quiet_build_output(
+        [(0, b'Step 1/2 : FROM python\n'),
+         (1, b'Step 2/2 : RUN make\n'),
+         (2, b'make: *** No rule to make target\n')], [0]))
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--verbose': False})
+    build.config = {'name': 'app'}
+
+    with catch_stdout() as caught_output:
+        with pytest.raises(SystemExit):
+            build.action()
+        output = caught_output.getvalue()
+
+    assert output.index('No rule to make target') < output.index('error 1')
+
+
+def test_build_cmd_quotes_build_args():
+    """build args from the config reach make as they are"""
+    build_cmd = BuildCommand._build_cmd('app:1', {
+        'GPUS': 1, 'EXTRA': "--flag $(touch x) 'y'"})
+    assert shlex.split(build_cmd) == [
+        'CONTAINER_NAME=app:1', "EXTRA=--flag $(touch x) 'y'", 'GPUS=1',
+        'make', 'build']
+
+
+def test_build_buildkit_progress(progress_bar_mock, open_mock, init_mock,
+                                 state_store, monkeypatch):
+    """BuildKit writes its progress to stderr, a quiet build reads it with
+       the rest of the output and times the steps from it
+    """
+    lines = ['#1 [internal] load build definition from Dockerfile',
+             '#1 DONE 0.1s', '#5 [1/2] FROM docker.io/library/python',
+             '#5 CACHED', '#6 [2/2] RUN pip install tensorflow',
+             '#6 DONE 12.5s']
+    # more than a pipe holds, a build whose stderr isn't read hangs
+    chatter = 'x' * 100
+    script = '; '.join(["for i in $(seq 2000); do echo {} >&2; done".format(
+        chatter)] + ["echo '{}' >&2".format(line) for line in lines])
+    monkeypatch.setattr(BuildCommand, '_build_cmd', staticmethod(
+        lambda container_name, build_args: script))
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--verbose': False})
+    build.config = {'name': 'app'}
+
+    with catch_stdout() as caught_output:
+        build.action()
+        output = caught_output.getvalue()
+
+    assert 'Built ' in output
+    assert state_store.get_action('build')['steps'] == [
+        ['FROM docker.io/library/python', 0],
+        ['RUN pip install tensorflow', 12.5]]
+
+
+def test_build_profile(popen_mock, progress_bar_mock, open_mock, init_mock,
+                       state_store, patch, monkeypatch):
+    """step timings are recorded, and compared to earlier builds"""
+    from mlt.utils import progress_bar
+    progress_bar_mock.estimate_duration.side_effect = \
+        progress_bar.estimate_duration
+    clock = [0]
+    monkeypatch.setattr('mlt.utils.docker_helpers.time.time',
+                        lambda: clock[0])
+    for seconds in (30, 50, 40):
+        state_store.record_action('build', {'steps': [
+            ['FROM python', 1], ['RUN pip install tensorflow', seconds]]})
+    patch('process_helpers.prevent_deadlock', quiet_build_output(
+        [(0, b'Step 1/3 : FROM python\n'),
+         (2, b'Step 2/3 : RUN pip install tensorflow\n'),
+         (92, b'Step 3/3 : ADD . /src/app\n')], clock))
+    build = BuildCommand({'build': True,
+                          '--watch': False,
+                          '--profile': True,
+                          '--verbose': False})
+    build.config = {'name': 'app'}
+
+    with catch_stdout() as caught_output:
+        build.action()
+        output = caught_output.getvalue()
+
+    steps = state_store.get_action('build')['steps']
+    assert [instruction for instruction, _ in steps] == [
+        'FROM python', 'RUN pip install tensorflow', 'ADD . /src/app']
+    assert steps[:2] == [['FROM python', 2], ['RUN pip install tensorflow',
+                                              90]]
+    assert 'compared to the last 3 builds' in output
+    row = [line for line in output.splitlines()
+           if line.startswith('RUN pip install tensorflow')][0]
+    assert row.split()[-3:] == ['90.0', '40.0', '+50.0']
@@ -20,12 +20,18 @@
 
 from __future__ import print_function
 
+import json
+import os
+import threading
 import uuid
 import pytest
+import yaml as yaml_module
 from conditional import conditional
 from mock import call, MagicMock
 
 from mlt.commands.deploy import DeployCommand
+from mlt.utils.cluster_backends import ClusterError
+from mlt.utils.registry_clients import RegistryError
 from test_utils.io import catch_stdout
 
 
@@ -41,7 +47,11 @@ def call_logs(patch):
 
 @pytest.fixture
 def fetch_action_arg(patch):
-    return patch('files.fetch_action_arg', MagicMock(return_value='output'))
+    # no build variants or layer cache, `last_container` and the like are
+    # 'output'
+    return patch('files.fetch_action_arg', MagicMock(
+        side_effect=lambda action, arg: None if arg in (
+            'variants', 'cache_tag') else 'output'))
 
 
 @pytest.fixture
@@ -56,7 +66,19 @@ def json_mock(patch):
 
 @pytest.fixture
 def open_mock(patch):
-    return patch('open')
+    open_mock = MagicMock()
+    open_mock.return_value.__enter__.return_value.read.return_value = \
+        'kind: Job'
+    return patch('open', open_mock)
+
+
+@pytest.fixture(autouse=True)
+def manifest_cache(state_store, monkeypatch):
+    """rendering is mocked out in most tests, nothing to cache there"""
+    monkeypatch.setattr(state_store, 'get_cached',
+                        MagicMock(return_value=None))
+    monkeypatch.setattr(state_store, 'set_cached', MagicMock())
+    return state_store
 
 # PROCESS_HELPERS MOCKS
 
@@ -84,10 +106,29 @@ def process_helpers_run_mock(patch):
 # END PROCESS_HELPERS MOCKS
 
 
+@pytest.fixture(autouse=True)
+def registry_client(patch):
+    client = patch('registry_clients.get_client').return_value
+    client.manifest_digest.return_value = None
+    client.config_digest.return_value = None
+    return client
+
+
+@pytest.fixture(autouse=True)
+def local_image(patch):
+    patch('docker_helpers.image_id', MagicMock(return_value='sha256:1d'))
+    patch('docker_helpers.repo_digest', MagicMock(return_value='sha256:d1'))
+
+
+@pytest.fixture(autouse=True)
+def load_manifests(patch):
+    return patch('files.load_manifests')
+
+
 @pytest.fixture
 def progress_bar(patch):
-    progress_mock = MagicMock()
-    progress_mock.duration_progress.side_effect = lambda x, y, z: print(
+    progress_mock = MagicMock(HISTORY_SIZE=10)
+    progress_mock.duration_progress.side_effect = lambda *args: print(
         'Pushing ')
     return patch('progress_bar', progress_mock)
 
@@ -132,13 +173,15 @@ def is_custom_mock(patch):
     return patch('files.is_custom')
 
 
-def deploy(no_push, skip_crd_check, interactive, extra_config_args, retries=5,
-           template='test', logs=False, verbose=False, catch_exception=None):
+def deploy(no_push, skip_crd_check, interactive, extra_config_args, timeout=5,
+           template='test', logs=False, verbose=False, catch_exception=None,
+           wait=False, report=False, sweep=None, parallel=None):
     deploy = DeployCommand(
         {'deploy': True, '--no-push': no_push,
          '--skip-crd-check': skip_crd_check,
-         '--interactive': interactive, '--retries': retries,
-         '--logs': logs, '--verbose': verbose})
+         '--interactive': interactive, '--timeout': timeout,
+         '--logs': logs, '--verbose': verbose, '--wait': wait,
+         '--report': report, '--sweep': sweep, '--parallel': parallel})
     deploy.config = {'name': 'app',
                      'namespace': 'namespace',
                      'template': template}
@@ -226,6 +269,159 @@ def test_deploy_without_push(walk_mock, progress_bar, run_popen_mock,
     verify_successful_deploy(output, did_push=False)
 
 
+def test_deploy_content_tag_already_pushed(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        registry_client, state_store):
+    """images tagged by their content aren't pushed again"""
+    registry_client.manifest_digest.return_value = 'sha256:d1'
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'gcr.io/projectfoo'})
+    registry_client.manifest_digest.assert_called_once_with(
+        'gcr.io/projectfoo/output')
+    assert 'gcr.io/projectfoo/output is already in the registry' in output
+    assert not any('push' in call[0][0] for call in
+                   run_popen_mock.call_args_list)
+    pushed = state_store.get_action('push')
+    assert pushed['last_remote_container'] == 'gcr.io/projectfoo/output'
+    assert pushed['digest'] == 'sha256:d1'
+
+
+@pytest.mark.parametrize('config_digest,pushed', [
+    ('sha256:1d', False), ('sha256:other', True)])
+def test_deploy_image_already_pushed(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        registry_client, state_store, config_digest, pushed):
+    """images the registry has, with the local image id as config, aren't
+       pushed again, the digest is recorded either way
+    """
+    fetch_action_arg.side_effect = lambda action, arg: {
+        'last_container': 'app:1234',
+        'last_remote_container': 'gcr.io/projectfoo/app:1234'}.get(arg)
+    registry_client.config_digest.return_value = config_digest
+    registry_client.manifest_digest.return_value = 'sha256:d1'
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'gcr.io/projectfoo'})
+    registry_client.config_digest.assert_called_once_with(
+        'gcr.io/projectfoo/app:1234')
+    assert ('already in the registry' in output) != pushed
+    assert any(call[0][0] == ['docker', 'push', 'gcr.io/projectfoo/app:1234']
+               for call in run_popen_mock.call_args_list) == pushed
+    push = state_store.get_action('push')
+    assert push['digest'] == 'sha256:d1'
+    assert push['image_id'] == 'sha256:1d'
+
+
+@pytest.mark.parametrize('registry_digest,pushed', [
+    ('sha256:d1', False), ('sha256:other', True), (None, True)])
+def test_deploy_verifies_recorded_digest(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        registry_client, state_store, registry_digest, pushed):
+    """a push of the same image recorded its digest, one HEAD request tells
+       whether the registry still has it
+    """
+    state_store.record_action('push', {
+        'last_remote_container': 'gcr.io/projectfoo/app:1234',
+        'digest': 'sha256:d1', 'image_id': 'sha256:1d'})
+    fetch_action_arg.side_effect = lambda action, arg: {
+        'last_container': 'app:1234',
+        'last_remote_container': 'gcr.io/projectfoo/app:1234'}.get(arg)
+    registry_client.manifest_digest.return_value = registry_digest
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'gcr.io/projectfoo'})
+    registry_client.config_digest.assert_not_called()
+    assert ('already in the registry' in output) != pushed
+
+
+def test_deploy_registry_error_pushes(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        registry_client):
+    """a registry that can't be asked gets the image pushed anyway"""
+    registry_client.manifest_digest.side_effect = RegistryError('denied')
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'gcr.io/projectfoo'})
+    assert "Couldn't check gcr.io/projectfoo/output in the registry: " \
+        "denied" in output
+    assert any(call[0][0] == ['docker', 'push', 'gcr.io/projectfoo/output']
+               for call in run_popen_mock.call_args_list)
+
+
+@pytest.mark.parametrize('build_variant,pushed', [
+    (None, 'gcr.io/projectfoo/app:sha-1-cpu'),
+    ('gpu', 'gcr.io/projectfoo/app:sha-2-gpu')])
+def test_deploy_build_variant(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        registry_client, state_store, build_variant, pushed):
+    """the image of the variant picked in the config is pushed"""
+    variants = {'cpu': {'last_container': 'app:sha-1-cpu',
+                        'context_hash': '1'},
+                'gpu': {'last_container': 'app:sha-2-gpu',
+                        'context_hash': '2'}}
+    fetch_action_arg.side_effect = lambda action, arg: \
+        variants if arg == 'variants' else 'output'
+    registry_client.manifest_digest.return_value = 'sha256:d1'
+    deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={
+            'registry': 'gcr.io/projectfoo',
+            'build_variants': {'cpu': {'GPUS': '0'}, 'gpu': {'GPUS': '1'}},
+            'template_parameters': {'build_variant': build_variant}})
+    registry_client.manifest_digest.assert_called_once_with(pushed)
+    assert state_store.get_action('push')['last_remote_container'] == pushed
+
+
+@pytest.mark.parametrize('pushed', [True, False])
+def test_deploy_updates_cache_tag(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        patch, pushed):
+    """images built with `--remote-cache` move the cache tag once pushed"""
+    fetch_action_arg.side_effect = lambda action, arg: {
+        'cache_tag': 'gcr.io/projectfoo/app:cache',
+        'last_container': 'app:1234',
+        'last_remote_container': 'gcr.io/projectfoo/app:1234'}.get(arg)
+    push = patch('docker_helpers.push', MagicMock(return_value=pushed))
+    run = patch('process_helpers.run')
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False,
+        extra_config_args={'registry': 'gcr.io/projectfoo'})
+    run.assert_any_call(
+        ['docker', 'tag', 'app:1234', 'gcr.io/projectfoo/app:cache'])
+    push.assert_called_once_with('gcr.io/projectfoo/app:cache')
+    assert ('Updated layer cache gcr.io/projectfoo/app:cache' in output) == \
+        pushed
+
+
+def test_deploy_build_variant_not_built(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock):
+    fetch_action_arg.side_effect = lambda action, arg: \
+        {'cpu': {'last_container': 'app:1-cpu'}} if arg == 'variants' \
+        else 'output'
+    output = deploy(
+        no_push=False, skip_crd_check=True,
+        interactive=False, catch_exception=SystemExit,
+        extra_config_args={
+            'registry': 'gcr.io/projectfoo',
+            'build_variants': {'cpu': {'GPUS': '0'}, 'gpu': {'GPUS': '1'}},
+            'template_parameters': {'build_variant': 'gpu'}})
+    assert "Build variant gpu hasn't been built yet" in output
+
+
 def test_deploy_interactive_one_file(walk_mock, progress_bar, run_popen_mock,
                                      open_mock, template, kube_helpers,
                                      verify_build,
@@ -234,12 +430,17 @@ def test_deploy_interactive_one_file(walk_mock, progress_bar, run_popen_mock,
     walk_mock.return_value = ['foo']
     yaml.return_value = {
         'template': {'foo': 'bar'}, 'containers': [{'foo': 'bar'}]}
-    json_mock.loads.return_value = {'status': {'phase': 'Running'}}
+    kube_helpers.wait_for_pods.return_value = {'app-1-abc': {}}
     output = deploy(
         no_push=False, skip_crd_check=True,
         interactive=True,
         extra_config_args={'registry': 'dockerhub'})
     verify_successful_deploy(output, interactive=True, pod_count=1)
+    _, kwargs = kube_helpers.wait_for_pods.call_args
+    assert kwargs['label_selector'].startswith('app_run_id=')
+    assert kwargs['timeout'] == 5
+    assert run_popen_mock.call_args_list[-1][0][0][:4] == [
+        'kubectl', 'exec', '-it', 'app-1-abc']
 
     # verify that kubectl commands are specifying namespace
     for call_args in run_popen_mock.call_args_list:
@@ -256,7 +457,6 @@ def test_deploy_interactive_two_files(walk_mock, progress_bar, run_popen_mock,
                                       verify_build,
                                       verify_init, fetch_action_arg, sleep,
                                       yaml, json_mock):
-    json_mock.loads.return_value = {'status': {'phase': 'Running'}}
     yaml.return_value = {
         'template': {'foo': 'bar'}, 'containers': [{'foo': 'bar'}]}
     output = deploy(
@@ -266,6 +466,58 @@ def test_deploy_interactive_two_files(walk_mock, progress_bar, run_popen_mock,
     verify_successful_deploy(output, interactive=True)
 
 
+@pytest.mark.parametrize('timeout,waited', [(5, 5), (120, 10)])
+@pytest.mark.parametrize('running', [True, False])
+def test_deploy_interactive_run_label(
+        progress_bar, run_popen_mock, kube_helpers, verify_build,
+        verify_init, fetch_action_arg, load_manifests, cluster_backend,
+        tmpdir, monkeypatch, patch, running, timeout, waited):
+    """pods of an interactive deploy are labeled with the run id, and only
+       the pods with that label are watched for, until all of them run or
+       a few seconds passed
+    """
+    patch('schema.validate')
+    app = tmpdir.mkdir('app')
+    app.mkdir('k8s-templates').join('job.json').write(json.dumps({
+        'kind': 'TFJob', 'spec': {'replicaSpecs': [{
+            'replicas': 2, 'template': {
+                'metadata': {'labels': {'team': 'ml'}},
+                'spec': {'containers': [{'image': '$image'}]}}}]}}))
+    monkeypatch.chdir(app)
+    pods = [{'metadata': {'name': 'app-worker-{}'.format(i)},
+             'status': {'phase': 'Running' if running else 'Pending',
+                        'startTime': '2018-06-01T00:00:0{}Z'.format(i)}}
+            for i in (1, 0)]
+    kube_helpers.expected_pods.return_value = 2
+    kube_helpers.wait_for_pods.return_value = dict(
+        (pod['metadata']['name'], pod) for pod in pods) if running else {}
+    cluster_backend.list.return_value = pods
+    kube_helpers.pods_table.side_effect = lambda pods: [
+        pod['metadata']['name'] for pod in pods]
+
+    output = deploy(no_push=True, skip_crd_check=True, interactive=True,
+                    extra_config_args={'registry': 'gcr.io'},
+                    timeout=timeout)
+
+    job_dir = load_manifests.call_args_list[0][0][0]
+    with open(os.path.join(job_dir, 'job.json')) as f:
+        job = json.load(f)
+    app_run_id = os.path.basename(job_dir)[len('app-'):]
+    assert job['spec']['replicaSpecs'][0]['template']['metadata'] == {
+        'labels': {'team': 'ml', 'debug': 'true', 'app_run_id': app_run_id}}
+    selector = 'app_run_id={}'.format(app_run_id)
+    kube_helpers.wait_for_pods.assert_called_once_with(
+        'namespace', label_selector=selector, expected=2, timeout=waited,
+        phases=('Running',))
+    if running:
+        cluster_backend.list.assert_not_called()
+    else:
+        cluster_backend.list.assert_called_once_with(
+            'pods', 'namespace', label_selector=selector)
+    assert 'More than one container created' in output
+    assert output.index('app-worker-0\n') < output.index('app-worker-1\n')
+
+
 def test_deploy_interactive_pod_not_run(walk_mock, progress_bar,
                                         run_popen_mock,
                                         process_helpers_run_mock,
@@ -273,7 +525,7 @@ def test_deploy_interactive_pod_not_run(walk_mock, progress_bar,
                                         verify_build,
                                         verify_init, fetch_action_arg, sleep,
                                         yaml, json_mock):
-    json_mock.loads.return_value = {'status': {'phase': 'Error'}}
+    kube_helpers.wait_for_pods.return_value = {}
     yaml.return_value = {
         'template': {'foo': 'bar'}, 'containers': [{'foo': 'bar'}]}
     with pytest.raises(SystemExit):
@@ -283,16 +535,379 @@ def test_deploy_interactive_pod_not_run(walk_mock, progress_bar,
             extra_config_args={'registry': 'dockerhub'})
 
 
-def test_deploy_update_app_run_id(open_mock, json_mock):
+def test_deploy_apply_error(walk_mock, progress_bar, run_popen_mock,
+                            open_mock, template, kube_helpers, verify_build,
+                            verify_init, fetch_action_arg, json_mock,
+                            cluster_backend):
+    cluster_backend.apply.side_effect = ClusterError('admission denied')
+    output = deploy(
+        no_push=True, skip_crd_check=True, interactive=False,
+        extra_config_args={'registry': 'gcr://projectfoo'},
+        catch_exception=SystemExit)
+    assert 'admission denied' in output
+    kube_helpers.invalidate_cluster_cache.assert_called_once_with()
+
+
+def test_deploy_prepares_while_pushing(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        cluster_backend):
+    """the CRD and namespace checks run while the image is pushed, the
+       templates are applied after both
+    """
+    namespace_checked = threading.Event()
+    kube_helpers.ensure_namespace_exists.side_effect = \
+        lambda namespace: namespace_checked.set()
+
+    def push(*args):
+        # the push only ends once the namespace was checked meanwhile
+        assert namespace_checked.wait(5)
+        print('Pushing ')
+    progress_bar.duration_progress.side_effect = push
+
+    output = deploy(
+        no_push=False, skip_crd_check=False,
+        interactive=False,
+        extra_config_args={'registry': 'gcr.io/projectfoo'})
+    verify_successful_deploy(output)
+    kube_helpers.check_crds.assert_called_once_with(exit_on_failure=True)
+    assert output.index('Pushed app to ') < output.index('Deploying ')
+    assert 'Deploy timings: push ' in output
+    assert 's saved by preparing while pushing' in output
+
+
+def test_deploy_crd_check_fails_while_pushing(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        cluster_backend, process_helpers_mock):
+    """a failed CRD check stops the push instead of waiting for it"""
+    terminated = threading.Event()
+    process_helpers_mock.terminate.side_effect = \
+        lambda process: terminated.set()
+    push_started = threading.Event()
+
+    def crd_check(exit_on_failure):
+        assert push_started.wait(5)
+        raise SystemExit(3)
+    kube_helpers.check_crds.side_effect = crd_check
+
+    def push(*args):
+        # the push would take forever if nothing stopped it
+        push_started.set()
+        assert terminated.wait(5)
+    progress_bar.duration_progress.side_effect = push
+
+    with pytest.raises(SystemExit) as exit_info:
+        deploy(no_push=False, skip_crd_check=False, interactive=False,
+               extra_config_args={'registry': 'gcr.io/projectfoo'})
+    assert exit_info.value.code == 3
+    process_helpers_mock.terminate.assert_called_with(
+        run_popen_mock.return_value)
+    cluster_backend.apply.assert_not_called()
+
+
+def test_deploy_render_fails_before_pushing(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        cluster_backend, monkeypatch):
+    """a preparation that fails before the push starts stops it from
+       starting, and its error is raised
+    """
+    cancelled = threading.Event()
+    cancel = DeployCommand.cancel
+    monkeypatch.setattr(DeployCommand, 'cancel', lambda self: (
+        cancel(self), cancelled.set()))
+    monkeypatch.setattr(DeployCommand, '_prepare_deploy', MagicMock(
+        side_effect=ZeroDivisionError))
+    # the registry check is still going on when the rendering fails
+    monkeypatch.setattr(DeployCommand, '_pushed_digest',
+                        lambda self: cancelled.wait(5) and None)
+    with pytest.raises(ZeroDivisionError):
+        deploy(no_push=False, skip_crd_check=True, interactive=False,
+               extra_config_args={'registry': 'gcr.io/projectfoo'})
+    run_popen_mock.assert_not_called()
+    cluster_backend.apply.assert_not_called()
+
+
+def test_deploy_applies_once(progress_bar, run_popen_mock, template,
+                             kube_helpers, verify_build, verify_init,
+                             fetch_action_arg, cluster_backend,
+                             load_manifests, tmpdir, monkeypatch, patch):
+    """every template is rendered before all of them are applied at once"""
+    patch('schema.validate')
+    app = tmpdir.mkdir('app')
+    templates = app.mkdir('k8s-templates')
+    for name in ('job.yaml', 'service.yaml', 'configmap.yaml'):
+        templates.join(name).write('kind: Template')
+    monkeypatch.chdir(app)
+    template.return_value.substitute.return_value = 'kind: Rendered'
+    load_manifests.return_value = [{'kind': 'Job'}, {'kind': 'Service'},
+                                   {'kind': 'ConfigMap'}]
+    cluster_backend.apply.return_value = [
+        {'kind': 'job', 'name': 'app-1', 'result': 'created'},
+        {'kind': 'service', 'name': 'app-1', 'result': 'created'},
+        {'kind': 'configmap', 'name': 'app-1', 'result': 'unchanged'}]
+
+    output = deploy(no_push=True, skip_crd_check=True, interactive=False,
+                    extra_config_args={'registry': 'dockerhub'})
+
+    cluster_backend.apply.assert_called_once_with(
+        load_manifests.return_value, 'namespace')
+    job_dir = load_manifests.call_args[0][0]
+    assert sorted(os.listdir(job_dir)) == [
+        'configmap.yaml', 'job.yaml', 'service.yaml']
+    assert 'job/app-1 created' in output
+    assert 'configmap/app-1 unchanged' in output
+    assert 'Applied 3 object(s) in ' in output
+
+
+def test_deploy_reuses_prepared_manifests(
+        progress_bar, run_popen_mock, kube_helpers, verify_build,
+        verify_init, fetch_action_arg, load_manifests, manifest_cache,
+        tmpdir, monkeypatch, patch):
+    """a deploy with only a new image doesn't render the templates again"""
+    monkeypatch.delattr(manifest_cache, 'get_cached')
+    monkeypatch.delattr(manifest_cache, 'set_cached')
+    patch('schema.validate')
+    app = tmpdir.mkdir('app')
+    app.mkdir('k8s-templates').join('job.json').write(json.dumps({
+        'apiVersion': 'batch/v1', 'kind': 'Job',
+        'metadata': {'name': '$app-$run', 'namespace': '$namespace'},
+        'spec': {'template': {'spec': {'containers': [
+            {'name': 'app', 'image': '$image'}]}}}}))
+    monkeypatch.chdir(app)
+
+    def deployed_job():
+        job_dir = load_manifests.call_args[0][0]
+        with open(os.path.join(job_dir, 'job.json')) as f:
+            return json.load(f)
+
+    fetch_action_arg.side_effect = None
+    fetch_action_arg.return_value = 'gcr.io/app:1'
+    deploy(no_push=True, skip_crd_check=True, interactive=False,
+           extra_config_args={'registry': 'gcr.io'})
+    first = deployed_job()
+
+    monkeypatch.setattr(DeployCommand, '_prepare_template', MagicMock(
+        side_effect=AssertionError('rendered again')))
+    fetch_action_arg.return_value = 'gcr.io/app:2'
+    deploy(no_push=True, skip_crd_check=True, interactive=False,
+           extra_config_args={'registry': 'gcr.io'})
+    second = deployed_job()
+
+    assert second['spec']['template']['spec']['containers'][0]['image'] == \
+        'gcr.io/app:2'
+    assert second['metadata']['namespace'] == 'namespace'
+    assert second['metadata']['name'].startswith('app-')
+    assert second['metadata']['name'] != first['metadata']['name']
+    # the mode is part of the key, interactive deploys are prepared anew
+    with pytest.raises(AssertionError):
+        deploy(no_push=True, skip_crd_check=True, interactive=True,
+               extra_config_args={'registry': 'gcr.io'})
+
+
+@pytest.mark.parametrize('filename', ['job.yaml', 'job.json'])
+def test_deploy_pins_image_digest(
+        progress_bar, run_popen_mock, kube_helpers, verify_build,
+        verify_init, fetch_action_arg, load_manifests, manifest_cache,
+        tmpdir, monkeypatch, patch, filename):
+    """the image of the last push is deployed by its digest, when known,
+       and only its containers stop pulling it every time. The templates
+       rendered for a tag are reused for a digest.
+    """
+    monkeypatch.delattr(manifest_cache, 'get_cached')
+    monkeypatch.delattr(manifest_cache, 'set_cached')
+    patch('schema.validate')
+    app = tmpdir.mkdir('app')
+    containers = [
+        {'name': 'app', 'image': '$image', 'imagePullPolicy': 'Always'},
+        {'name': 'sidecar', 'image': 'fluentd:latest',
+         'imagePullPolicy': 'Always'}]
+    if filename.endswith('.json'):
+        template = json.dumps({'kind': 'Job', 'spec': {
+            'initContainers': containers[1:], 'containers': containers}})
+    else:
+        template = ('kind: Job\nspec:\n  initContainers:\n'
+                    '  - name: sidecar\n    image: fluentd:latest\n'
+                    '    imagePullPolicy: Always\n  containers:\n'
+                    '  - name: app\n    image: $image\n'
+                    '    imagePullPolicy: Always\n'
+                    '  - name: sidecar\n    image: fluentd:latest\n'
+                    '    imagePullPolicy: Always\n')
+    app.mkdir('k8s-templates').join(filename).write(template)
+    monkeypatch.chdir(app)
+
+    for digest, image, pull_policy in [
+            (None, 'gcr.io/app:1', 'Always'),
+            ('sha256:d1', 'gcr.io/app@sha256:d1', 'IfNotPresent')]:
+        fetch_action_arg.side_effect = lambda action, arg: {
+            'last_remote_container': 'gcr.io/app:1',
+            'digest': digest}.get(arg)
+        output = deploy(no_push=True, skip_crd_check=True,
+                        interactive=False,
+                        extra_config_args={'registry': 'gcr.io'})
+        assert 'Deploying {}'.format(image) in output
+        with open(os.path.join(load_manifests.call_args[0][0],
+                               filename)) as f:
+            job = yaml_module.safe_load(f)
+        app_container, sidecar = job['spec']['containers']
+        assert app_container['image'] == image
+        assert app_container['imagePullPolicy'] == pull_policy
+        assert sidecar['imagePullPolicy'] == 'Always'
+        assert job['spec']['initContainers'][0]['imagePullPolicy'] == \
+            'Always'
+        monkeypatch.setattr(DeployCommand, '_prepare_template', MagicMock(
+            side_effect=AssertionError('rendered again')))
+
+
+@pytest.fixture
+def sweep_app(tmpdir, monkeypatch, patch):
+    """an app whose job template uses the parameters that are swept"""
+    patch('schema.validate')
+    app = tmpdir.mkdir('app')
+    app.mkdir('k8s-templates').join('job.yaml').write(
+        'kind: Job\nmetadata:\n  name: $app-$run\nspec:\n'
+        '  workers: $num_workers\n  batch: $batch_size\n')
+    monkeypatch.chdir(app)
+    return {'registry': 'gcr.io', 'template_parameters': {
+        'num_workers': '1', 'batch_size': '32', 'epochs': '10'}}
+
+
+def test_deploy_sweep(progress_bar, run_popen_mock, kube_helpers,
+                      verify_build, verify_init, fetch_action_arg,
+                      load_manifests, cluster_backend, state_store,
+                      sweep_app):
+    """the image is pushed once and a job deployed for every combination
+       of the swept parameters, each recorded with its parameters
+    """
+    output = deploy(no_push=False, skip_crd_check=True, interactive=False,
+                    extra_config_args=sweep_app, parallel=3,
+                    sweep=[('num_workers', ['1', '2']),
+                           ('batch_size', ['32', '64'])])
+
+    assert run_popen_mock.call_count == 1
+    assert 'Deploying 4 job(s) of output' in output
+    assert cluster_backend.apply.call_count == 4
+    deployed = set()
+    for args, _ in load_manifests.call_args_list:
+        with open(os.path.join(args[0], 'job.yaml')) as f:
+            job = f.read()
+        assert 'name: {}\n'.format(os.path.basename(args[0])) in job
+        deployed.add(tuple(line.split(': ')[1] for line in
+                           job.splitlines()[-2:]))
+    assert deployed == {('1', '32'), ('1', '64'), ('2', '32'), ('2', '64')}
+
+    jobs = state_store.get_jobs()
+    assert sorted((job['sweep']['num_workers'], job['sweep']['batch_size'])
+                  for job in jobs) == sorted(deployed)
+    assert all(job['template_parameters']['epochs'] == '10' for job in jobs)
+    for job in jobs:
+        assert '{} num_workers={}, batch_size={}\n'.format(
+            job['name'], job['sweep']['num_workers'],
+            job['sweep']['batch_size']) in output
+
+
+@pytest.mark.parametrize('name', ['learning_rate', 'build_variant'])
+def test_deploy_sweep_unknown_parameter(
+        progress_bar, run_popen_mock, kube_helpers, verify_build,
+        verify_init, fetch_action_arg, cluster_backend, sweep_app, name):
+    """nothing is pushed for a sweep of a parameter the templates can't
+       be rendered with
+    """
+    sweep_app['template_parameters']['build_variant'] = 'cpu'
+    output = deploy(no_push=False, skip_crd_check=True, interactive=False,
+                    extra_config_args=sweep_app, catch_exception=SystemExit,
+                    sweep=[(name, ['1', '2'])])
+    assert name in output
+    run_popen_mock.assert_not_called()
+    cluster_backend.apply.assert_not_called()
+
+
+def test_deploy_sweep_apply_error(
+        progress_bar, run_popen_mock, kube_helpers, verify_build,
+        verify_init, fetch_action_arg, load_manifests, cluster_backend,
+        state_store, sweep_app):
+    """a job of the sweep that can't be applied doesn't stop the others,
+       the deploy fails once all of them are done
+    """
+    lock = threading.Lock()
+    applied = []
+
+    def apply(manifests, namespace):
+        with lock:
+            applied.append(namespace)
+            if len(applied) == 1:
+                raise ClusterError('job is invalid')
+        return []
+
+    cluster_backend.apply.side_effect = apply
+    output = deploy(no_push=True, skip_crd_check=True, interactive=False,
+                    extra_config_args=sweep_app, catch_exception=SystemExit,
+                    sweep=[('num_workers', ['1', '2', '4'])])
+    assert len(applied) == 3
+    assert 'job is invalid' in output
+    assert output.count(' failed\n') == 1
+    assert len(state_store.get_jobs()) == 3
+
+
+@pytest.mark.parametrize('report', [False, True])
+def test_deploy_wait_report(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        cluster_backend, state_store, patch, report):
+    """--wait waits for the job's pods, --report times how they came up"""
+    readiness = patch('log_helpers.check_for_pods_readiness')
+    readiness.return_value = {'app-1-worker-0': {}, 'app-1-ps-0': {}}
+    kube_helpers.pod_lifecycle.side_effect = lambda pod, events: {
+        'replica': 'worker', 'total': 3.0}
+    kube_helpers.lifecycle_summary.return_value = {'all': {'pods': 2}}
+    kube_helpers.lifecycle_table.return_value = ['REPLICA  PODS', 'worker']
+    state_store.record_action('deploy_report', {
+        'job_name': 'app-0', 'replicas': {'all': {
+            'p50': {'total': 5.0}, 'max': {'total': 7.0}}}})
+    kube_helpers.format_seconds.side_effect = lambda seconds: str(seconds)
+
+    output = deploy(
+        no_push=True, skip_crd_check=True, interactive=False, wait=True,
+        report=report, extra_config_args={'registry': 'gcr.io/projectfoo'})
+    job_name = readiness.call_args[0][1]
+    readiness.assert_called_once_with('namespace', job_name, 5)
+    assert job_name.startswith('app-')
+    assert '2 pod(s) running' in output
+    assert ('REPLICA  PODS\nworker\n' in output) == report
+    assert ('Previous deploy app-0: p50 total 5.0, max total 7.0' in
+            output) == report
+    if report:
+        cluster_backend.list.assert_any_call(
+            'events', 'namespace',
+            field_selector='involvedObject.name=app-1-ps-0')
+        recorded = state_store.get_action('deploy_report')
+        assert recorded['job_name'] == job_name
+        assert sorted(recorded['pods']) == ['app-1-ps-0', 'app-1-worker-0']
+        assert recorded['replicas'] == {'all': {'pods': 2}}
+
+
+def test_deploy_wait_timeout(
+        walk_mock, progress_bar, run_popen_mock, open_mock, template,
+        kube_helpers, verify_build, verify_init, fetch_action_arg, json_mock,
+        patch):
+    patch('log_helpers.check_for_pods_readiness').return_value = {}
+    deploy(no_push=True, skip_crd_check=True, interactive=False, wait=True,
+           catch_exception=SystemExit,
+           extra_config_args={'registry': 'gcr.io/projectfoo'})
+
+
+def test_deploy_update_app_run_id(state_store):
     run_id = str(uuid.uuid4())
-    json_mock_data = {
+    state_store.record_action('push', {
         'last_remote_container': 'gcr.io/app_name:container_id',
-        'last_push_duration': 0.18889}
-    json_mock.load.return_value = json_mock_data
+        'last_push_duration': 0.18889})
 
     DeployCommand._update_app_run_id(run_id)
 
-    assert json_mock_data['app_run_id'] == run_id
+    push_data = state_store.get_action('push')
+    assert push_data['app_run_id'] == run_id
+    assert push_data['last_push_duration'] == 0.18889
 
 
 def test_image_push_error(walk_mock, progress_bar, run_popen_mock, open_mock,
@@ -384,7 +999,6 @@ def test_deploy_custom_deploy_interactive(walk_mock, progress_bar,
         'last_remote_container': 'gcr.io/app_name:container_id',
         'last_push_duration': 0.18889}
     is_custom_mock.return_value = True
-    json_mock.loads.return_value = {'status': {'phase': 'Running'}}
     yaml.return_value = {
         'template': {'foo': 'bar'}, 'containers': [{'foo': 'bar'}]}
     output = deploy(
@@ -395,3 +1009,55 @@ def test_deploy_custom_deploy_interactive(walk_mock, progress_bar,
                                "gpus": 0,
                                "num_workers": 1}})
     verify_successful_deploy(output, interactive=True)
+
+
+@pytest.mark.parametrize('undeploy_previous', [True, False])
+def test_deploy_watch(verify_build, verify_init, get_sync_spec_mock, patch,
+                      state_store, undeploy_previous):
+    """the pipeline runs once right away and then on every change set,
+       changes cancel a build or push that's running
+    """
+    builder = patch('BuildCommand').return_value
+    undeploy = patch('UndeployCommand')
+    event_handler = patch('EventHandler')
+    observer = patch('Observer')
+    patch('time.sleep', MagicMock(side_effect=KeyboardInterrupt))
+    push = patch('DeployCommand._push')
+    deploy_new_container = patch('DeployCommand._deploy_new_container')
+    state_store.add_job('app-1')
+    deploy_new_container.side_effect = lambda: state_store.add_job('app-2')
+
+    deploy_command = DeployCommand(
+        {'deploy': True, '--watch': True, '--no-push': False,
+         '--skip-crd-check': True, '--undeploy-previous': undeploy_previous,
+         '--verbose': False})
+    deploy_command.config = {'name': 'app', 'namespace': 'namespace'}
+    with catch_stdout() as caught_output:
+        deploy_command.action()
+        output = caught_output.getvalue()
+
+    builder._build.assert_called_once_with()
+    assert builder.preexec_fn is os.setsid
+    push.assert_called_once_with()
+    deploy_new_container.assert_called_once_with()
+    if undeploy_previous:
+        assert undeploy.call_args[0][0]['--job-name'] == 'app-1'
+        undeploy.return_value.action.assert_called_once_with()
+        assert 'undeploy ' in output
+    else:
+        undeploy.assert_not_called()
+    assert 'Pipeline completed: build ' in output
+    observer.return_value.schedule.assert_called_once_with(
+        event_handler.return_value, './', recursive=True)
+
+    # a change while building cancels the build
+    run_pipeline = event_handler.call_args[0][0]
+    cancel_stale = event_handler.call_args[1]['on_change']
+    builder._build.side_effect = lambda: cancel_stale(['main.py'])
+    with catch_stdout() as caught_output:
+        run_pipeline()
+        output = caught_output.getvalue()
+    builder.cancel.assert_called_once_with()
+    assert 'Cancelling build after changes to main.py' in output
+    assert 'Pipeline cancelled: build ' in output
+    push.assert_called_once_with()
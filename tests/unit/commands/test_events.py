@@ -20,7 +20,9 @@
 
 from __future__ import print_function
 from conditional import conditional
+from mock import MagicMock
 
+import itertools
 import pytest
 import uuid
 from mlt.commands.events import EventsCommand
@@ -34,14 +36,14 @@ def open_mock(patch):
 
 @pytest.fixture
 def get_only_one_job(patch):
-    def mocker(job_desired, error_msg):
+    def mocker(job_desired, error_msg, truncate=True):
         return job_desired
     return patch('files.get_only_one_job', mocker)
 
 
-@pytest.fixture
-def process_helpers(patch):
-    return patch('process_helpers.run_popen')
+@pytest.fixture(autouse=True)
+def load_manifests(patch):
+    return patch('files.load_manifests', MagicMock(return_value=[]))
 
 
 @pytest.fixture
@@ -50,7 +52,8 @@ def verify_init(patch):
 
 
 def get_events(catch_exception=None, job_name=None):
-    events_command = EventsCommand({'events': True, '--job-name': job_name})
+    events_command = EventsCommand({'events': True, '--job-name': job_name,
+                                    '--follow': False})
     events_command.config = {'name': 'app', 'namespace': 'namespace'}
 
     with catch_stdout() as caught_output:
@@ -62,43 +65,115 @@ def get_events(catch_exception=None, job_name=None):
 # END SIMILAR STUFF TO TEST_LOGS
 
 
-def test_events_get_events(open_mock, verify_init, process_helpers,
+def event(name, message, count=1):
+    return {'metadata': {'name': '{}.{}'.format(name, hash(message))},
+            'involvedObject': {'name': name, 'kind': 'Pod'},
+            'lastTimestamp': '2018-08-01T12:00:00Z',
+            'firstTimestamp': '2018-08-01T12:00:00Z', 'count': count,
+            'type': 'Normal', 'reason': 'Started',
+            'source': {'component': 'kubelet'}, 'message': message}
+
+
+def test_events_get_events(open_mock, verify_init, cluster_backend,
                            get_only_one_job):
-    head_value = bytearray("LAST SEEN   FIRST SEEN   COUNT", 'utf-8')
     # technically event_value is different from app_run_id
     # but didn't want to set a global app_run_id
     # if others disagree, I'm not super opposed to it
     job = 'app-{}'.format(uuid.uuid4())
-    event_value = bytearray(job, 'utf-8')
-    process_helpers.return_value.stdout.readline.side_effect = \
-        [head_value, event_value, bytearray('', 'utf-8')]
-    process_helpers.return_value.poll.return_value = 1
-    process_helpers.return_value.stderr.readline.return_value = ''
+    cluster_backend.list.return_value = [
+        event(job + '-worker-0', 'Started container'),
+        event('someone-elses-pod', 'Pulled image')]
 
     events = get_events(job_name=job)
-    assert head_value.decode('utf-8') in events
-    assert event_value.decode('utf-8') in events
+    assert 'LAST SEEN' in events
+    assert job + '-worker-0' in events
+    assert 'Started container' in events
+    assert 'someone-elses-pod' not in events
+    cluster_backend.list.assert_called_once_with('events', 'namespace')
 
 
-def test_events_no_push_json_file(open_mock, verify_init, process_helpers):
+def test_events_no_push_json_file(open_mock, verify_init, state_store):
+    state_store.add_job('app-1234', created=1)
+    state_store.add_job('app-5678', created=2)
     error_msg = "Please use --job-name flag to query for job events."
     assert error_msg in get_events(catch_exception=SystemExit)
 
 
 def test_events_no_resources_found(open_mock, verify_init,
-                                   get_only_one_job, process_helpers):
-    process_helpers.side_effect = Exception("No resources found")
+                                   get_only_one_job, cluster_backend):
+    cluster_backend.list.side_effect = Exception("No resources found")
 
-    assert "No resources found" in get_events(catch_exception=SystemExit)
+    assert "No resources found" in get_events(catch_exception=SystemExit,
+                                              job_name='app-1234')
 
 
 def test_events_no_events_to_display(open_mock, verify_init,
-                                     get_only_one_job, process_helpers):
-    head_value = "LAST SEEN   FIRST SEEN   COUNT"
-    process_helpers.return_value.stdout.readline.side_effect = \
-        [head_value, bytearray("current job events missing", 'utf-8'),
-         bytearray('', 'utf-8')]
-    process_helpers.return_value.poll.return_value = 1
-    process_helpers.return_value.stderr.readline.return_value = ''
-
-    assert "No events to display for this job" in get_events()
+                                     get_only_one_job, cluster_backend):
+    cluster_backend.list.return_value = [
+        event('current-job-events-missing', 'Pulled image')]
+
+    assert "No events to display for this job" in get_events(
+        job_name='app-1234')
+
+
+def test_events_filtered_on_server(open_mock, verify_init, cluster_backend,
+                                   get_only_one_job, load_manifests):
+    job = 'app-{}'.format(uuid.uuid4())
+    load_manifests.return_value = [
+        {'kind': 'TFJob', 'metadata': {'name': job}},
+        {'kind': 'Service', 'metadata': {'name': job}}]
+    events = {
+        'involvedObject.name=' + job: [event(job, 'Created pod')],
+        'involvedObject.name=' + job + '-worker-0': [
+            event(job + '-worker-0', 'Started container')]}
+
+    def list_mock(resource, namespace, label_selector=None,
+                  field_selector=None):
+        if resource == 'pods':
+            assert label_selector == 'tf_job_name=' + job
+            return [{'metadata': {'name': job + '-worker-0'}}]
+        return events[field_selector]
+    cluster_backend.list.side_effect = list_mock
+
+    output = get_events(job_name=job)
+    assert 'Created pod' in output
+    assert 'Started container' in output
+    # the job's name is only asked for once, even though two objects have it
+    assert cluster_backend.list.call_count == 3
+    load_manifests.assert_called_once_with('k8s/' + job)
+
+
+def test_events_follow(open_mock, verify_init, cluster_backend,
+                       get_only_one_job, load_manifests):
+    job = 'app-{}'.format(uuid.uuid4())
+    load_manifests.return_value = [{'kind': 'Job', 'metadata': {'name': job}}]
+    existing = event(job, 'Created pod')
+    cluster_backend.list.side_effect = lambda resource, *args, **kwargs: \
+        [existing] if resource == 'events' else []
+
+    def watch_mock(resource, namespace, label_selector=None,
+                   field_selector=None):
+        if resource == 'pods':
+            return iter([('ADDED', {'metadata': {'name': job + '-abcde'}})])
+        if field_selector == 'involvedObject.name=' + job:
+            # the existing event is replayed as the watch starts
+            return iter([('ADDED', existing),
+                         ('MODIFIED', event(job, 'Created pod', count=2))])
+        return iter([('ADDED', event(job + '-abcde', 'Pulled image'))])
+    cluster_backend.watch.side_effect = watch_mock
+
+    events_command = EventsCommand({'events': True, '--job-name': job,
+                                    '--follow': True})
+    rows = events_command._follow_events(job, 'namespace')
+    lines = list(itertools.islice(rows, 4))
+    rows.close()
+
+    assert 'LAST SEEN' in lines[0]
+    assert 'Created pod' in lines[1]
+    followed = ' '.join(lines[2:])
+    assert '  2  {}  Pod'.format(job) in followed
+    assert 'Pulled image' in followed
+    watched = [kwargs.get('field_selector') or kwargs.get('label_selector')
+               for _, kwargs in cluster_backend.watch.call_args_list]
+    assert 'job-name=' + job in watched
+    assert 'involvedObject.name={}-abcde'.format(job) in watched
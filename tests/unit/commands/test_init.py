@@ -319,6 +319,21 @@ def test_template_params():
         assert param["value"] == result_params[param["name"]]
 
 
+def test_build_variants():
+    init = InitCommand({
+        'init': True,
+        '--template': 'horovod',
+        '--template-repo': project.basedir(),
+        '--registry': True,
+        '--namespace': None,
+        '<name>': str(uuid.uuid4())
+    })
+    variants = {'cpu': {'GPUS': '0'}, 'gpu': {'GPUS': '1'}}
+    result = init._build_mlt_json(None, None, variants)
+    assert result[constants.BUILD_VARIANTS] == variants
+    assert constants.BUILD_VARIANTS not in init._build_mlt_json(None, None)
+
+
 def test_no_template_params():
     new_dir = str(uuid.uuid4())
     init_dict = {
@@ -34,16 +34,11 @@ def open_mock(patch):
 
 @pytest.fixture
 def get_only_one_file(patch):
-    def mocker(job_desired, error_msg):
+    def mocker(job_desired, error_msg, truncate=True):
         return job_desired
     return patch('log_helpers.files.get_only_one_job', mocker)
 
 
-@pytest.fixture
-def sleep_mock(patch):
-    return patch('log_helpers.sleep')
-
-
 @pytest.fixture
 def process_helpers(patch):
     return patch('log_helpers.process_helpers.run_popen')
@@ -59,11 +54,11 @@ def verify_init(patch):
     return patch('config_helpers.load_config')
 
 
-def call_logs(catch_exception=None, job_name=None):
+def call_logs(catch_exception=None, job_name='app-1234'):
     logs_command = LogsCommand(
         {'logs': True,
          '--since': '1m',
-         '--retries': 5,
+         '--timeout': 5,
          '--job-name': job_name
          })
     logs_command.config = {'name': 'app', 'namespace': 'namespace'}
@@ -75,7 +70,7 @@ def call_logs(catch_exception=None, job_name=None):
     return output
 
 
-def test_logs_get_logs(open_mock, verify_init, sleep_mock,
+def test_logs_get_logs(open_mock, verify_init,
                        check_for_pods_readiness_mock,
                        get_only_one_file, process_helpers):
     check_for_pods_readiness_mock.return_value = True
@@ -85,13 +80,15 @@ def test_logs_get_logs(open_mock, verify_init, sleep_mock,
     assert call_logs() == "log output"
 
 
-def test_logs_no_push_json_file(open_mock, verify_init, sleep_mock,
-                                process_helpers):
+def test_logs_no_push_json_file(open_mock, verify_init,
+                                process_helpers, state_store):
+    state_store.add_job('app-1234', created=1)
+    state_store.add_job('app-5678', created=2)
     assert "Please use --job-name flag to pick a job to tail." in call_logs(
-        catch_exception=SystemExit)
+        catch_exception=SystemExit, job_name=None)
 
 
-def test_logs_command_not_found(open_mock, sleep_mock, get_only_one_file,
+def test_logs_command_not_found(open_mock, get_only_one_file,
                                 check_for_pods_readiness_mock, verify_init,
                                 process_helpers):
     check_for_pods_readiness_mock.return_value = True
@@ -103,7 +100,7 @@ def test_logs_command_not_found(open_mock, sleep_mock, get_only_one_file,
     assert 'It is a prerequisite' in call_logs(catch_exception=SystemExit)
 
 
-def test_logs_no_logs_found(open_mock, sleep_mock, get_only_one_file,
+def test_logs_no_logs_found(open_mock, get_only_one_file,
                             check_for_pods_readiness_mock, verify_init,
                             process_helpers):
     check_for_pods_readiness_mock.return_value = False
@@ -111,7 +108,7 @@ def test_logs_no_logs_found(open_mock, sleep_mock, get_only_one_file,
     assert "No logs found for this job." in call_logs()
 
 
-def test_logs_keyboardinterrupt(open_mock, verify_init, sleep_mock,
+def test_logs_keyboardinterrupt(open_mock, verify_init,
                                 get_only_one_file,
                                 check_for_pods_readiness_mock,
                                 process_helpers):
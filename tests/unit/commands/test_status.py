@@ -21,6 +21,7 @@
 from __future__ import print_function
 from conditional import conditional
 from contextlib import contextmanager
+import threading
 
 from subprocess import CalledProcessError
 
@@ -29,6 +30,7 @@ from mock import MagicMock
 from test_utils.io import catch_stdout
 
 from mlt.commands.status import StatusCommand
+from mlt.utils.cluster_backends import ClusterError
 
 
 @pytest.fixture
@@ -37,8 +39,11 @@ def init_mock(patch):
 
 
 @pytest.fixture
-def get_deployed_jobs(patch):
-    return patch('files.get_deployed_jobs', lambda: ['k8s/job1'])
+def deployed(state_store):
+    state_store.record_action('push', {
+        'last_remote_container': 'gcr.io/app_name:container_id'})
+    state_store.add_job('job1')
+    return state_store
 
 
 @pytest.fixture
@@ -52,11 +57,6 @@ def isfile_mock(patch):
     return patch('os.path.isfile')
 
 
-@pytest.fixture
-def getmtime_mock(patch):
-    return patch('os.path.getmtime')
-
-
 @pytest.fixture
 def listdir_mock(patch):
     return patch('os.listdir')
@@ -72,11 +72,6 @@ def subprocess_mock(patch):
     return patch('subprocess.check_output')
 
 
-@pytest.fixture
-def run_popen_mock(patch):
-    return patch('process_helpers.run_popen')
-
-
 @pytest.fixture
 def default_status_mock(patch):
     return patch('StatusCommand._default_status')
@@ -98,35 +93,45 @@ def status(count=1, catch_exception=None):
     return output
 
 
+def pod(name, phase):
+    return {'metadata': {'name': name}, 'status': {'phase': phase}}
+
+
 @contextmanager
 def check_different_valid_statuses(job_kind, init_mock, isfile_mock,
-                                   run_popen_mock, subprocess_mock):
+                                   cluster_backend, subprocess_mock):
     """
-    Wrapper to help prep subprocess mocks and then check their output
+    Wrapper to help prep cluster and subprocess mocks and then check their
+    output
     """
     # hack to grab what code being wrapped returned
     output = type("OutputGrabber", (object,), {})
 
     if job_kind == 'job':
-        generic_status = "Successful normal pod status"
-        run_popen_mock.return_value.wait.side_effect = lambda: print(
-            generic_status)
+        cluster_backend.list.return_value = [pod('job1-abcde', 'Running')]
 
         yield output
-        assert generic_status in output.wrapper_data
+        assert 'job1-abcde' in output.wrapper_data
+        assert 'Running' in output.wrapper_data
+        cluster_backend.list.assert_called_once_with(
+            'pods', 'namespace', label_selector='job-name=job1')
 
     elif job_kind in ('tfjob', 'pytorchjob'):
-        crd_info = MagicMock()
-        crd_status = "Successful crd status"
-        crd_info.communicate.return_value = (
-            bytearray(crd_status, 'utf-8'), "")
-        crd_info.wait.return_value = 0
-        run_popen_mock.side_effect = [crd_info, MagicMock()]
+        cluster_backend.get.return_value = {
+            'metadata': {'name': 'job1'},
+            'status': {'conditions': [
+                {'type': 'Created', 'status': 'True'},
+                {'type': 'Running', 'status': 'True'}]}}
+        cluster_backend.list.return_value = [pod('job1-worker-0', 'Running')]
 
         yield output
-        assert crd_status in output.wrapper_data
         assert "CRD: " in output.wrapper_data
         assert "Pods: " in output.wrapper_data
+        assert 'job1-worker-0' in output.wrapper_data
+        crd_status = output.wrapper_data.split('Pods: ')[0]
+        assert 'Running' in crd_status
+        cluster_backend.get.assert_called_once_with(
+            job_kind, 'job1', 'namespace')
 
     else:
         custom_status = "Successful custom status"
@@ -152,7 +157,8 @@ def test_uninitialized_status():
 @pytest.mark.parametrize('job_kind', [
     'job', 'tfjob', 'pytorchjob', 'experiment'])
 def test_status(get_job_kinds, job_kind, init_mock, isfile_mock,
-                run_popen_mock, subprocess_mock, get_sync_spec_mock):
+                cluster_backend, subprocess_mock, get_sync_spec_mock,
+                deployed):
     """
     Tests calling the status command on jobs
     Types of jobs: generic, crd, custom
@@ -161,7 +167,7 @@ def test_status(get_job_kinds, job_kind, init_mock, isfile_mock,
 
     with check_different_valid_statuses(
             job_kind, init_mock, isfile_mock,
-            run_popen_mock, subprocess_mock) as output:
+            cluster_backend, subprocess_mock) as output:
         get_job_kinds.return_value = ({job_kind}, True)
         output.wrapper_data = status()
 
@@ -170,16 +176,59 @@ def test_status_no_deploy(init_mock, open_mock, isfile_mock):
     """
     Tests calling the status command before this app has been deployed.
     """
-    isfile_mock.return_value = False
     output = status(catch_exception=SystemExit)
     expected_output = "This app has not been deployed yet"
     assert expected_output in output
 
 
+def test_status_jobs_sorted_by_creation_time(init_mock, deployed, patch):
+    """
+    Tests that `<count>` jobs are shown in the order they were deployed.
+    """
+    patch('StatusCommand._display_status')
+    created = deployed.get_job('job1')['created']
+    deployed.add_job('job3', created=created + 2)
+    deployed.add_job('job2', created=created + 1)
+    output = status(count=2)
+    assert 'job3' not in output
+    assert output.index('Job: job1') < output.index('Job: job2')
+
+
+def test_status_many_jobs(init_mock, deployed, get_job_kinds,
+                          cluster_backend):
+    """
+    Tests that the template kinds are read once, and statuses are printed in
+    job order even when a later job's status comes back first.
+    """
+    get_job_kinds.return_value = ({'job'}, True)
+    created = deployed.get_job('job1')['created']
+    for i in range(2, 21):
+        deployed.add_job('job{}'.format(i), created=created + i)
+    first_job_listed = threading.Event()
+
+    def list_pods(resource, namespace, label_selector):
+        job = label_selector.split('=')[1]
+        if job == 'job1':
+            # hold the first job back until another one got its pods
+            first_job_listed.wait(5)
+        else:
+            first_job_listed.set()
+        return [pod(job + '-abcde', 'Running')]
+    cluster_backend.list.side_effect = list_pods
+
+    output = status(count=20)
+    get_job_kinds.assert_called_once_with()
+    positions = [output.index('Job: job{} '.format(i)) for i in range(1, 21)]
+    assert positions == sorted(positions)
+    for i in range(1, 21):
+        job_output = output.split('Job: job{} '.format(i))[1]
+        assert job_output.split('Job: ')[0].count('job{}-abcde'.format(i)) \
+            == 1
+
+
 def test_successful_status_no_sync(init_mock, open_mock, isfile_mock,
                                    subprocess_mock, get_sync_spec_mock,
-                                   listdir_mock, get_deployed_jobs,
-                                   get_job_kinds, getmtime_mock):
+                                   listdir_mock, deployed, get_job_kinds):
     """
     Tests successful call to the status command.
     """
@@ -193,8 +242,8 @@ def test_successful_status_no_sync(init_mock, open_mock, isfile_mock,
 
 def test_successful_status_after_sync(init_mock, open_mock, isfile_mock,
                                       subprocess_mock, get_sync_spec_mock,
-                                      listdir_mock, get_deployed_jobs,
-                                      get_job_kinds, getmtime_mock):
+                                      listdir_mock, deployed,
+                                      get_job_kinds):
     """
     Tests successful call to the status command.
     """
@@ -207,9 +256,8 @@ def test_successful_status_after_sync(init_mock, open_mock, isfile_mock,
 
 
 def test_status_not_in_makefile(init_mock, open_mock, isfile_mock,
-                                subprocess_mock, listdir_mock,
-                                get_deployed_jobs, get_job_kinds,
-                                getmtime_mock):
+                                subprocess_mock, listdir_mock, deployed,
+                                get_job_kinds):
     """
     Tests use case where status target is not in the Makefile.
     """
@@ -222,8 +270,29 @@ def test_status_not_in_makefile(init_mock, open_mock, isfile_mock,
     assert expected_output in status_output
 
 
+def test_status_crd_undeployed(init_mock, get_job_kinds, deployed):
+    """
+    Tests the status of a crd job that no longer exists on the cluster.
+    """
+    get_job_kinds.return_value = ({'tfjob'}, True)
+    output = status()
+    assert "The job may have been undeployed." in output
+    assert "No resources found." in output
+
+
+def test_status_cluster_error(init_mock, get_job_kinds, deployed,
+                              cluster_backend):
+    """
+    Tests an error from the cluster while getting a job's status.
+    """
+    get_job_kinds.return_value = ({'job'}, True)
+    cluster_backend.list.side_effect = ClusterError('forbidden')
+    output = status(catch_exception=SystemExit)
+    assert "Error while getting app status: forbidden" in output
+
+
 def test_status_makefile_error(init_mock, open_mock, isfile_mock,
-                               subprocess_mock, get_job_kinds):
+                               subprocess_mock, get_job_kinds, deployed):
     """
     Tests use case where we get an error from executing the status command
     in the Makefile.
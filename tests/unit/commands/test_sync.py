@@ -44,11 +44,6 @@ def open_mock(patch):
     return patch('open')
 
 
-@pytest.fixture
-def json_mock(patch):
-    return patch('json')
-
-
 @pytest.fixture
 def subprocess_mock(patch):
     return patch('subprocess.check_output')
@@ -111,13 +106,13 @@ def test_sync_commands_no_enable_sync(sync_subcommand, init_mock, open_mock,
         assert expected_output in output
 
 
-def test_sync_synced(init_mock, open_mock, isfile_mock, json_mock,
+def test_sync_synced(init_mock, open_mock, isfile_mock, state_store,
                      subprocess_mock, get_sync_spec_mock):
     """
     Tests trying to setup sync again
     """
-    json_mock.load.side_effect = [{"app_run_id": "123-456-789"},
-                                  {"sync_spec": "hello-world"}]
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
+    state_store.record_action('sync', {"sync_spec": "hello-world"})
     get_sync_spec_mock.return_value = 'hello-world'
 
     with pytest.raises(SystemExit):
@@ -149,7 +144,7 @@ def test_sync_commands_not_deployed(sync_subcommand, init_mock, open_mock,
         assert expected_output in output
 
 
-def test_successful_sync(init_mock, open_mock, isfile_mock, json_mock,
+def test_successful_sync(init_mock, open_mock, isfile_mock, state_store,
                          get_sync_spec_mock, subprocess_mock):
     """
     Tests successful call to the sync create command.
@@ -164,12 +159,14 @@ def test_successful_sync(init_mock, open_mock, isfile_mock, json_mock,
         }
     }
     init_mock.return_value = mlt_config
-    json_mock.load.return_value = {"app_run_id": "123-456-789"}
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
     get_sync_spec_mock.return_value = None
     expected_output = "Syncing spec is created successfully"
     subprocess_mock.return_value.decode.return_value = expected_output
     sync_output = sync(create=True)
     assert expected_output in sync_output
+    assert state_store.get_action('sync')['sync_spec'] == \
+        'hello-world-123-456-789'
 
 
 @pytest.mark.parametrize("sync_command", [
@@ -177,7 +174,7 @@ def test_successful_sync(init_mock, open_mock, isfile_mock, json_mock,
     'sync(delete=True)',
 ])
 def test_reload_delete_not_synced(sync_command, init_mock, open_mock,
-                                  isfile_mock, json_mock, subprocess_mock,
+                                  isfile_mock, state_store, subprocess_mock,
                                   get_sync_spec_mock):
     """
     Tests reloading sync agent or deleting sync spec before sync setup
@@ -192,7 +189,7 @@ def test_reload_delete_not_synced(sync_command, init_mock, open_mock,
         }
     }
     init_mock.return_value = mlt_config
-    json_mock.load.return_value = {"app_run_id": "123-456-789"}
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
     get_sync_spec_mock.return_value = None
 
     with pytest.raises(SystemExit):
@@ -201,7 +198,7 @@ def test_reload_delete_not_synced(sync_command, init_mock, open_mock,
         assert expected_output in output
 
 
-def test_reload_synced(init_mock, open_mock, isfile_mock, json_mock,
+def test_reload_synced(init_mock, open_mock, isfile_mock, state_store,
                        subprocess_mock, get_sync_spec_mock):
     """
     Tests reloading sync agent after sync create
@@ -216,7 +213,7 @@ def test_reload_synced(init_mock, open_mock, isfile_mock, json_mock,
         }
     }
     init_mock.return_value = mlt_config
-    json_mock.load.return_value = {"app_run_id": "123-456-789"}
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
     get_sync_spec_mock.return_value = "hello-world"
     expected_output = "Sync agent is restarted"
     subprocess_mock.return_value.decode.return_value = expected_output
@@ -224,7 +221,7 @@ def test_reload_synced(init_mock, open_mock, isfile_mock, json_mock,
     assert expected_output in sync_output
 
 
-def test_delete_synced(init_mock, open_mock, isfile_mock, json_mock,
+def test_delete_synced(init_mock, open_mock, isfile_mock, state_store,
                        get_sync_spec_mock, subprocess_mock):
     """
     Tests delete sync spec after sync setup
@@ -239,17 +236,18 @@ def test_delete_synced(init_mock, open_mock, isfile_mock, json_mock,
         }
     }
     init_mock.return_value = mlt_config
-    json_mock.load.side_effect = [{"app_run_id": "123-456-789"},
-                                  {"sync_spec": "hello-world"}]
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
+    state_store.record_action('sync', {"sync_spec": "hello-world"})
     get_sync_spec_mock.return_value = "hello-world"
     expected_output = "Syncing spec is successfully deleted"
     subprocess_mock.return_value.decode.return_value = expected_output
     sync_output = sync(delete=True)
     assert expected_output in sync_output
+    assert state_store.get_action('sync')['sync_spec'] is None
 
 
 def test_sync_create_not_in_makefile(init_mock, open_mock, isfile_mock,
-                                     get_sync_spec_mock, json_mock,
+                                     get_sync_spec_mock, state_store,
                                      subprocess_mock):
     """
     Tests use case where sync create target is not in the Makefile.
@@ -264,8 +262,8 @@ def test_sync_create_not_in_makefile(init_mock, open_mock, isfile_mock,
         }
     }
     init_mock.return_value = mlt_config
-    json_mock.load.side_effect = [{"app_run_id": "123-456-789"},
-                                  {"sync_spec": "hello-world"}]
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
+    state_store.record_action('sync', {"sync_spec": "hello-world"})
     get_sync_spec_mock.return_value = None
     error_msg = "This app does not support the `mlt sync create` command"
     subprocess_mock.side_effect = CalledProcessError(
@@ -275,7 +273,7 @@ def test_sync_create_not_in_makefile(init_mock, open_mock, isfile_mock,
 
 
 def test_sync_reload_not_in_makefile(init_mock, open_mock, isfile_mock,
-                                     get_sync_spec_mock, json_mock,
+                                     get_sync_spec_mock, state_store,
                                      subprocess_mock):
     """
     Tests use case where sync reload target is not in the Makefile.
@@ -290,8 +288,8 @@ def test_sync_reload_not_in_makefile(init_mock, open_mock, isfile_mock,
         }
     }
     init_mock.return_value = mlt_config
-    json_mock.load.side_effect = [{"app_run_id": "123-456-789"},
-                                  {"sync_spec": "hello-world"}]
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
+    state_store.record_action('sync', {"sync_spec": "hello-world"})
     get_sync_spec_mock.return_value = 'hello-world'
     error_msg = "This app does not support the `mlt sync reload` command"
     subprocess_mock.side_effect = CalledProcessError(
@@ -301,7 +299,7 @@ def test_sync_reload_not_in_makefile(init_mock, open_mock, isfile_mock,
 
 
 def test_sync_delete_not_in_makefile(init_mock, open_mock, isfile_mock,
-                                     get_sync_spec_mock, json_mock,
+                                     get_sync_spec_mock, state_store,
                                      subprocess_mock):
     """
     Tests use case where sync delete target is not in the Makefile.
@@ -316,8 +314,8 @@ def test_sync_delete_not_in_makefile(init_mock, open_mock, isfile_mock,
         }
     }
     init_mock.return_value = mlt_config
-    json_mock.load.side_effect = [{"app_run_id": "123-456-789"},
-                                  {"sync_spec": "hello-world"}]
+    state_store.record_action('push', {"app_run_id": "123-456-789"})
+    state_store.record_action('sync', {"sync_spec": "hello-world"})
     get_sync_spec_mock.return_value = 'hello-world'
     error_msg = "This app does not support the `mlt sync delete` command"
     subprocess_mock.side_effect = CalledProcessError(
@@ -18,6 +18,8 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import os
+
 from mock import MagicMock
 
 from mlt.commands.undeploy import UndeployCommand
@@ -196,8 +198,12 @@ def test_undeploy_by_job_name(proc_helpers, remove_job_dir_mock,
     """tests `mlt undeploy --job-name` to undeploy a job."""
     remove_job_dir_mock.input_value = 'k8s/job1'
     get_deployed_jobs_mock.return_value = ["job1"]
+    get_deployed_jobs_mock.return_value = ["job1", "job2"]
     UndeployCommand({'undeploy': True, '--job-name': 'job1'}).action()
-    proc_helpers.run.assert_called_once()
+    proc_helpers.run.assert_called_once_with(
+        ["kubectl", "--namespace", "bar", "delete", "-f",
+         os.path.join("k8s", "job1"), "--recursive"],
+        raise_on_failure=True)
 
 
 def test_undeploy_by_bad_job_name(
@@ -0,0 +1,49 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import pytest
+from mock import MagicMock
+
+from mlt.utils import state
+
+
+@pytest.fixture(autouse=True)
+def state_store(monkeypatch, tmpdir):
+    """every unit test gets its own empty project state store so nothing
+       is written to the cwd. Created before any test mocks are in place.
+    """
+    store = state.StateStore(str(tmpdir))
+    monkeypatch.setattr('mlt.utils.state.get_store',
+                        lambda work_dir=None, project=True: store)
+    yield store
+    store.close()
+
+
+@pytest.fixture(autouse=True)
+def cluster_backend(monkeypatch):
+    """every unit test gets a mock cluster backend so nothing talks to a
+       real cluster
+    """
+    backend = MagicMock()
+    backend.context = 'test-context'
+    backend.get.return_value = None
+    backend.list.return_value = []
+    monkeypatch.setattr('mlt.utils.cluster_backends._backend', backend)
+    return backend
@@ -18,45 +18,127 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-from mock import MagicMock, patch
+import os
+import threading
+
+import pytest
+from mock import MagicMock
+from watchdog.events import (DirModifiedEvent, FileCreatedEvent,
+                             FileModifiedEvent, FileMovedEvent)
 
 from mlt.event_handler import EventHandler
 from test_utils.io import catch_stdout
 
 
-@patch('mlt.event_handler.call')
-def test_dispatch_git(call):
-    """if event relates to git we return immediately"""
-    event_handler = EventHandler(lambda: 'foo')
-    event_handler.dispatch(MagicMock(src_path='./.git/index'))
-    call.assert_not_called()
+@pytest.fixture
+def project(tmpdir):
+    project = tmpdir.mkdir('project')
+    project.join('.gitignore').write('*.pyc\nk8s/\n')
+    return project
+
+
+@pytest.fixture
+def no_subprocess(monkeypatch):
+    def popen(*args, **kwargs):
+        raise AssertionError('no process should be started')
+    monkeypatch.setattr('subprocess.Popen', popen)
 
 
-@patch('mlt.event_handler.call')
-def test_dispatch_directory(call):
-    """if event is the main dir we do nothing"""
-    event_handler = EventHandler(lambda: 'foo')
-    event_handler.dispatch(MagicMock(src_path='./'))
-    call.assert_not_called()
+def handler(project, callback=None, delay=60):
+    return EventHandler(callback or MagicMock(), delay=delay,
+                        root=str(project))
 
 
-@patch('mlt.event_handler.open')
-@patch('mlt.event_handler.call')
-def test_dispatch_is_ignored(call, open_mock):
-    """if git check-ignore passes, we do nothing"""
-    call.return_value = 0
-    event_handler = EventHandler(lambda: 'foo')
-    event_handler.dispatch(MagicMock())
+def modified(project, path):
+    return FileModifiedEvent(os.path.join(str(project), path))
+
+
+@pytest.mark.parametrize('path', [
+    '.git/index', '.mlt/state.db', 'main.pyc', 'src/main.pyc',
+    'k8s/app-1/job.yaml', '../other/main.py'])
+def test_dispatch_ignored(project, no_subprocess, path):
+    event_handler = handler(project)
+    event_handler.dispatch(modified(project, path))
     assert event_handler.timer is None
+    assert event_handler.changes == set()
+
+
+def test_dispatch_directory(project, no_subprocess):
+    """the watched dir and directories modified with their files don't
+       count as changes
+    """
+    event_handler = handler(project)
+    event_handler.dispatch(DirModifiedEvent(str(project)))
+    event_handler.dispatch(DirModifiedEvent(str(project.join('src'))))
+    assert event_handler.timer is None
+
+
+def test_dispatch_coalesces_changes(project, no_subprocess):
+    event_handler = handler(project)
+    for _ in range(100):
+        event_handler.dispatch(modified(project, 'main.py'))
+        event_handler.dispatch(modified(project, 'main.pyc'))
+    event_handler.dispatch(FileCreatedEvent(str(project.join('src/a.py'))))
+    event_handler.dispatch(FileMovedEvent(
+        str(project.join('b.tmp')), str(project.join('b.py'))))
+    assert event_handler.changes == {'main.py', 'src/a.py', 'b.tmp', 'b.py'}
+
 
+def test_dispatch_reloads_gitignore(project, no_subprocess):
+    event_handler = handler(project)
+    event_handler.dispatch(modified(project, 'data.csv'))
+    assert event_handler.changes == {'data.csv'}
+
+    event_handler.changes.clear()
+    project.join('.gitignore').write('*.csv\n')
+    event_handler.dispatch(modified(project, '.gitignore'))
+    event_handler.dispatch(modified(project, 'data.csv'))
+    event_handler.dispatch(modified(project, 'main.pyc'))
+    assert event_handler.changes == {'.gitignore', 'main.pyc'}
+
+
+def test_dispatch_calls_back_once_quiet(project):
+    """the callback runs once per change set, after it's reported"""
+    called = threading.Event()
+
+    def callback():
+        print('Building')
+        called.set()
+    event_handler = handler(project, callback, delay=0.1)
 
-@patch('mlt.event_handler.open')
-@patch('mlt.event_handler.call')
-def test_dispatch(call, open_mock):
-    """normal file event handling"""
-    event_handler = EventHandler(lambda: 'foo')
-    event_handler.timer = None
     with catch_stdout() as caught_output:
-        event_handler.dispatch(MagicMock(src_path='/foo'))
+        for i in range(10):
+            event_handler.dispatch(modified(project, 'file{}.py'.format(i)))
+        timer = event_handler.timer
+        assert called.wait(5)
+        timer.join(5)
         output = caught_output.getvalue()
-    assert output == 'Detected change in /foo\n'
+
+    assert output == ('Detected changes in file0.py, file1.py, file2.py, '
+                      'file3.py, file4.py and 5 more file(s)\nBuilding\n')
+    assert event_handler.timer is None
+    assert event_handler.changes == set()
+
+
+def test_dispatch_on_change(project, no_subprocess):
+    on_change = MagicMock()
+    event_handler = EventHandler(MagicMock(), delay=60, root=str(project),
+                                 on_change=on_change)
+    event_handler.dispatch(modified(project, 'main.pyc'))
+    on_change.assert_not_called()
+    event_handler.dispatch(modified(project, 'main.py'))
+    on_change.assert_called_once_with(['main.py'])
+
+
+def test_dispatch_deployed_manifests(project, no_subprocess):
+    """the manifests a deploy writes don't count as changes, even when k8s/
+       isn't ignored by git
+    """
+    project.join('.gitignore').write('*.pyc\n')
+    on_change = MagicMock()
+    event_handler = EventHandler(MagicMock(), delay=60, root=str(project),
+                                 on_change=on_change)
+    event_handler.dispatch(FileCreatedEvent(
+        str(project.join('k8s', 'app-1', 'job.yaml'))))
+    on_change.assert_not_called()
+    assert event_handler.changes == set()
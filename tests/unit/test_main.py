@@ -18,11 +18,15 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import json
 import os
 import pytest
-from mock import MagicMock, patch
+from docopt import docopt
+from mock import patch
 
-from mlt.main import main, run_command
+from mlt import main as main_module
+from mlt.commands import Command, load_command
+from mlt.main import COMMAND_MAP, main, run_command
 
 """
 All these tests assert that given a command arg from docopt we call
@@ -45,10 +49,52 @@ def run_command_mock(patch):
                           'undeploy', 'foo'])
 def test_run_command(command):
     # couldn't get this to work as a function decorator
-    with patch('mlt.main.COMMAND_MAP', ((command, MagicMock()),)) \
-            as COMMAND_MAP:
+    with patch('mlt.main.COMMAND_MAP', ((command, 'FooCommand'),)), \
+            patch('mlt.main.load_command') as load_command:
         run_command({command: True})
-        COMMAND_MAP[0][1].return_value.action.assert_called_once()
+        load_command.assert_called_once_with('FooCommand')
+        load_command.return_value.return_value.action.assert_called_once()
+
+
+@pytest.mark.parametrize('flag,env', [(True, None), (False, 'trace.json')])
+def test_run_command_trace(tmpdir, monkeypatch, flag, env):
+    """a command traced with --trace or MLT_TRACE writes its spans, even
+       when it fails
+    """
+    monkeypatch.chdir(tmpdir)
+    if env:
+        monkeypatch.setenv('MLT_TRACE', env)
+    else:
+        monkeypatch.delenv('MLT_TRACE', raising=False)
+    with patch('mlt.main.COMMAND_MAP', (('deploy', 'FooCommand'),)), \
+            patch('mlt.main.load_command') as load_command:
+        load_command.return_value.return_value.action.side_effect = \
+            SystemExit(1)
+        with pytest.raises(SystemExit):
+            run_command({'deploy': True, '--trace': flag})
+
+    traces = [env] if env else tmpdir.join('.mlt', 'traces').listdir()
+    assert len(traces) == 1
+    with open(str(traces[0])) as f:
+        events = json.load(f)['traceEvents']
+    assert [event['name'] for event in events if event['ph'] == 'X'] == [
+        'deploy']
+
+
+@pytest.mark.parametrize('argv', [
+    'init app', 'template_config list', 'build', 'deploy', 'deploy --watch',
+    'deploy --sweep=epochs=1,2', 'sync create', 'undeploy', 'status',
+    'templates list', 'update-template', 'logs', 'events'])
+def test_usage_trace(argv):
+    """every command can be traced with --trace"""
+    args = docopt(main_module.__doc__, argv.split() + ['--trace'])
+    assert args['--trace']
+
+
+def test_command_map_classes_exist():
+    """every command in the map must resolve to a real command class"""
+    for command, class_name in COMMAND_MAP:
+        assert issubclass(load_command(class_name), Command), command
 
 
 @pytest.mark.parametrize('args', [
@@ -72,6 +118,43 @@ def test_main_various_args(run_command_mock, docopt_mock, args):
     run_command_mock.assert_called_with(args)
 
 
+@pytest.mark.parametrize('timeout,retries,expected', [
+    ('30', '120', 30.0),
+    ('2.5', '120', 2.5),
+    (None, '8', 8.0)])
+def test_main_timeout(run_command_mock, docopt_mock, timeout, retries,
+                      expected):
+    """--timeout falls back to the deprecated --retries"""
+    args = {'<name>': 'foo', '-i': False, '-l': False, '-v': False,
+            '-n': False, '<count>': None, '--namespace': None,
+            '--retries': retries, '--timeout': timeout}
+    docopt_mock.return_value = args
+    main()
+    assert run_command_mock.call_args[0][0]['--timeout'] == expected
+
+
+def test_main_sweep(run_command_mock, docopt_mock):
+    """every --sweep is split into its parameter and values"""
+    args = {'<name>': None, '-i': False, '-l': False, '-v': False,
+            '-n': False, '<count>': None, '--namespace': None,
+            '--retries': '120', '--sweep': ['num_workers=1,2', 'epochs=5']}
+    docopt_mock.return_value = args
+    main()
+    assert run_command_mock.call_args[0][0]['--sweep'] == [
+        ('num_workers', ['1', '2']), ('epochs', ['5'])]
+
+
+@pytest.mark.parametrize('flag', ['--wait', '--report', '-l', '-i'])
+def test_main_sweep_single_job_flags(docopt_mock, flag):
+    """flags that follow the one job deployed don't go with --sweep"""
+    args = {'<name>': None, '-i': False, '-l': False, '-v': False,
+            '-n': False, '<count>': None, '--namespace': None,
+            '--retries': '120', '--sweep': ['epochs=5'], flag: True}
+    docopt_mock.return_value = args
+    with pytest.raises(ValueError):
+        main()
+
+
 def test_main_invalid_names(docopt_mock):
     """ Test that an invalid name throws a ValueError """
     args = {
@@ -0,0 +1,338 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import base64
+import json
+import threading
+import time
+
+import pytest
+from mock import MagicMock
+import yaml
+
+from mlt.utils import cluster_backends
+from mlt.utils.cluster_backends import (
+    ApiServerBackend, ClusterError, KubeConfigError, KubectlBackend,
+    NotFound, load_kube_config)
+from test_utils.fake_api_server import FakeApiServer
+
+
+@pytest.fixture
+def api_server():
+    server = FakeApiServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def api_backend(api_server, tmpdir):
+    backend = ApiServerBackend(load_kube_config(
+        api_server.write_kubeconfig(str(tmpdir.join('config')))))
+    yield backend
+    backend.close()
+
+
+@pytest.fixture
+def run_popen(patch):
+    run_popen = patch('process_helpers.run_popen')
+    run_popen.return_value.returncode = 0
+    run_popen.return_value.communicate.return_value = (b'{}', b'')
+    return run_popen
+
+
+def write_kubeconfig(tmpdir, user):
+    path = tmpdir.join('config')
+    path.write(yaml.safe_dump({
+        'current-context': 'ctx',
+        'clusters': [{'name': 'c', 'cluster': {
+            'server': 'https://k8s:6443',
+            'certificate-authority': 'ca.crt'}}],
+        'contexts': [{'name': 'ctx', 'context': {
+            'cluster': 'c', 'user': 'u', 'namespace': 'ns'}}],
+        'users': [{'name': 'u', 'user': user}]}))
+    return str(path)
+
+
+def test_load_kube_config(tmpdir, monkeypatch):
+    tmpdir.join('ca.crt').write('ca pem')
+    monkeypatch.setenv('KUBECONFIG', write_kubeconfig(tmpdir, {
+        'token': 'abc',
+        'client-key-data': base64.b64encode(b'key pem').decode('ascii')}))
+
+    config = load_kube_config()
+    assert config.server == 'https://k8s:6443'
+    assert config.context == 'ctx'
+    assert config.namespace == 'ns'
+    assert config.token == 'abc'
+    assert config.ca == b'ca pem'
+    assert config.client_key == b'key pem'
+    assert config.client_cert is None
+
+
+@pytest.mark.parametrize('plugin', ['exec', 'auth-provider'])
+def test_load_kube_config_auth_plugin(tmpdir, plugin):
+    tmpdir.join('ca.crt').write('ca pem')
+    with pytest.raises(KubeConfigError):
+        load_kube_config(write_kubeconfig(tmpdir, {plugin: {}}))
+
+
+def test_load_kube_config_none_found(tmpdir, monkeypatch):
+    monkeypatch.setenv('KUBECONFIG', str(tmpdir.join('missing')))
+    monkeypatch.delenv('KUBERNETES_SERVICE_HOST', raising=False)
+    with pytest.raises(KubeConfigError):
+        load_kube_config()
+
+
+def test_create_backend(patch):
+    load_kube_config = patch('load_kube_config')
+    load_kube_config.return_value.server = 'https://k8s:6443'
+    api_backend = patch('ApiServerBackend').return_value
+    assert cluster_backends._create_backend('auto') is api_backend
+    assert cluster_backends._create_backend('kubectl').name == 'kubectl'
+
+    load_kube_config.side_effect = KubeConfigError('exec plugin')
+    assert cluster_backends._create_backend('auto').name == 'kubectl'
+    with pytest.raises(KubeConfigError):
+        cluster_backends._create_backend('api')
+    with pytest.raises(ValueError):
+        cluster_backends._create_backend('helm')
+
+
+@pytest.mark.parametrize('env,proxied', [
+    ({'HTTPS_PROXY': 'http://proxy:3128'}, True),
+    ({'https_proxy': 'http://proxy:3128', 'no_proxy': 'k8s'}, False),
+    ({'HTTPS_PROXY': 'http://proxy:3128', 'NO_PROXY': '.corp,k8s'}, False),
+    ({'HTTP_PROXY': 'http://proxy:3128'}, False)])
+def test_create_backend_proxy(patch, monkeypatch, env, proxied):
+    """only kubectl goes through a proxy"""
+    for name in ('HTTPS_PROXY', 'HTTP_PROXY', 'NO_PROXY'):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.lower(), raising=False)
+    for name, value in env.items():
+        monkeypatch.setenv(name, value)
+    load_kube_config = patch('load_kube_config')
+    load_kube_config.return_value.server = 'https://k8s:6443'
+    api_backend = patch('ApiServerBackend').return_value
+
+    backend = cluster_backends._create_backend('auto')
+    if proxied:
+        assert backend.name == 'kubectl'
+        with pytest.raises(KubeConfigError):
+            cluster_backends._create_backend('api')
+    else:
+        assert backend is api_backend
+
+
+def test_load_kube_config_proxy_url(tmpdir):
+    tmpdir.join('ca.crt').write('ca pem')
+    path = write_kubeconfig(tmpdir, {'token': 'abc'})
+    config = yaml.safe_load(tmpdir.join('config').read())
+    config['clusters'][0]['cluster']['proxy-url'] = 'http://proxy:3128'
+    tmpdir.join('config').write(yaml.safe_dump(config))
+    with pytest.raises(KubeConfigError):
+        load_kube_config(path)
+
+
+def test_api_backend_get_list_create(api_server, api_backend):
+    assert api_backend.get('namespaces', 'ns') is None
+    api_backend.create('namespaces', {
+        'apiVersion': 'v1', 'kind': 'Namespace', 'metadata': {'name': 'ns'}})
+    assert api_backend.get('namespaces', 'ns')['metadata']['name'] == 'ns'
+
+    for name, job in (('a-1', 'a'), ('a-2', 'a'), ('b-1', 'b')):
+        api_server.add({'apiVersion': 'v1', 'kind': 'Pod', 'metadata': {
+            'name': name, 'labels': {'job-name': job}}}, namespace='ns')
+    pods = api_backend.list('pods', 'ns', label_selector='job-name=a')
+    assert [pod['metadata']['name'] for pod in pods] == ['a-1', 'a-2']
+    pods = api_backend.list('pods', 'ns', field_selector='metadata.name=b-1')
+    assert [pod['metadata']['name'] for pod in pods] == ['b-1']
+    assert api_backend.list('pods', 'other') == []
+
+
+def test_api_backend_discovers_crds(api_server, api_backend):
+    api_server.add({'apiVersion': 'kubeflow.org/v1alpha2', 'kind': 'TFJob',
+                    'metadata': {'name': 'app-1234'}}, namespace='ns')
+    assert api_backend.get('tfjob', 'app-1234', 'ns')['kind'] == 'TFJob'
+    with pytest.raises(ClusterError):
+        api_backend.get('helmrelease', 'app-1234', 'ns')
+
+
+def test_api_backend_apply(api_server, api_backend):
+    job = {'apiVersion': 'batch/v1', 'kind': 'Job',
+           'metadata': {'name': 'app-1234', 'labels': {'run': '1'}},
+           'spec': {'parallelism': 2, 'backoffLimit': 3}}
+    results = api_backend.apply([{'kind': 'List', 'items': [job]}], 'ns')
+    assert results == [
+        {'kind': 'job', 'name': 'app-1234', 'result': 'created'}]
+
+    job['metadata']['labels']['run'] = '2'
+    del job['spec']['backoffLimit']
+    results = api_backend.apply([job], 'ns')
+    assert results == [
+        {'kind': 'job', 'name': 'app-1234', 'result': 'configured'}]
+    applied = api_server.objects[('batch/v1', 'jobs', 'ns')]['app-1234']
+    assert applied['metadata']['labels'] == {'run': '2'}
+    # like kubectl apply, fields taken out of the template are removed
+    assert applied['spec'] == {'parallelism': 2}
+    assert api_server.requests[-1] == (
+        'PATCH', '/apis/batch/v1/namespaces/ns/jobs/app-1234'
+        '?fieldManager=mlt&force=true')
+
+
+def test_api_backend_apply_without_server_side_apply(api_server,
+                                                     api_backend, patch):
+    """old API servers have kubectl apply the objects"""
+    api_server.server_side_apply = False
+    kubectl_apply = patch('KubectlBackend.apply', MagicMock(return_value=[
+        {'kind': 'job', 'name': 'app-1234', 'result': 'created'}]))
+    job = {'apiVersion': 'batch/v1', 'kind': 'Job',
+           'metadata': {'name': 'app-1234'}}
+    assert api_backend.apply([job], 'ns') == [
+        {'kind': 'job', 'name': 'app-1234', 'result': 'created'}]
+    kubectl_apply.assert_called_once_with([job], 'ns')
+
+
+def test_api_backend_reuses_connections(api_server, api_backend):
+    for _ in range(10):
+        api_backend.list('pods', 'ns')
+    assert api_server.connections == 1
+    assert api_server.requests[-1] == ('GET', '/api/v1/namespaces/ns/pods')
+    assert len(api_server.requests) == 11
+
+
+def test_api_backend_retries_closed_connection(api_server, api_backend):
+    api_backend.list('pods', 'ns')
+    # the server dropping an idle keep-alive connection
+    api_backend._idle[0].sock.close()
+    assert api_backend.list('pods', 'ns') == []
+    assert api_server.connections == 2
+
+
+def test_api_backend_errors(api_server, api_backend):
+    api_backend.create('namespaces', {'metadata': {'name': 'ns'}})
+    with pytest.raises(ClusterError) as e:
+        api_backend.create('namespaces', {'metadata': {'name': 'ns'}})
+    assert e.value.status == 409
+    assert 'already exists' in str(e.value)
+
+
+@pytest.mark.parametrize('close_watches', [False, True])
+def test_api_backend_watch(api_server, api_backend, close_watches):
+    api_server.close_watches = close_watches
+
+    def pod(name, phase):
+        return {'apiVersion': 'v1', 'kind': 'Pod', 'metadata': {
+            'name': name, 'namespace': 'ns', 'labels': {'job-name': 'a'}},
+            'status': {'phase': phase}}
+
+    api_server.add(pod('a-1', 'Pending'))
+
+    def change_pods():
+        time.sleep(0.1)
+        api_server.add(pod('a-1', 'Running'))
+        api_server.add({'apiVersion': 'v1', 'kind': 'Pod',
+                        'metadata': {'name': 'b-1', 'namespace': 'ns'}})
+        api_server.delete(pod('a-1', 'Running'))
+
+    threading.Thread(target=change_pods).start()
+    started = time.time()
+    events = [(event_type, obj['metadata']['name'], obj['status']['phase'])
+              for event_type, obj in api_backend.watch(
+                  'pods', 'ns', label_selector='job-name=a', timeout=1)]
+    assert events == [('ADDED', 'a-1', 'Pending'),
+                      ('MODIFIED', 'a-1', 'Running'),
+                      ('DELETED', 'a-1', 'Running')]
+    assert time.time() - started < 2
+    assert api_server.requests[-1][1].startswith(
+        '/api/v1/namespaces/ns/pods?labelSelector=job-name%3Da&'
+        'timeoutSeconds=1&watch=true')
+
+
+def test_api_backend_watch_stops_early(api_server, api_backend):
+    api_server.add({'apiVersion': 'v1', 'kind': 'Pod',
+                    'metadata': {'name': 'a-1'}}, namespace='ns')
+    started = time.time()
+    for event_type, pod in api_backend.watch('pods', 'ns', timeout=10):
+        break
+    assert time.time() - started < 1
+
+
+def test_kubectl_backend_get(run_popen):
+    run_popen.return_value.communicate.return_value = (
+        json.dumps({'kind': 'Pod'}).encode('utf-8'), b'')
+    assert KubectlBackend().get('pods', 'pod-1', 'ns') == {'kind': 'Pod'}
+    run_popen.assert_called_once_with(
+        ['kubectl', 'get', 'pods', 'pod-1', '-o', 'json',
+         '--namespace', 'ns'], stdin=None)
+
+    run_popen.return_value.returncode = 1
+    run_popen.return_value.communicate.return_value = (
+        b'', b'Error from server (NotFound): pods "pod-1" not found')
+    assert KubectlBackend().get('pods', 'pod-1', 'ns') is None
+
+
+def test_kubectl_backend_list(run_popen):
+    run_popen.return_value.communicate.return_value = (
+        json.dumps({'items': [{'kind': 'Pod'}]}).encode('utf-8'), b'')
+    pods = KubectlBackend().list('pods', 'ns', label_selector='job-name=a',
+                                 field_selector='status.phase=Running')
+    assert pods == [{'kind': 'Pod'}]
+    command = run_popen.call_args[0][0]
+    assert command[:4] == ['kubectl', 'get', 'pods', '-o']
+    assert ['-l', 'job-name=a'] == command[command.index('-l'):][:2]
+    assert '--field-selector' in command
+
+
+def test_kubectl_backend_apply(run_popen):
+    run_popen.return_value.communicate.return_value = (
+        b'tfjob.kubeflow.org/app-1234 created\nservice/app-1234 unchanged\n',
+        b'')
+    results = KubectlBackend().apply([{'kind': 'TFJob'}], 'ns')
+    assert results == [
+        {'kind': 'tfjob', 'name': 'app-1234', 'result': 'created'},
+        {'kind': 'service', 'name': 'app-1234', 'result': 'unchanged'}]
+    stdin = run_popen.return_value.communicate.call_args[0][0]
+    assert json.loads(stdin.decode('utf-8'))['items'] == [{'kind': 'TFJob'}]
+
+
+def test_kubectl_backend_error(run_popen):
+    run_popen.return_value.returncode = 1
+    run_popen.return_value.communicate.return_value = (b'', b'forbidden')
+    with pytest.raises(ClusterError) as e:
+        KubectlBackend().list('pods', 'ns')
+    assert not isinstance(e.value, NotFound)
+    assert str(e.value) == 'forbidden'
+
+
+def test_kubectl_backend_watch(run_popen):
+    pod = {'kind': 'Pod', 'metadata': {'name': 'pod-1'}}
+    output = json.dumps(pod, indent=4) + '\n' + json.dumps(pod) + '\n' + \
+        json.dumps({'type': 'DELETED', 'object': pod}) + '\n'
+    run_popen.return_value.stdout.readline.side_effect = [
+        line.encode('utf-8') for line in output.splitlines(True)] + [b'']
+    run_popen.return_value.poll.return_value = None
+
+    events = list(KubectlBackend().watch('pods', 'ns', timeout=5))
+    assert [event_type for event_type, _ in events] == [
+        'ADDED', 'MODIFIED', 'DELETED']
+    command = run_popen.call_args[0][0]
+    assert command[:3] == ['kubectl', 'get', 'pods']
+    assert '--watch' in command
+    run_popen.return_value.kill.assert_called_once_with()
@@ -28,10 +28,11 @@ from mock import MagicMock
 import pytest
 
 from mlt.utils import constants
-from mlt.utils.config_helpers import (load_config,
+from mlt.utils.config_helpers import (load_config, get_build_variant,
                                       get_template_parameters as
                                       get_template_params,
                                       get_template_parameters_from_file,
+                                      parse_sweeps, sweep_combinations,
                                       update_config)
 from test_utils.io import catch_stdout
 
@@ -102,3 +103,49 @@ def test_get_template_params_from_file(get_template_parameters_mock,
     get_template_parameters_mock.return_value = {'param': 'value'}
     assert get_template_parameters_from_file('file_path') == \
         {'param': 'value'}
+
+
+@pytest.mark.parametrize('template_parameters,variant', [
+    ({}, 'cpu'),
+    ({'build_variant': 'gpu'}, 'gpu')])
+def test_get_build_variant(template_parameters, variant):
+    config = {constants.TEMPLATE_PARAMETERS: template_parameters,
+              constants.BUILD_VARIANTS: {'gpu': {'GPUS': '1'},
+                                         'cpu': {'GPUS': '0'}}}
+    assert get_build_variant(config) == variant
+
+
+def test_get_build_variant_none():
+    assert get_build_variant({constants.TEMPLATE_PARAMETERS: {}}) is None
+
+
+def test_get_build_variant_unknown():
+    config = {constants.TEMPLATE_PARAMETERS: {'build_variant': 'tpu'},
+              constants.BUILD_VARIANTS: {'cpu': {'GPUS': '0'}}}
+    with catch_stdout() as output:
+        with pytest.raises(SystemExit):
+            get_build_variant(config)
+        assert "Unknown build variant tpu" in output.getvalue()
+
+
+def test_parse_sweeps():
+    assert parse_sweeps(['num_workers=1,2,4', 'batch_size = 32, 64']) == [
+        ('num_workers', ['1', '2', '4']), ('batch_size', ['32', '64'])]
+
+
+@pytest.mark.parametrize('sweeps', [
+    ['num_workers'], ['=1,2'], ['num_workers=1,,2'],
+    ['num_workers=1', 'num_workers=2']])
+def test_parse_sweeps_invalid(sweeps):
+    with pytest.raises(ValueError):
+        parse_sweeps(sweeps)
+
+
+def test_sweep_combinations():
+    combinations = sweep_combinations([('workers', ['1', '2']),
+                                       ('batch', ['32', '64'])])
+    assert [list(combination.items()) for combination in combinations] == [
+        [('workers', '1'), ('batch', '32')],
+        [('workers', '1'), ('batch', '64')],
+        [('workers', '2'), ('batch', '32')],
+        [('workers', '2'), ('batch', '64')]]
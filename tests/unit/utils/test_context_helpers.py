@@ -0,0 +1,147 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import os
+
+import pytest
+from mock import MagicMock
+
+from mlt.utils import context_helpers
+from mlt.utils.context_helpers import content_tag, context_hash
+
+
+@pytest.fixture
+def project(tmpdir, state_store):
+    # the state store is in `.mlt/` of the project too, and written to by
+    # every `context_hash`
+    tmpdir.join('Dockerfile').write('FROM python\nADD . /src/app\n')
+    tmpdir.join('main.py').write('print("hi")\n')
+    tmpdir.join('.gitignore').write('k8s/\n*.pyc\n')
+    tmpdir.join('k8s/app-1/job.yaml').write('kind: Job\n', ensure=True)
+    return tmpdir
+
+
+def test_context_hash_stable(project):
+    digest = context_hash(str(project))
+    assert context_hash(str(project)) == digest
+    assert len(content_tag(digest)) == len('sha-') + 16
+
+    # ignored and state files don't matter
+    project.join('main.pyc').write('compiled')
+    project.join('k8s/app-2/job.yaml').write('kind: Job\n', ensure=True)
+    project.join('.git/index').write('index', ensure=True)
+    assert context_hash(str(project)) == digest
+
+
+def test_context_hash_changes(project):
+    digest = context_hash(str(project))
+    assert context_hash(str(project), build_args={'GPUS': 1}) != digest
+
+    project.join('main.py').write('print("hello")\n')
+    changed = context_hash(str(project))
+    assert changed != digest
+
+    project.join('Dockerfile').write('FROM python:3\nADD . /src/app\n')
+    assert context_hash(str(project)) != changed
+
+
+def test_context_hash_dockerignore(project):
+    digest = context_hash(str(project))
+    project.join('.dockerignore').write('Dockerfile\n*.md\n')
+    with_dockerignore = context_hash(str(project))
+    assert with_dockerignore != digest
+
+    # the dockerfile is always part of the build
+    project.join('Dockerfile').write('FROM python:3\n')
+    assert context_hash(str(project)) != with_dockerignore
+    with_dockerignore = context_hash(str(project))
+    project.join('README.md').write('readme')
+    assert context_hash(str(project)) == with_dockerignore
+    # .gitignore isn't used when there's a .dockerignore
+    project.join('main.pyc').write('compiled')
+    assert context_hash(str(project)) != with_dockerignore
+
+
+def test_context_hash_reads_changed_files_only(project, monkeypatch):
+    context_hash(str(project))
+    file_digest = MagicMock(return_value='digest')
+    monkeypatch.setattr(context_helpers, '_file_digest', file_digest)
+
+    project.join('main.py').write('print("hello, world")\n')
+    context_hash(str(project))
+    file_digest.assert_called_once_with(os.path.join(str(project), 'main.py'))
+
+
+def test_dockerignore_patterns():
+    lines = ['# comment', '', '*.pyc', '/build/', 'docs/_build',
+             '!keep.pyc', '**/tmp']
+    assert context_helpers.dockerignore_patterns(lines) == [
+        '**/*.pyc', 'build', 'docs/_build', '!**/keep.pyc', '**/tmp']
+    assert context_helpers.dockerignore_patterns(['data/', '/out'], 'sub/') \
+        == ['sub/**/data', 'sub/out']
+
+
+def test_update_dockerignore(project):
+    project.join('sub/.gitignore').write('*.ckpt\n', ensure=True)
+    assert context_helpers.update_dockerignore(str(project))
+    lines = project.join('.dockerignore').read().splitlines()
+    assert lines[0] == context_helpers.BLOCK_START
+    assert lines[2:-1] == ['.git', '.mlt', 'k8s', '**/k8s', '**/*.pyc',
+                           'sub/**/*.ckpt']
+    assert lines[-1] == context_helpers.BLOCK_END
+    assert not context_helpers.update_dockerignore(str(project))
+
+    # lines outside of the block are kept, the block follows .gitignore
+    project.join('.dockerignore').write(
+        'data\n' + project.join('.dockerignore').read() + '!data/small\n')
+    project.join('.gitignore').write('*.pyc\n')
+    assert context_helpers.update_dockerignore(str(project))
+    lines = project.join('.dockerignore').read().splitlines()
+    assert lines[0] == 'data'
+    assert lines[3:-2] == ['.git', '.mlt', 'k8s', '**/*.pyc', 'sub/**/*.ckpt']
+    assert lines[-1] == '!data/small'
+
+
+def test_update_dockerignore_users_own(project):
+    project.join('.dockerignore').write('data\n')
+    assert not context_helpers.update_dockerignore(str(project))
+    assert project.join('.dockerignore').read() == 'data\n'
+
+
+def test_context_size(tmpdir):
+    project = tmpdir.mkdir('project')
+    project.join('main.py').write('x' * 10)
+    project.join('data/a.csv').write('x' * 300, ensure=True)
+    project.join('data/b.csv').write('x' * 200, ensure=True)
+    project.join('k8s/app-1/job.yaml').write('x' * 50, ensure=True)
+    assert context_helpers.context_size(str(project)) == (
+        560, [('data/', 500), ('k8s/', 50), ('main.py', 10)])
+
+    project.join('.dockerignore').write('k8s\n')
+    total, largest = context_helpers.context_size(str(project))
+    assert total == 510 + len('k8s\n')
+    assert 'k8s/' not in dict(largest)
+
+
+@pytest.mark.parametrize('size,formatted', [
+    (512, '512 B'), (2048, '2.0 KB'), (300 * 1024 * 1024, '300.0 MB'),
+    (3 * 1024 ** 4, '3072.0 GB')])
+def test_format_size(size, formatted):
+    assert context_helpers.format_size(size) == formatted
@@ -0,0 +1,145 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import pytest
+
+from mlt.utils.docker_helpers import (BuildOutput, image_exists, image_id,
+                                      layer_cache_report, pinned, pull, push,
+                                      repo_digest)
+
+
+@pytest.fixture
+def run_popen(patch):
+    return patch('process_helpers.run_popen')
+
+
+@pytest.mark.parametrize('returncode', [0, 1])
+def test_image_exists(run_popen, returncode):
+    run_popen.return_value.wait.return_value = returncode
+    assert image_exists('app:sha-1234') == (returncode == 0)
+    run_popen.assert_called_once_with(
+        ['docker', 'image', 'inspect', 'app:sha-1234'],
+        stdout=False, stderr=False)
+
+
+@pytest.mark.parametrize('returncode', [0, 1])
+def test_image_id(run_popen, returncode):
+    run_popen.return_value.returncode = returncode
+    run_popen.return_value.communicate.return_value = (b'sha256:1d\n', b'')
+    assert image_id('app:1234') == ('sha256:1d' if returncode == 0 else None)
+    assert run_popen.call_args[0][0][:3] == ['docker', 'image', 'inspect']
+
+
+@pytest.mark.parametrize('image,digest', [
+    ('gcr.io/app:1234', 'sha256:d1'),
+    ('localhost:5000/app:1234', 'sha256:d2'),
+    ('localhost:5000/app', 'sha256:d2'),
+    ('quay.io/app:1234', None)])
+def test_repo_digest(run_popen, image, digest):
+    run_popen.return_value.returncode = 0
+    run_popen.return_value.communicate.return_value = (
+        b'["gcr.io/app@sha256:d1","localhost:5000/app@sha256:d2"]\n', b'')
+    assert repo_digest(image) == digest
+
+
+@pytest.mark.parametrize('image', [
+    'localhost:5000/app:1234', 'localhost:5000/app',
+    'localhost:5000/app@sha256:d0'])
+def test_pinned(image):
+    assert pinned(image, 'sha256:d1') == 'localhost:5000/app@sha256:d1'
+
+
+@pytest.mark.parametrize('command,function', [('pull', pull), ('push', push)])
+@pytest.mark.parametrize('returncode', [0, 1])
+def test_pull_push(run_popen, command, function, returncode):
+    run_popen.return_value.wait.return_value = returncode
+    assert function('gcr.io/app:cache') == (returncode == 0)
+    run_popen.assert_called_once_with(
+        ['docker', command, 'gcr.io/app:cache'], stdout=False, stderr=False)
+
+
+def test_layer_cache_report():
+    output = """Sending build context to Docker daemon  4.096kB
+Step 1/4 : FROM python:3.6
+ ---> 0a7b1ec4e5b8
+Step 2/4 : ADD requirements.txt /src/app/
+ ---> Using cache
+ ---> 7d2b5c0e9e4a
+Step 3/4 : RUN pip install -r /src/app/requirements.txt
+ ---> Using cache
+ ---> 1b3c8e0f2d6a
+Step 4/4 : ADD . /src/app
+ ---> 5c9a0d7e3f1b
+Successfully built 5c9a0d7e3f1b
+"""
+    assert layer_cache_report(output) == [
+        ('ADD requirements.txt /src/app/', True),
+        ('RUN pip install -r /src/app/requirements.txt', True),
+        ('ADD . /src/app', False)]
+
+
+def test_layer_cache_report_buildkit():
+    output = """#1 [internal] load build definition from Dockerfile
+#1 DONE 0.0s
+#4 [1/3] FROM docker.io/library/python:3.6
+#4 DONE 0.0s
+#5 [2/3] RUN pip install tensorflow
+#5 CACHED
+#6 [3/3] ADD . /src/app
+#6 DONE 0.1s
+"""
+    assert layer_cache_report(output) == [
+        ('RUN pip install tensorflow', True), ('ADD . /src/app', False)]
+
+
+def test_build_output_keeps_last_lines():
+    output = BuildOutput(size=3)
+    for i in range(10):
+        output.append('line {}\n'.format(i).encode('utf-8'))
+    assert output.text() == b'line 7\nline 8\nline 9\n'
+
+
+def test_build_output_step_durations():
+    now = [100.0]
+    output = BuildOutput(clock=lambda: now[0])
+    for line, at in ((b'Step 1/3 : FROM python\n', 100.0),
+                     (b' ---> 0a7b1ec4e5b8\n', 101.0),
+                     (b'Step 2/3 : RUN pip install -r requirements.txt\n',
+                      102.5),
+                     (b'Step 3/3 : ADD . /src/app\n', 160.0)):
+        now[0] = at
+        output.append(line)
+    assert output.step_durations(finished=161.0) == [
+        ('FROM python', 2.5),
+        ('RUN pip install -r requirements.txt', 57.5),
+        ('ADD . /src/app', 1.0)]
+    output.finished = 163.0
+    assert output.step_durations()[-1] == ('ADD . /src/app', 3.0)
+
+
+def test_build_output_buildkit_durations():
+    output = BuildOutput(size=1, clock=lambda: 0.0)
+    for line in ('#5 [2/3] RUN pip install tensorflow',
+                 '#6 [3/3] ADD . /src/app',
+                 '#5 DONE 42.5s',
+                 '#6 DONE 0.3s'):
+        output.append(line)
+    assert output.step_durations(finished=1.0) == [
+        ('RUN pip install tensorflow', 42.5), ('ADD . /src/app', 0.3)]
@@ -20,8 +20,9 @@
 import pytest
 from mock import MagicMock
 
-from mlt.utils.files import (fetch_action_arg, is_custom, get_job_kinds,
-                             get_only_one_job)
+from mlt.utils.files import (fetch_action_arg, fetch_action_arg_history,
+                             is_custom, get_deployed_jobs, get_job_kinds,
+                             get_only_one_job, load_manifests)
 
 from test_utils.io import catch_stdout
 
@@ -49,11 +50,6 @@ def listdir_mock(patch):
     return patch('os.listdir', MagicMock(return_value=['file1', 'file2']))
 
 
-@pytest.fixture
-def json_load_mock(patch):
-    return patch('json.load')
-
-
 @pytest.fixture
 def yaml_load_mock(patch):
     return patch('yaml.load_all', lambda x: [{'kind': 'the-best-kind'}])
@@ -64,23 +60,30 @@ def get_deployed_jobs_mock(patch):
     return patch('get_deployed_jobs')
 
 
-def test_fetch_action_arg_file_nonexistent(open_mock):
-    fetch_action_arg('build', 'last_build_container')
-    open_mock.assert_not_called()
+def test_fetch_action_arg_no_action():
+    assert fetch_action_arg('build', 'last_build_container') is None
 
 
-def test_fetch_action_arg_file_present(json_load_mock, isfile_mock, open_mock):
-    isfile_mock.return_value = True
-    action_data = {'somekey': 'someval'}
-    json_load_mock.return_value.get.return_value = action_data
+def test_fetch_action_arg_action_present(state_store):
+    state_store.record_action('push', {'last_push_container': 'old'})
+    state_store.record_action('push', {'last_push_container': 'new'})
 
     result = fetch_action_arg('push', 'last_push_container')
-    open_mock.assert_called_once()
-    json_load_mock.assert_called_once()
-    assert result == action_data
+    assert result == 'new'
+
+
+def test_fetch_action_arg_history(state_store):
+    for duration in (1, None, 3, 4):
+        state_store.record_action('build', {'last_build_duration': duration})
 
+    assert fetch_action_arg_history('build', 'last_build_duration') == \
+        [4, 3, 1]
+    assert fetch_action_arg_history('build', 'last_build_duration', 2) == \
+        [4, 3]
+    assert fetch_action_arg_history('push', 'last_push_duration') == []
 
-def test_fetch_action_arg_is_custom(json_load_mock, isfile_mock, open_mock):
+
+def test_fetch_action_arg_is_custom(isfile_mock, open_mock):
     isfile_mock.return_value = True
     custom = is_custom('deploy:')
 
@@ -89,6 +92,14 @@ def test_fetch_action_arg_is_custom(json_load_mock, isfile_mock, open_mock):
     assert custom
 
 
+def test_get_deployed_jobs(state_store):
+    state_store.add_job('job-b', created=2)
+    state_store.add_job('job-a', created=1)
+
+    assert get_deployed_jobs() == ['k8s/job-a', 'k8s/job-b']
+    assert get_deployed_jobs(job_names_only=True) == ['job-a', 'job-b']
+
+
 def test_get_only_one_job_no_job_desired(get_deployed_jobs_mock):
     """this is old behavior, return the only job in the list"""
     get_deployed_jobs_mock.return_value = ['k8s/job-asdf-1234']
@@ -102,6 +113,8 @@ def test_get_only_one_job_job_desired(get_deployed_jobs_mock):
                                            'k8s/job-jkl;-1234']
     job = get_only_one_job('k8s/job-asdf-1234', '')
     assert job == 'k8s/job-asdf'
+    job = get_only_one_job('k8s/job-asdf-1234', '', truncate=False)
+    assert job == 'k8s/job-asdf-1234'
 
 
 def test_get_only_one_job_many_jobs(get_deployed_jobs_mock):
@@ -137,3 +150,12 @@ def test_get_job_kinds_not_found(listdir_mock):
     kinds, all_same_kind = get_job_kinds()
     assert kinds is None
     assert all_same_kind is False
+
+
+def test_load_manifests(tmpdir):
+    job_dir = tmpdir.mkdir('app-1234')
+    job_dir.join('job.yaml').write(
+        'kind: TFJob\nmetadata:\n  name: a\n---\nkind: Service\n---\n')
+    job_dir.join('pod.json').write('{"kind": "Pod"}')
+    kinds = [obj['kind'] for obj in load_manifests(str(job_dir))]
+    assert kinds == ['TFJob', 'Service', 'Pod']
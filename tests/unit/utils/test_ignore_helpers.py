@@ -0,0 +1,118 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import pytest
+
+from mlt.utils.ignore_helpers import GitIgnore, IgnoreRules, walk
+
+
+@pytest.mark.parametrize('path,is_dir,ignored', [
+    ('app.pyc', False, True),
+    ('src/app.pyc', False, True),
+    ('keep.pyc', False, False),
+    ('k8s', True, True),
+    ('k8s/job/job.yaml', False, True),
+    ('src/k8s', True, True),
+    ('build', False, False),
+    ('build', True, True),
+    ('build/out', False, True),
+    ('data/raw/a.csv', False, True),
+    ('data/a.csv', False, False),
+    ('docs/a/b/c.md', False, True),
+    ('docs/c.txt', False, False),
+    ('README.md', False, False),
+])
+def test_gitignore_rules(path, is_dir, ignored):
+    rules = IgnoreRules([
+        '# comment', '', '*.pyc', '!keep.pyc', '/k8s', 'k8s/', 'build/',
+        'data/raw', 'docs/**/*.md', '!k8s/job/job.yaml'])
+    assert rules.ignored(path, is_dir) == ignored
+
+
+@pytest.mark.parametrize('path,ignored', [
+    ('data/big.csv', True),
+    ('data/keep.csv', False),
+    ('src/data/big.csv', False),
+    ('a.log', True),
+    ('src/a.log', False),
+    ('src/deep/a.tmp', True),
+    ('Dockerfile', False),
+])
+def test_dockerignore_rules(path, ignored):
+    rules = IgnoreRules(['data', '!data/keep.csv', '/*.log', '**/*.tmp',
+                         ' ./src/../x '], 'dockerignore')
+    assert rules.ignored(path) == ignored
+
+
+def test_rules_from_missing_file(tmpdir):
+    rules = IgnoreRules.from_file(str(tmpdir.join('.gitignore')))
+    assert rules.rules == []
+    assert not rules.ignored('anything')
+
+
+def test_walk(tmpdir):
+    tmpdir = tmpdir.mkdir('project')
+    for path in ('main.py', 'k8s/job.yaml', 'src/util.py', 'src/util.pyc',
+                 'data/keep.csv', 'data/big.csv'):
+        tmpdir.join(path).write('', ensure=True)
+
+    rules = IgnoreRules(['k8s/', '*.pyc', 'data', '!data/keep.csv'])
+    assert walk(str(tmpdir), rules) == ['main.py', 'src/util.py']
+
+    rules = IgnoreRules(['k8s', '*.pyc', 'data', '!data/keep.csv'],
+                        'dockerignore')
+    assert walk(str(tmpdir), rules) == [
+        'data/keep.csv', 'main.py', 'src/util.py', 'src/util.pyc']
+
+
+def test_gitignore_nested(tmpdir):
+    tmpdir = tmpdir.mkdir('project')
+    tmpdir.join('.gitignore').write('*.log\n/build/\n')
+    tmpdir.join('src/.gitignore').write('!keep.log\ngenerated/\n',
+                                        ensure=True)
+    tmpdir.join('.git/info/exclude').write('notes.txt\n', ensure=True)
+    gitignore = GitIgnore(str(tmpdir))
+
+    assert gitignore.ignored('a.log')
+    assert gitignore.ignored('src/a.log')
+    assert not gitignore.ignored('src/keep.log')
+    assert gitignore.ignored('src/generated/a.py')
+    assert not gitignore.ignored('generated/a.py')
+    assert gitignore.ignored('build/a.py')
+    assert not gitignore.ignored('src/build/a.py')
+    assert gitignore.ignored('src/notes.txt')
+
+
+def test_gitignore_reload(tmpdir):
+    tmpdir = tmpdir.mkdir('project')
+    tmpdir.join('src/.gitignore').write('*.csv\n', ensure=True)
+    gitignore = GitIgnore(str(tmpdir))
+    assert gitignore.ignored('src/data.csv')
+
+    tmpdir.join('src/.gitignore').write('')
+    # the rules are read once
+    assert gitignore.ignored('src/data.csv')
+    assert not gitignore.reload('src/data.csv')
+    assert gitignore.reload('src/.gitignore')
+    assert not gitignore.ignored('src/data.csv')
+
+    tmpdir.join('.gitignore').write('data.csv\n')
+    assert gitignore.reload('.gitignore')
+    assert gitignore.ignored('src/data.csv')
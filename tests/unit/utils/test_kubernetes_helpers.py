@@ -17,57 +17,274 @@
 #
 # SPDX-License-Identifier: EPL-2.0
 #
-import json
-import pytest
 import uuid
+from datetime import datetime, timedelta
+
+import pytest
 
-from mlt.utils.kubernetes_helpers import (ensure_namespace_exists,
-                                          checking_crds_on_k8)
+from mlt.utils.kubernetes_helpers import (age, ensure_namespace_exists,
+                                          checking_crds_on_k8, expected_pods,
+                                          invalidate_cluster_cache,
+                                          lifecycle_summary, lifecycle_table,
+                                          pod_lifecycle, pod_selector,
+                                          pod_status, pods_table,
+                                          replica_type, wait_for_pods)
 from test_utils.io import catch_stdout
 
 
-@pytest.fixture
-def proc_helpers(patch):
-    return patch('process_helpers')
+def pod(name, phase='Running', **status):
+    status['phase'] = phase
+    return {'metadata': {'name': name,
+                         'creationTimestamp': '2018-08-01T12:00:00Z'},
+            'spec': {'containers': [{}], 'nodeName': 'node-1'},
+            'status': status}
 
 
-@pytest.fixture
-def open_mock(patch):
-    return patch('open')
+def test_ensure_namespace_no_exist(cluster_backend):
+    namespace = str(uuid.uuid4())
+    ensure_namespace_exists(namespace)
+    cluster_backend.get.assert_called_once_with('namespaces', namespace)
+    cluster_backend.create.assert_called_once()
+    assert cluster_backend.create.call_args[0][1]['metadata'] == {
+        'name': namespace}
 
 
-@pytest.fixture
-def call_mock(patch):
-    return patch('call')
+def test_ensure_namespace_already_exists(cluster_backend):
+    cluster_backend.get.return_value = {'kind': 'Namespace'}
 
+    ensure_namespace_exists(str(uuid.uuid4()))
+    cluster_backend.create.assert_not_called()
 
-def test_ensure_namespace_no_exist(proc_helpers, open_mock, call_mock):
-    call_mock.return_value = 0
 
-    ensure_namespace_exists(str(uuid.uuid4()))
-    proc_helpers.run.assert_not_called()
+def test_checking_crds_on_k8(cluster_backend):
+    cluster_backend.get.side_effect = lambda resource, name: \
+        {'metadata': {'name': name}} if name == 'tfjob' else None
+    crd_set = {'tfjob', 'pytorchjob'}
+    missing_crds = checking_crds_on_k8(crd_set)
+    assert missing_crds == {'pytorchjob'}
+    cluster_backend.list.assert_not_called()
 
+    # found CRDs are remembered, missing ones asked about again
+    cluster_backend.get.reset_mock()
+    assert checking_crds_on_k8(crd_set) == {'pytorchjob'}
+    cluster_backend.get.assert_called_once_with(
+        'customresourcedefinitions', 'pytorchjob')
 
-def test_ensure_namespace_already_exists(proc_helpers, open_mock, call_mock):
-    call_mock.return_value = 1
 
-    ensure_namespace_exists(str(uuid.uuid4()))
-    proc_helpers.run.assert_called_once()
+@pytest.mark.parametrize('ttl,context,calls', [
+    ('300', 'test-context', 0), ('0', 'test-context', 1),
+    ('300', 'other-context', 1)])
+def test_cluster_cache(cluster_backend, monkeypatch, ttl, context, calls):
+    cluster_backend.get.return_value = {'metadata': {'name': 'tfjob'}}
+    monkeypatch.setenv('MLT_CLUSTER_CACHE_TTL', ttl)
+    assert checking_crds_on_k8({'tfjob'}) == set()
+    cluster_backend.context = context
+    cluster_backend.get.reset_mock()
+    assert checking_crds_on_k8({'tfjob'}) == set()
+    assert cluster_backend.get.call_count == calls
 
 
-def test_checking_crds_on_k8(proc_helpers):
-    proc_helpers.run_popen.return_value.stdout.read.return_value.decode.\
-        return_value = json.dumps({'items': [
-                                   {'metadata': {'name': 'tfjob'}}]})
-    crd_set = {'tfjob', 'pytorchjob'}
-    missing_crds = checking_crds_on_k8(crd_set)
-    assert missing_crds == {'pytorchjob'}
+def test_cluster_cache_expires(cluster_backend, patch):
+    now = patch('time.time')
+    now.return_value = 1000.0
+    cluster_backend.get.return_value = {'metadata': {'name': 'ns'}}
+    ensure_namespace_exists('ns')
+    now.return_value = 1299.0
+    ensure_namespace_exists('ns')
+    assert cluster_backend.get.call_count == 1
+    now.return_value = 1301.0
+    ensure_namespace_exists('ns')
+    assert cluster_backend.get.call_count == 2
+
 
+def test_invalidate_cluster_cache(cluster_backend):
+    cluster_backend.get.return_value = {'metadata': {'name': 'ns'}}
+    ensure_namespace_exists('ns')
+    invalidate_cluster_cache()
+    cluster_backend.get.return_value = None
+    ensure_namespace_exists('ns')
+    cluster_backend.create.assert_called_once()
 
-def test_checking_crds_on_k8_exception(proc_helpers):
-    proc_helpers.run_popen.side_effect = Exception('Something went wrong.')
+
+def test_checking_crds_on_k8_exception(cluster_backend):
+    cluster_backend.get.side_effect = Exception('Something went wrong.')
     with catch_stdout() as output:
         crds = checking_crds_on_k8({'tfjob', 'pytorchjob'})
         output = output.getvalue().strip()
     assert output == "Crd_Checking - Exception: Something went wrong."
     assert crds == set()
+
+
+def test_age():
+    now = datetime.utcnow()
+    assert age(None) == '<unknown>'
+    assert age((now - timedelta(seconds=30)).strftime(
+        '%Y-%m-%dT%H:%M:%SZ')) in ('30s', '31s')
+    assert age((now - timedelta(hours=5, minutes=1)).strftime(
+        '%Y-%m-%dT%H:%M:%SZ')) == '5h'
+
+
+def test_pod_status():
+    assert pod_status(pod('a', 'Succeeded')) == 'Completed'
+    assert pod_status(pod('a', 'Pending', containerStatuses=[
+        {'state': {'waiting': {'reason': 'ContainerCreating'}}}])) == \
+        'ContainerCreating'
+
+
+def test_pods_table():
+    assert pods_table([]) == []
+    lines = pods_table([pod('app-1', podIP='10.0.0.1', containerStatuses=[
+        {'ready': True, 'restartCount': 2}])])
+    assert lines[0].split()[:3] == ['NAME', 'READY', 'STATUS']
+    row = lines[1].split()
+    assert row[:4] == ['app-1', '1/1', 'Running', '2']
+    assert row[5:] == ['10.0.0.1', 'node-1']
+
+
+def test_pod_selector():
+    service = {'kind': 'Service'}
+    assert pod_selector([{'kind': 'Job'}, service], 'app-1') == \
+        'job-name=app-1'
+    assert pod_selector([{'kind': 'PyTorchJob'}], 'app-1') == \
+        'pytorch_job_name=app-1'
+    # pods of different kinds aren't labeled the same way
+    assert pod_selector([{'kind': 'Job'}, {'kind': 'TFJob'}], 'app-1') is None
+    assert pod_selector([{'kind': 'Deployment'}], 'app-1') is None
+    assert pod_selector([service], 'app-1') is None
+
+
+def test_expected_pods():
+    assert expected_pods([{'kind': 'Job'}, {'kind': 'Service'}]) == 1
+    assert expected_pods([{'kind': 'Deployment', 'spec': {'replicas': 3}},
+                          {'kind': 'Pod'}]) == 4
+    assert expected_pods([{'kind': 'TFJob', 'spec': {'tfReplicaSpecs': {
+        'PS': {'replicas': 2}, 'Worker': {'replicas': 3}}}}]) == 5
+    # v1alpha1 kept the replica specs in a list
+    assert expected_pods([{'kind': 'TFJob', 'spec': {'replicaSpecs': [
+        {'replicas': 1}, {}]}}]) == 2
+    assert expected_pods([{'kind': 'Experiment'}]) is None
+    assert expected_pods([]) is None
+
+
+def test_wait_for_pods(cluster_backend):
+    cluster_backend.list.return_value = [pod('app-1', 'Pending')]
+    cluster_backend.watch.return_value = iter([
+        ('ADDED', pod('app-1', 'Pending')),
+        ('ADDED', pod('app-2', 'Running')),
+        ('DELETED', pod('app-2', 'Running')),
+        ('MODIFIED', pod('app-1', 'Running')),
+        ('ADDED', pod('app-3', 'Running'))])
+
+    ready = wait_for_pods('namespace', label_selector='job-name=app',
+                          expected=2, timeout=5)
+    assert sorted(ready) == ['app-1', 'app-3']
+    cluster_backend.watch.assert_called_once()
+
+
+def test_wait_for_pods_unknown_count(cluster_backend):
+    """without a count to expect, every pod listed has to be ready"""
+    cluster_backend.list.return_value = [pod('job-a', 'Running'),
+                                         pod('job-b', 'Pending')]
+    cluster_backend.watch.return_value = iter([
+        ('MODIFIED', pod('job-b', 'Running'))])
+
+    ready = wait_for_pods('namespace', timeout=5)
+    assert sorted(ready) == ['job-a', 'job-b']
+
+
+def test_wait_for_pods_watch_ended(cluster_backend, patch):
+    sleep = patch('time.sleep')
+    cluster_backend.watch.side_effect = [
+        iter([]), iter([('ADDED', pod('app-1', 'Running'))])]
+
+    ready = wait_for_pods('namespace', field_selector='metadata.name=app-1',
+                          expected=1, timeout=5, phases=('Running',))
+    assert list(ready) == ['app-1']
+    # the watch is re-established, after a pause since it ended right away
+    assert cluster_backend.watch.call_count == 2
+    sleep.assert_called_once()
+
+
+def test_wait_for_pods_timeout(cluster_backend):
+    cluster_backend.list.return_value = [pod('app-1', 'Succeeded')]
+    assert wait_for_pods('namespace', expected=2, timeout=0) == {}
+    assert wait_for_pods('namespace', phases=('Running',), timeout=0) == {}
+
+
+def event(reason, first, last=None):
+    return {'reason': reason,
+            'firstTimestamp': '2018-08-01T12:00:{:02d}Z'.format(first),
+            'lastTimestamp': '2018-08-01T12:00:{:02d}Z'.format(last or first)}
+
+
+def started_pod(replica=None):
+    started = pod('app-1', conditions=[
+        {'type': 'Initialized', 'status': 'True',
+         'lastTransitionTime': '2018-08-01T12:00:01Z'},
+        {'type': 'PodScheduled', 'status': 'True',
+         'lastTransitionTime': '2018-08-01T12:00:02Z'}],
+        containerStatuses=[{'state': {'running': {
+            'startedAt': '2018-08-01T12:00:30Z'}}}])
+    if replica:
+        started['metadata']['labels'] = {'tf-replica-type': replica}
+    return started
+
+
+def test_pod_lifecycle():
+    events = [event('Scheduled', 2), event('Pulling', 3),
+              event('Pulled', 20), event('Created', 21, 22),
+              event('Started', 23)]
+    assert pod_lifecycle(started_pod(), events) == {
+        'replica': 'pod', 'schedule': 2.0, 'pull': 17.0, 'create': 2.0,
+        'start': 8.0, 'total': 30.0}
+
+
+def test_pod_lifecycle_image_present():
+    lifecycle = pod_lifecycle(started_pod('WORKER'), [
+        event('Pulled', 3), event('Created', 4)])
+    assert lifecycle['replica'] == 'worker'
+    assert lifecycle['pull'] == 0.0
+    assert lifecycle['create'] == 1.0
+
+
+def test_pod_lifecycle_events_expired():
+    lifecycle = pod_lifecycle(started_pod(), [])
+    assert lifecycle['schedule'] == 2.0
+    assert lifecycle['pull'] is None
+    assert lifecycle['create'] is None
+    assert lifecycle['total'] == 30.0
+
+
+def test_replica_type():
+    assert replica_type({'metadata': {'labels': {
+        'pytorch-replica-type': 'master'}}}) == 'master'
+    assert replica_type({'metadata': {}}) == 'pod'
+
+
+def test_lifecycle_summary_and_table():
+    def lifecycle(replica, total, pull=None):
+        return {'replica': replica, 'schedule': 1.0, 'pull': pull,
+                'create': 1.0, 'start': 1.0, 'total': total}
+
+    summary = lifecycle_summary([
+        lifecycle('ps', 10.0), lifecycle('worker', 12.0, 5.0),
+        lifecycle('worker', 20.0, 9.0), lifecycle('worker', 14.0, 6.0)])
+    assert summary['worker'] == {
+        'pods': 3,
+        'p50': {'schedule': 1.0, 'pull': 6.0, 'create': 1.0, 'start': 1.0,
+                'total': 14.0},
+        'max': {'schedule': 1.0, 'pull': 9.0, 'create': 1.0, 'start': 1.0,
+                'total': 20.0}}
+    assert summary['ps']['max']['pull'] is None
+    assert summary['all']['pods'] == 4
+    assert summary['all']['p50']['total'] == 12.0
+
+    table = lifecycle_table(summary)
+    assert table[0].split() == ['REPLICA', 'PODS', 'SCHEDULE', 'PULL',
+                                'CREATE', 'START', 'TOTAL']
+    assert [line.split()[:3] for line in table[1:]] == [
+        ['ps', '1', 'p50'], ['ps', '1', 'max'],
+        ['worker', '3', 'p50'], ['worker', '3', 'max'],
+        ['all', '4', 'p50'], ['all', '4', 'max']]
+    assert table[4].split()[3:] == ['1.0s', '9.0s', '1.0s', '1.0s', '20.0s']
+    assert table[1].split()[4] == '-'
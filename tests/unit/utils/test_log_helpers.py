@@ -22,91 +22,115 @@ from __future__ import print_function
 
 import pytest
 
-import uuid
 from mlt.utils.log_helpers import check_for_pods_readiness
 
 from test_utils.io import catch_stdout
 
+JOB_NAME = 'app-6c5f4ac7-1b83-4f2a-8e9c-5a3d28b1f3a2'
+
 
 @pytest.fixture
-def sleep_mock(patch):
-    return patch('sleep')
+def load_manifests(patch):
+    return patch('files.load_manifests', lambda directory: [])
 
 
-@pytest.fixture
-def process_helpers(patch):
-    return patch('process_helpers.run_popen')
-
-
-def test_check_for_pods_readiness(process_helpers, sleep_mock):
-    run_id = str(uuid.uuid4()).split("-")
-    filter_tag = "-".join(["app", run_id[0], run_id[1]])
-    process_helpers.return_value.stdout.read.return_value = \
-        bytearray("\n".join(
-            ["random-pod1", "random-pod2",
-             filter_tag + "-ps-" + run_id[3] + " 1/1  Running  0  16d",
-             filter_tag + "-worker1-" + run_id[3] + " 1/1  Running  0  16d",
-             filter_tag + "-worker2-" + run_id[3] + " 1/1  Running  0  16d",
-             filter_tag + "-worker2-" + run_id[3] + " 1/1  Completed  0  16d"]
-        ), 'utf8')
+def pods(*pods):
+    return [{'metadata': {'name': name}, 'status': {'phase': phase}}
+            for name, phase in pods]
 
+
+def check(timeout=5):
     with catch_stdout() as caught_output:
-        found = check_for_pods_readiness(namespace='namespace',
-                                         filter_tag=filter_tag, retries=5)
+        found = check_for_pods_readiness(
+            namespace='namespace', job_name=JOB_NAME, timeout=timeout)
         output = caught_output.getvalue()
+    return found, output
+
+
+def test_check_for_pods_readiness(cluster_backend, load_manifests):
+    cluster_backend.list.return_value = pods(
+        ("random-pod1", "Pending"), ("random-pod2", "Pending"),
+        (JOB_NAME + "-ps-0", "Running"),
+        (JOB_NAME + "-worker-0", "Running"),
+        (JOB_NAME + "-worker-1", "Succeeded"))
+
+    found, output = check()
 
     assert found
     assert "Checking for pod(s) readiness" in output
+    # no manifests to tell the pods' labels from, so they're found by name
+    cluster_backend.list.assert_called_once_with(
+        'pods', 'namespace', label_selector=None, field_selector=None)
+    cluster_backend.watch.assert_not_called()
+
+
+def test_check_for_pods_readiness_truncated_pod_names(
+        cluster_backend, load_manifests):
+    """pods of jobs with long names are found by the start of the name k8s
+       truncated their names to
+    """
+    job_name = 'a' * 60 + JOB_NAME[len('app'):]
+    pod_name = job_name[:job_name.rfind('-')][-53:] + '-x7k2p'
+    cluster_backend.list.return_value = pods((pod_name, "Running"))
+    with catch_stdout():
+        found = check_for_pods_readiness(
+            namespace='namespace', job_name=job_name, timeout=0)
+
+    assert list(found) == [pod_name]
+
+
+def test_check_for_pods_readiness_watches_job_pods(cluster_backend, patch):
+    patch('files.load_manifests', lambda directory: [
+        {'kind': 'TFJob', 'spec': {'tfReplicaSpecs': {
+            'PS': {'replicas': 1}, 'Worker': {'replicas': 2}}}},
+        {'kind': 'Service'}])
+    cluster_backend.list.return_value = pods((JOB_NAME + "-ps-0", "Running"))
+    added = pods((JOB_NAME + "-ps-0", "Running"),
+                 (JOB_NAME + "-worker-0", "Pending"))
+    modified = pods((JOB_NAME + "-worker-0", "Running"),
+                    (JOB_NAME + "-worker-1", "Running"))
+    events = [('ADDED', pod) for pod in added]
+    events += [('MODIFIED', pod) for pod in modified]
+    cluster_backend.watch.return_value = iter(events)
+
+    found, _ = check()
 
+    assert found
+    selector = 'tf_job_name={}'.format(JOB_NAME)
+    cluster_backend.list.assert_called_once_with(
+        'pods', 'namespace', label_selector=selector, field_selector=None)
+    _, kwargs = cluster_backend.watch.call_args
+    assert kwargs['label_selector'] == selector
+    assert 0 < kwargs['timeout'] <= 5
 
-def test_check_for_pods_readiness_no_pods(process_helpers, sleep_mock):
-    run_id = str(uuid.uuid4()).split("-")
-    filter_tag = "-".join(["app", run_id[0], run_id[1]])
-    process_helpers.return_value.stdout.read.return_value = ''
 
-    with catch_stdout() as caught_output:
-        found = check_for_pods_readiness(namespace='namespace',
-                                         filter_tag=filter_tag, retries=1)
-        output = caught_output.getvalue()
+def test_check_for_pods_readiness_no_pods(cluster_backend, load_manifests):
+    found, output = check(timeout=0)
 
     assert not found
-    assert "Retrying " in output
+    assert "Timed out waiting for pods to be running." in output
 
 
-def test_check_for_pods_readiness_max_retries_reached(process_helpers,
-                                                      sleep_mock):
-    run_id = str(uuid.uuid4()).split("-")
-    filter_tag = "-".join(["app", run_id[0], run_id[1]])
+def test_check_for_pods_readiness_other_pods_running(cluster_backend,
+                                                     load_manifests):
+    cluster_backend.list.return_value = pods(
+        ("random-pod1", "Running"), ("random-pod2", "Running"))
 
-    process_helpers.return_value.stdout.read.return_value = \
-        bytearray("\n".join(["random-pod1", "random-pod2"]), 'utf8')
-    with catch_stdout() as caught_output:
-        found = check_for_pods_readiness(namespace='namespace',
-                                         filter_tag=filter_tag, retries=5)
-        output = caught_output.getvalue()
+    found, output = check(timeout=0)
 
     assert not found
-    assert "Max retries Reached." in output
-
-
-def test_check_for_pods_readiness_max_retries_when_status_is_not_running(
-        process_helpers, sleep_mock):
-    run_id = str(uuid.uuid4()).split("-")
-    filter_tag = "-".join(["app", run_id[0], run_id[1]])
-    process_helpers.return_value.stdout.read.return_value = \
-        bytearray("\n".join(
-            [filter_tag + "-ps-" + run_id[3] + " 1/1  ContainerCreating  0  "
-                                               "16d",
-             filter_tag + "-worker1-" + run_id[3] + " 1/1  ContainerCreating  "
-                                                    "0  16d",
-             filter_tag + "-worker2-" + run_id[3] + " 1/1  ContainerCreating  "
-                                                    "0  16d"]
-        ), 'utf-8')
+    assert "Timed out waiting for pods to be running." in output
 
-    with catch_stdout() as caught_output:
-        running = check_for_pods_readiness(namespace='namespace',
-                                           filter_tag=filter_tag, retries=4)
-        output = caught_output.getvalue()
 
-    assert not running
-    assert "Max retries Reached." in output
+def test_check_for_pods_readiness_when_status_is_not_running(
+        cluster_backend, load_manifests):
+    cluster_backend.list.return_value = pods(
+        (JOB_NAME + "-ps-0", "Pending"),
+        (JOB_NAME + "-worker-0", "Pending"),
+        (JOB_NAME + "-worker-1", "Running"))
+    cluster_backend.watch.return_value = iter([])
+
+    found, output = check(timeout=0.05)
+
+    assert not found
+    assert "Timed out waiting for pods to be running." in output
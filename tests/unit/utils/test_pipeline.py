@@ -0,0 +1,112 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import threading
+
+from mock import MagicMock
+
+from mlt.utils.pipeline import (CANCELLED, COMPLETED, FAILED, Pipeline,
+                                format_timings)
+from test_utils.io import catch_stdout
+
+
+def test_pipeline_completed():
+    calls = []
+    pipeline = Pipeline([
+        ('build', lambda: calls.append('build'), MagicMock()),
+        ('deploy', lambda: calls.append('deploy'), None)])
+    status, timings = pipeline.run()
+    assert status == COMPLETED
+    assert calls == ['build', 'deploy']
+    assert [name for name, _ in timings] == ['build', 'deploy']
+    assert pipeline.cancel() is None
+
+
+def test_pipeline_failed():
+    def build():
+        raise SystemExit(1)
+
+    def push():
+        raise ValueError('no image')
+    deploy = MagicMock()
+
+    status, timings = Pipeline([('build', build, None),
+                                ('deploy', deploy, None)]).run()
+    assert status == FAILED
+    assert len(timings) == 1
+    deploy.assert_not_called()
+
+    with catch_stdout() as caught_output:
+        status, _ = Pipeline([('push', push, None)]).run()
+        assert caught_output.getvalue() == 'Push failed: no image\n'
+    assert status == FAILED
+
+
+def test_pipeline_cancelled():
+    started, stopped = threading.Event(), threading.Event()
+
+    def build():
+        started.set()
+        stopped.wait(5)
+        raise SystemExit(1)
+    deploy = MagicMock()
+    pipeline = Pipeline([('build', build, stopped.set),
+                         ('deploy', deploy, None)])
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pipeline.run()))
+    thread.start()
+    assert started.wait(5)
+    assert pipeline.cancel() == 'build'
+    thread.join(5)
+
+    status, timings = result[0]
+    assert status == CANCELLED
+    assert [name for name, _ in timings] == ['build']
+    deploy.assert_not_called()
+
+    # the next run starts over
+    started.clear()
+    stopped.set()
+    assert pipeline.run()[0] == FAILED
+    deploy.assert_not_called()
+
+
+def test_pipeline_stage_not_cancellable():
+    started, release = threading.Event(), threading.Event()
+
+    def deploy():
+        started.set()
+        release.wait(5)
+    pipeline = Pipeline([('deploy', deploy, None)])
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(pipeline.run()))
+    thread.start()
+    assert started.wait(5)
+    assert pipeline.cancel() is None
+    release.set()
+    thread.join(5)
+    assert result[0][0] == COMPLETED
+
+
+def test_format_timings():
+    assert format_timings([('build', 12.345), ('push', 3)]) == \
+        'build 12.35s, push 3.00s (total 15.35s)'
@@ -17,12 +17,15 @@
 #
 # SPDX-License-Identifier: EPL-2.0
 #
+import os
 import pytest
 import sys
+import threading
 from mock import MagicMock
 from subprocess import CalledProcessError
 
-from mlt.utils.process_helpers import prevent_deadlock, run, run_popen
+from mlt.utils.process_helpers import (prevent_deadlock, run, run_popen,
+                                       terminate)
 from test_utils.io import catch_stdout
 
 
@@ -125,3 +128,47 @@ def test_prevent_deadlock(pipe_output):
     if sys.version_info[0] < 3:
         pipe_output.length -= 1
     assert proc_mock.stdout.readline.call_count == pipe_output.length
+
+
+def test_prevent_deadlock_exit_event():
+    """Assert the yielded event is only set once the process exited"""
+    process_exited = threading.Event()
+    proc_mock = MagicMock()
+    # the pipe reaches its end once the process exits
+    proc_mock.stdout.readline.side_effect = \
+        lambda: process_exited.wait(5) and b''
+
+    with prevent_deadlock(proc_mock) as exited:
+        assert not exited.wait(0.1)
+        process_exited.set()
+        assert exited.wait(5)
+    proc_mock.wait.assert_called_once_with()
+
+
+def test_prevent_deadlock_output():
+    """Assert the lines read are collected when asked to"""
+    proc_mock = MagicMock()
+    proc_mock.stdout.readline.side_effect = [b'Step 1/2\n', b'done\n', b'']
+    output = []
+    with prevent_deadlock(proc_mock, output):
+        pass
+    assert output == [b'Step 1/2\n', b'done\n']
+
+
+def test_terminate_process_group():
+    """Assert a process started in its own group is stopped with the
+       processes it started
+    """
+    proc = run_popen('sleep 30; sleep 30', shell=True, preexec_fn=os.setsid)
+    terminate(proc)
+    assert proc.wait() < 0
+
+    # nothing happens to processes that are done
+    terminate(proc)
+    terminate(None)
+
+
+def test_terminate():
+    proc = run_popen(['sleep', '30'])
+    terminate(proc)
+    assert proc.wait() < 0
@@ -18,9 +18,11 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
+import threading
+
 from mock import patch, MagicMock
 
-from mlt.utils.progress_bar import duration_progress
+from mlt.utils.progress_bar import duration_progress, estimate_duration
 
 
 @patch('mlt.utils.progress_bar.progressbar')
@@ -71,3 +73,28 @@ def test_duration_progress_no_duration_done(progressbar):
     progressbar_obj = progressbar.ProgressBar.return_value.return_value
     progressbar_obj.next.assert_not_called()
     progressbar_obj.update.assert_not_called()
+
+
+@patch('mlt.utils.progress_bar.progressbar')
+def test_duration_progress_waits_between_updates(progressbar):
+    """Once past the duration the bar is redrawn on every wakeup of `wait`
+       instead of in a busy loop, and `wait` returns as soon as we're done
+    """
+    done = threading.Event()
+    threading.Timer(0.3, done.set).start()
+    duration_progress('activity', 0.01, done.is_set, done.wait)
+
+    assert done.is_set()
+    progressbar_obj = progressbar.ProgressBar.return_value
+    assert 1 <= progressbar_obj.update.call_count <= 5
+
+
+def test_estimate_duration():
+    assert estimate_duration([]) is None
+    assert estimate_duration([None]) is None
+    assert estimate_duration([30]) == 30
+    # a single cold build doesn't skew the estimate
+    assert estimate_duration([30, 600, 32, 31]) == 31.5
+    assert estimate_duration([30, None, 600, 32]) == 32
+    # only the latest durations count
+    assert estimate_duration([10] * 10 + [600] * 20) == 10
@@ -0,0 +1,166 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import base64
+import json
+
+import pytest
+from mock import MagicMock
+
+from mlt.utils import registry_clients
+from mlt.utils.registry_clients import (
+    DockerRegistryClient, HttpRegistryClient, RegistryError,
+    load_credentials, parse_image)
+from test_utils.fake_registry import FakeRegistry, MANIFEST_LIST
+
+
+@pytest.fixture
+def registry():
+    server = FakeRegistry().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def client(tmpdir):
+    # an empty docker config, whatever the machine running the tests has
+    return HttpRegistryClient(config_dir=str(tmpdir))
+
+
+@pytest.fixture
+def run_popen(patch):
+    run_popen = patch('process_helpers.run_popen')
+    run_popen.return_value.returncode = 0
+    return run_popen
+
+
+@pytest.mark.parametrize('image,parsed', [
+    ('app', ('registry-1.docker.io', 'library/app', 'latest')),
+    ('user/app:1', ('registry-1.docker.io', 'user/app', '1')),
+    ('gcr.io/project/app:sha-1', ('gcr.io', 'project/app', 'sha-1')),
+    ('localhost:5000/app', ('localhost:5000', 'app', 'latest')),
+    ('localhost/app:1', ('localhost', 'app', '1')),
+    ('gcr.io/app@sha256:d1', ('gcr.io', 'app', 'sha256:d1'))])
+def test_parse_image(image, parsed):
+    assert parse_image(image) == parsed
+
+
+def test_load_credentials(tmpdir, run_popen):
+    assert load_credentials('gcr.io', str(tmpdir)) is None
+    tmpdir.join('config.json').write(json.dumps({
+        'auths': {
+            'https://index.docker.io/v1/': {
+                'auth': base64.b64encode(b'user:pass').decode('ascii')}},
+        'credHelpers': {'gcr.io': 'gcloud'}}))
+    assert load_credentials('registry-1.docker.io', str(tmpdir)) == \
+        ('user', 'pass')
+    assert load_credentials('quay.io', str(tmpdir)) is None
+
+    run_popen.return_value.communicate.return_value = (json.dumps({
+        'Username': '_token', 'Secret': 's3cret'}).encode('utf-8'), b'')
+    assert load_credentials('gcr.io', str(tmpdir)) == ('_token', 's3cret')
+    assert run_popen.call_args[0][0] == ['docker-credential-gcloud', 'get']
+    run_popen.return_value.communicate.assert_called_once_with(b'gcr.io')
+
+
+def test_create_client():
+    assert registry_clients._create_client('docker').name == 'docker'
+    assert registry_clients._create_client('http').fallback is None
+    assert registry_clients._create_client('auto').fallback.name == 'docker'
+    with pytest.raises(ValueError):
+        registry_clients._create_client('crane')
+
+
+@pytest.mark.parametrize('head_digest', [True, False])
+def test_http_client_digests(registry, client, head_digest):
+    registry.head_digest = head_digest
+    image = '{}/project/app:1234'.format(registry.host)
+    assert client.manifest_digest(image) is None
+    assert client.config_digest(image) is None
+
+    digest = registry.push('project/app', '1234', 'sha256:1d')
+    assert client.manifest_digest(image) == digest
+    assert client.config_digest(image) == 'sha256:1d'
+    assert client.manifest_digest('{}/project/app@{}'.format(
+        registry.host, digest)) == digest
+    assert registry.requests[2][:2] == (
+        'HEAD', '/v2/project/app/manifests/1234')
+
+
+def test_http_client_manifest_list(registry, client):
+    arm = registry.push('app', 'arm64', 'sha256:arm')
+    amd = registry.push('app', 'amd64', 'sha256:amd')
+    registry.add('app', '1234', {
+        'schemaVersion': 2, 'mediaType': MANIFEST_LIST, 'manifests': [
+            {'digest': arm, 'platform': {'architecture': 'arm64'}},
+            {'digest': amd, 'platform': {'architecture': 'amd64'}}]},
+        media_type=MANIFEST_LIST)
+    assert client.config_digest(
+        '{}/app:1234'.format(registry.host)) == 'sha256:amd'
+
+
+def test_http_client_bearer_token(registry, client):
+    registry.token = 'secret'
+    digest = registry.push('app', '1234', 'sha256:1d')
+    for _ in range(3):
+        assert client.manifest_digest(
+            '{}/app:1234'.format(registry.host)) == digest
+    paths = [path for _, path, _ in registry.requests]
+    assert [p for p in paths if p.startswith('/token')] == [
+        '/token?scope=repository%3Aapp%3Apull&service=fake']
+    assert registry.requests[-1][2] == 'Bearer secret'
+    assert len(paths) == 5
+
+
+def test_http_client_falls_back(registry, tmpdir):
+    registry.token = 'secret'
+    registry.push('app', '1234', 'sha256:1d')
+    fallback = MagicMock()
+    fallback.config_digest.return_value = 'sha256:1d'
+    client = HttpRegistryClient(fallback=fallback, config_dir=str(tmpdir))
+    # a token endpoint refusing to hand out tokens
+    client._authorize = MagicMock(side_effect=RegistryError('denied', 401))
+    image = '{}/app:1234'.format(registry.host)
+    assert client.config_digest(image) == 'sha256:1d'
+    fallback.config_digest.assert_called_once_with(image)
+
+    with pytest.raises(RegistryError):
+        HttpRegistryClient(config_dir=str(tmpdir)).manifest_digest(
+            '127.0.0.1:1/app:1234')
+
+
+def test_docker_client(run_popen):
+    run_popen.return_value.communicate.return_value = (json.dumps({
+        'Descriptor': {'digest': 'sha256:d1'},
+        'SchemaV2Manifest': {'config': {'digest': 'sha256:1d'}}}).encode(
+            'utf-8'), b'')
+    client = DockerRegistryClient()
+    assert client.manifest_digest('gcr.io/app:1234') == 'sha256:d1'
+    assert client.config_digest('gcr.io/app:1234') == 'sha256:1d'
+    run_popen.assert_called_with(
+        ['docker', 'manifest', 'inspect', '--verbose', 'gcr.io/app:1234'])
+
+    run_popen.return_value.returncode = 1
+    run_popen.return_value.communicate.return_value = (
+        b'', b'no such manifest: gcr.io/app:1234')
+    assert client.manifest_digest('gcr.io/app:1234') is None
+    run_popen.return_value.communicate.return_value = (b'', b'unauthorized')
+    with pytest.raises(RegistryError):
+        client.config_digest('gcr.io/app:1234')
@@ -0,0 +1,175 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import json
+import os
+
+import pytest
+
+from mlt.utils import state
+from mlt.utils.state import StateStore, cache_key, resolve_kind
+
+
+@pytest.fixture
+def project_dir(tmpdir):
+    return tmpdir.mkdir('project')
+
+
+@pytest.fixture
+def store(project_dir):
+    store = StateStore(str(project_dir))
+    yield store
+    store.close()
+
+
+def test_state_db_location(store, project_dir):
+    assert project_dir.join('.mlt', 'state.db').check(file=True)
+
+
+def test_cache_only_store(project_dir):
+    """a store that isn't a project's is kept right in its directory and
+       doesn't import what's there
+    """
+    project_dir.join('.push.json').write(json.dumps(
+        {'last_remote_container': 'gcr.io/app:1'}))
+    project_dir.mkdir('k8s').mkdir('app-1234').join('job.yaml').write(
+        'kind: TFJob\n')
+    store = StateStore(str(project_dir), project=False)
+    try:
+        store.set_cached('cluster', 'key', 1.0)
+        assert store.get_cached('cluster', 'key') == 1.0
+        assert store.get_action('push') == {}
+        assert store.get_jobs() == []
+    finally:
+        store.close()
+    assert project_dir.join('state.db').check(file=True)
+    assert not project_dir.join('.mlt').check()
+
+
+def test_record_and_get_action(store):
+    assert store.get_action('build') == {}
+    store.record_action('build', {'last_container': 'app:1'})
+    store.record_action('build', {'last_container': 'app:2'})
+
+    assert store.get_action('build') == {'last_container': 'app:2'}
+    assert store.get_action_history('build') == [
+        {'last_container': 'app:2'}, {'last_container': 'app:1'}]
+    assert store.get_action_history('build', limit=1) == [
+        {'last_container': 'app:2'}]
+
+
+def test_update_action(store):
+    store.update_action('push', {'app_run_id': 'first'})
+    assert store.get_action('push') == {'app_run_id': 'first'}
+
+    store.record_action('push', {'last_remote_container': 'app:1'})
+    store.update_action('push', {'app_run_id': 'second'})
+    assert store.get_action('push') == {
+        'last_remote_container': 'app:1', 'app_run_id': 'second'}
+    assert len(store.get_action_history('push')) == 2
+
+
+def test_resolve_kind():
+    assert resolve_kind(None) is None
+    assert resolve_kind(['tfjob', 'tfjob']) == 'tfjob'
+    assert resolve_kind(['job', 'service']) == 'custom'
+
+
+def test_add_and_get_job(store):
+    store.add_job('app-1', app_run_id='1', kinds=['tfjob'], image='app:1')
+    store.add_job('app-1', app_run_id='ignored')
+    store.update_job('app-1', image='app:2')
+
+    job = store.get_job('app-1')
+    assert job['app_run_id'] == '1'
+    assert job['kind'] == 'tfjob'
+    assert job['kinds'] == ['tfjob']
+    assert job['image'] == 'app:2'
+    assert store.get_job('app-2') is None
+
+
+def test_get_jobs_queries(store):
+    store.add_job('app-3', kinds=['job'], created=3)
+    store.add_job('app-1', kinds=['tfjob'], created=1)
+    store.add_job('other-2', kinds=['job', 'service'], created=2)
+
+    def names(jobs):
+        return [job['name'] for job in jobs]
+
+    assert names(store.get_jobs()) == ['app-1', 'other-2', 'app-3']
+    assert names(store.get_jobs(latest=2)) == ['other-2', 'app-3']
+    assert names(store.get_jobs(prefix='app-')) == ['app-1', 'app-3']
+    assert names(store.get_jobs(kind='custom')) == ['other-2']
+
+    store.remove_jobs(['app-1', 'other-2'])
+    assert names(store.get_jobs()) == ['app-3']
+
+
+def test_cache_key():
+    assert cache_key('a', {'x': 1, 'y': 2}) == cache_key('a', {'y': 2, 'x': 1})
+    assert cache_key('a', {'x': 1}) != cache_key('a', {'x': 2})
+    assert cache_key('a', True) != cache_key('a', False)
+
+
+def test_cache(store, project_dir, monkeypatch):
+    monkeypatch.setattr(state, 'CACHE_SIZE', 2)
+    assert store.get_cached('manifest', 'k1') is None
+    store.set_cached('manifest', 'k1', {'out': 'a'})
+    store.set_cached('validation', 'k1', True)
+    assert store.get_cached('manifest', 'k1') == {'out': 'a'}
+    assert store.get_cached('validation', 'k1') is True
+
+    store.set_cached('manifest', 'k2', {'out': 'b'})
+    store.get_cached('manifest', 'k1')
+    store.set_cached('manifest', 'k3', {'out': 'c'})
+    # k2 was the least recently used
+    assert store.get_cached('manifest', 'k2') is None
+    assert store.get_cached('manifest', 'k1') == {'out': 'a'}
+
+    # cached values outlive the process
+    store.close()
+    assert StateStore(str(project_dir)).get_cached(
+        'manifest', 'k3') == {'out': 'c'}
+
+
+def test_migrate_legacy_state(project_dir):
+    project_dir.join('.push.json').write(json.dumps(
+        {'last_remote_container': 'gcr.io/app:1', 'app_run_id': '1234'}))
+    project_dir.join('.build.json').write('not json')
+    job_dir = project_dir.mkdir('k8s').mkdir('app-1234')
+    job_dir.join('job.yaml').write(
+        'kind: TFJob\n---\nkind: TFJob\n')
+    os.utime(str(job_dir), (100, 100))
+
+    store = StateStore(str(project_dir))
+    try:
+        assert store.get_action('push')['app_run_id'] == '1234'
+        assert store.get_action('build') == {}
+        job = store.get_job('app-1234')
+        assert job['kind'] == 'tfjob'
+        assert job['created'] == 100
+
+        # migration only happens once, removed jobs stay removed
+        store.remove_jobs(['app-1234'])
+        store.close()
+        store = StateStore(str(project_dir))
+        assert store.get_jobs() == []
+    finally:
+        store.close()
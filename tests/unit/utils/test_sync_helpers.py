@@ -18,76 +18,29 @@
 # SPDX-License-Identifier: EPL-2.0
 #
 
-
-# import json
-# import os
-#
-#
-# def get_sync_spec():
-#     """
-#     Returns dict value for 'sync_spec' in case '.sync.json' exists
-#     otherwise return None
-#     """
-#     sync_file = '.sync.json'
-#     if os.path.isfile(sync_file):
-#         with open(sync_file, 'r') as f:
-#             sync_data = json.load(f)
-#             if 'sync_spec' in sync_data.keys():
-#                 return sync_data['sync_spec']
-#
-#     return None
-
-
-import json
-import pytest
-
 from mlt.utils.sync_helpers import get_sync_spec
 
 
-@pytest.fixture
-def isfile_mock(patch):
-    return patch('os.path.isfile')
-
-
-@pytest.fixture
-def open_mock(patch):
-    return patch('open')
-
-
-@pytest.fixture
-def json_mock(patch):
-    return patch('json')
-
-
-@pytest.fixture
-def get_sync_spec_mock(patch):
-    return patch('get_sync_spec')
-
-
-def test_get_sync_spec_no_json(isfile_mock, open_mock, json_mock,
-                               get_sync_spec_mock):
+def test_get_sync_spec_no_sync():
     """
-    Tests if no .sync.json file is present
+    Tests if no sync spec was ever created
     """
-    isfile_mock.return_value = False
     output = get_sync_spec()
     assert output is None
 
 
-def test_get_sync_spec_empty_json(isfile_mock, open_mock, json_mock,
-                                  get_sync_spec_mock):
+def test_get_sync_spec_deleted(state_store):
     """
-    Tests if .sync.json file is empty
+    Tests if the sync spec was deleted
     """
-    isfile_mock.return_value = True
-    json.load.return_value = {}
+    state_store.record_action('sync', {'sync_spec': 'spec'})
+    state_store.update_action('sync', {'sync_spec': None})
     output = get_sync_spec()
     assert output is None
 
 
-def test_get_sync_spec_valid_spec(isfile_mock, open_mock, json_mock,
-                                  get_sync_spec_mock):
-    """tests a valid sync_spec contents that have `sync_spec` in json"""
-    json_mock.load.return_value = {'sync_spec': 'spec'}
+def test_get_sync_spec_valid_spec(state_store):
+    """tests a valid sync_spec recorded in the project state"""
+    state_store.record_action('sync', {'sync_spec': 'spec'})
     output = get_sync_spec()
     assert output == 'spec'
@@ -21,6 +21,7 @@
 import pytest
 import os
 from jsonschema import ValidationError
+from mock import MagicMock
 
 import mlt.utils.schema as schema
 
@@ -47,3 +48,49 @@ def test_yaml_with_multiple_doc():
     output = schema.validate()
     assert output is None
     os.chdir(cwd)
+
+
+VALID_DOC = """
+apiVersion: v1
+kind: Service
+metadata:
+  name: $app-$run
+spec:
+  ports:
+  - port: 80
+"""
+
+
+@pytest.fixture
+def templates(tmpdir, monkeypatch):
+    app = tmpdir.mkdir('app')
+    monkeypatch.chdir(app)
+    return app.mkdir('k8s-templates')
+
+
+def test_invalid_doc_location(templates):
+    templates.join('job.yaml').write(
+        VALID_DOC + '---\n' + VALID_DOC.replace('metadata', 'meta'))
+    with pytest.raises(ValidationError) as e:
+        schema.validate()
+    assert str(e.value).startswith(
+        "k8s-templates/job.yaml (document 1): 'metadata' is a required "
+        "property")
+
+
+def test_unchanged_templates_not_revalidated(templates, monkeypatch,
+                                             state_store):
+    templates.join('service.yaml').write(VALID_DOC)
+    schema.validate()
+
+    # a new process only has the state store to go by
+    monkeypatch.setattr(schema, '_validated', set())
+    validator = MagicMock()
+    validator.return_value.iter_errors.return_value = []
+    monkeypatch.setattr(schema, '_get_validator', validator)
+    schema.validate()
+    validator.assert_not_called()
+
+    templates.join('service.yaml').write(VALID_DOC.replace('80', '8080'))
+    schema.validate()
+    validator.assert_called_once_with()
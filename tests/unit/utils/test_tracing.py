@@ -0,0 +1,110 @@
+#
+# -*- coding: utf-8 -*-
+#
+# Copyright (c) 2018 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# SPDX-License-Identifier: EPL-2.0
+#
+
+import json
+import sys
+import threading
+
+import pytest
+
+from mlt.utils import process_helpers, tracing
+
+
+@pytest.fixture
+def tracer(tmpdir):
+    tracer = tracing.start(str(tmpdir.join('traces', 'trace.json')))
+    yield tracer
+    tracing.finish()
+
+
+def spans(path):
+    with open(path) as f:
+        events = json.load(f)['traceEvents']
+    return [event for event in events if event['ph'] == 'X']
+
+
+def test_disabled():
+    assert not tracing.enabled()
+    with tracing.span('nothing'):
+        pass
+    assert tracing.finish() is None
+
+
+def test_nested_spans(tracer):
+    @tracing.traced('render')
+    def render():
+        return 'rendered'
+
+    with tracing.span('deploy'):
+        with tracing.span('push', image='app:1'):
+            pass
+        assert render() == 'rendered'
+    thread = threading.Thread(target=render, name='preparer')
+    thread.start()
+    thread.join()
+
+    path = tracing.finish()
+    assert not tracing.enabled()
+    events = spans(path)
+    assert [event['name'] for event in events] == [
+        'push', 'render', 'deploy', 'render']
+    push, render, deploy, threaded = events
+    assert push['args'] == {'image': 'app:1'}
+    for child in (push, render):
+        assert deploy['ts'] <= child['ts']
+        assert child['ts'] + child['dur'] <= deploy['ts'] + deploy['dur']
+        assert child['tid'] == deploy['tid']
+    assert threaded['tid'] != deploy['tid']
+    with open(path) as f:
+        names = [event['args']['name'] for event in json.load(f)[
+            'traceEvents'] if event['ph'] == 'M']
+    assert names[1] == 'preparer'
+
+
+def test_subprocess_spans(tracer):
+    with tracing.span('build'):
+        proc = process_helpers.run_popen(
+            [sys.executable, '-c', 'import sys; sys.exit(3)'])
+        proc.wait()
+        proc.poll()
+        process_helpers.run([sys.executable, '-c', 'print(1)'])
+
+    events = spans(tracing.finish())
+    assert [(event['name'], event['cat']) for event in events] == [
+        (sys.executable + ' -c', 'subprocess'),
+        (sys.executable + ' -c', 'subprocess'),
+        ('build', 'mlt')]
+    assert events[0]['args']['returncode'] == 3
+    assert events[0]['args']['command'].endswith('sys.exit(3)')
+
+
+@pytest.mark.parametrize('command,name', [
+    (['docker', 'push', 'gcr.io/app:1'], 'docker push'),
+    ('CONTAINER_NAME=app:1 GPUS=0 make build', 'make build')])
+def test_command_name(command, name):
+    assert tracing.command_name(command) == name
+
+
+def test_trace_path():
+    assert tracing.trace_path('deploy', 'out.json') == 'out.json'
+    for value in (None, '1', 'true'):
+        path = tracing.trace_path('deploy', value)
+        assert path.startswith('.mlt/traces/deploy-')
+        assert path.endswith('.json')